@@ -20,7 +20,7 @@ from seed.views.columns import ColumnViewSet, ColumnMappingViewSet
 from seed.views.cycles import CycleView
 from seed.views.datasets import DatasetViewSet
 from seed.views.labels import LabelViewSet, UpdateInventoryLabelsAPIView
-from seed.views.main import DataFileViewSet, version, progress
+from seed.views.main import DataFileViewSet, version, progress, progress_wait
 from seed.views.organizations import OrganizationViewSet
 from seed.views.projects import ProjectViewSet
 from seed.views.properties import PropertyViewSet, TaxLotViewSet
@@ -55,6 +55,7 @@ urlpatterns = [
     # api schema
     url(r'^schema/$', get_api_schema, name='schema'),
     url(r'^progress/$', progress, name='progress'),
+    url(r'^progress/wait/$', progress_wait, name='progress_wait'),
     url(
         r'projects/(?P<pk>\w+)/add/$',
         ProjectViewSet.as_view({'put': 'add'}),
@@ -236,6 +236,17 @@ NOSE_ARGS = ['--exclude-dir=libs/dal',
 MATCH_MIN_THRESHOLD = 0.3
 MATCH_MED_THRESHOLD = 0.4
 
+# Import Settings
+# Rows per raw save task and max rows per INSERT when saving a raw chunk
+RAW_SAVE_CHUNK_SIZE = 100
+RAW_SAVE_BATCH_SIZE = 1000
+
+# Search Settings
+# Use the pg_trgm indexes of the inventory when the extension is installed, and the number of
+# filters on an extra_data key after which create_search_indexes indexes the key
+SEARCH_INDEX_ENABLED = True
+SEARCH_INDEX_MIN_FILTERS = 20
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.MinimumLengthValidator',
@@ -283,3 +294,19 @@ REST_FRAMEWORK = {
 SWAGGER_SETTINGS = {
     "exclude_namespaces": ["app"],  # List URL namespaces to ignore
 }
+
+# Seconds the aggregated property reports of a cycle are cached, 0 to always aggregate them
+REPORT_SUMMARY_TIMEOUT = 3600
+
+# Green Button readings saved per INSERT statement, and files imported by each task when many
+# Green Button files are imported at once
+TIMESERIES_BATCH_SIZE = 1000
+GREEN_BUTTON_FILES_PER_TASK = 5
+
+# Seconds the progress of a background task is kept after its last update, and the maximum
+# seconds a long polling progress request waits on redis for the progress to change
+PROGRESS_TIMEOUT = 24 * 60 * 60
+PROGRESS_WAIT_TIMEOUT = 25
+
+# Seconds the lock of a background task outlives its worker, the lock is renewed while the task runs
+LOCK_TIMEOUT = 60
@@ -4,10 +4,12 @@
 :copyright (c) 2014 - 2016, The Regents of the University of California, through Lawrence Berkeley National Laboratory (subject to receipt of any required approvals from the U.S. Department of Energy) and contributors. All rights reserved.  # NOQA
 :author
 """
+import heapq
 from datetime import (
     date,
     datetime,
 )
+from itertools import islice
 from logging import getLogger
 
 import pytz
@@ -15,7 +17,12 @@ from django.db import models
 from django.utils.timezone import get_current_timezone, make_aware, make_naive
 
 from seed.lib.superperms.orgs.models import Organization
-from seed.utils.cache import set_cache_raw, get_cache_raw
+from seed.utils.cache import (
+    delete_cache_many,
+    get_cache_raw,
+    get_cache_raw_many,
+    set_cache_raw,
+)
 from seed.utils.constants import ASSESSOR_FIELDS_BY_COLUMN
 
 logger = getLogger(__name__)
@@ -49,6 +56,9 @@ SEVERITY = [
     (SEVERITY_WARNING, "warning")
 ]
 
+# save the results for 24 hours
+CLEANSING_RESULTS_TIMEOUT = 86400
+
 
 class Rules(models.Model):
     org = models.ForeignKey(Organization)
@@ -271,11 +281,108 @@ class Rules(models.Model):
         Rules.objects.filter(org=organization).delete()
 
 
+class CompiledRule(object):
+    """
+    A cleansing rule with everything that does not depend on the record (formatted field name,
+    severity name and the typed min/max bounds) computed once, so that the rule can be checked
+    against every record of a chunk without going back to the database.
+    """
+
+    def __init__(self, rule):
+        self.field = rule.field
+        self.category = rule.category
+        self.type = rule.type
+        self.severity = dict(SEVERITY)[rule.severity]
+        # Rules may refer to fields that are not assessor fields, fall back on the field name
+        self.formatted_field = rule.field
+        if rule.field in ASSESSOR_FIELDS_BY_COLUMN:
+            self.formatted_field = ASSESSOR_FIELDS_BY_COLUMN[rule.field]['title']
+
+        rule_min = rule.min
+        rule_max = rule.max
+        if rule.type == TYPE_YEAR:
+            rule_min = None if rule_min is None else int(rule_min)
+            rule_max = None if rule_max is None else int(rule_max)
+        if rule.type == TYPE_DATE:
+            rule_min = None if rule_min is None else str(int(rule_min))
+            rule_max = None if rule_max is None else str(int(rule_max))
+
+        # (min, max, formatted min, formatted max) to use for plain, date and datetime values
+        self.bounds = (rule_min, rule_max, str(rule_min), str(rule_max))
+        self.date_bounds = self.bounds
+        self.datetime_bounds = self.bounds
+        if rule.type == TYPE_DATE:
+            date_min, date_max = self._parse_date(rule_min), self._parse_date(rule_max)
+            self.date_bounds = (date_min, date_max, str(date_min), str(date_max))
+
+            datetime_min = self._parse_datetime(rule_min)
+            datetime_max = self._parse_datetime(rule_max)
+            self.datetime_bounds = (
+                datetime_min, datetime_max,
+                str(None if datetime_min is None else make_naive(datetime_min, pytz.UTC)),
+                str(None if datetime_max is None else make_naive(datetime_max, pytz.UTC)),
+            )
+
+    @staticmethod
+    def _parse_date(value):
+        if value is None:
+            return None
+        return datetime.strptime(value, '%Y%m%d').date()
+
+    @staticmethod
+    def _parse_datetime(value):
+        if value is None:
+            return None
+        return make_aware(datetime.strptime(value, '%Y%m%d'), pytz.UTC)
+
+    def result(self, value, message, detailed_message):
+        return {
+            'field': self.field,
+            'formatted_field': self.formatted_field,
+            'value': value,
+            'message': self.formatted_field + message,
+            'detailed_message': self.formatted_field + detailed_message,
+            'severity': self.severity
+        }
+
+    def check_range(self, value):
+        """
+        Return the out of range results of the value, if any.
+
+        :param value: value of the field of the record, not None
+        :return: list of cleansing results
+        """
+        if isinstance(value, datetime):
+            value = value.astimezone(get_current_timezone()).replace(tzinfo=pytz.UTC)
+            rule_min, rule_max, formatted_rule_min, formatted_rule_max = self.datetime_bounds
+            formatted_value = str(make_naive(value, pytz.UTC))
+        elif isinstance(value, date):
+            rule_min, rule_max, formatted_rule_min, formatted_rule_max = self.date_bounds
+            formatted_value = str(value)
+        else:
+            rule_min, rule_max, formatted_rule_min, formatted_rule_max = self.bounds
+            formatted_value = str(value)
+
+        results = []
+        if rule_min is not None and value < rule_min:
+            results.append(self.result(
+                value, ' out of range', ' [' + formatted_value + '] < ' + formatted_rule_min
+            ))
+
+        if rule_max is not None and value > rule_max:
+            results.append(self.result(
+                value, ' out of range', ' [' + formatted_value + '] > ' + formatted_rule_max
+            ))
+
+        return results
+
+
 class Cleansing(object):
 
     def __init__(self, organization, *args, **kwargs):
         """
-        Initialize the Cleansing class.
+        Initialize the Cleansing class. The enabled rules of the organization are loaded and
+        compiled once here and reused for every record passed to cleanse.
 
         :param args:
         :param kwargs:
@@ -288,33 +395,99 @@ class Cleansing(object):
         self.org = organization
         super(Cleansing, self).__init__(*args, **kwargs)
 
+        self.rules = self.load_rules(organization)
+
+        self.reset_results()
+
+    @staticmethod
+    def load_rules(organization):
+        """
+        Load the enabled rules of the organization, creating the default rules if none exist.
+
+        :param organization: Organization
+        :return: dict of category to the list of CompiledRules, ordered by field and severity
+        """
+        rules = list(Rules.objects.filter(org=organization).order_by('field', 'severity'))
+
         # Create rules if none exist
-        if not Rules.objects.filter(org=organization).exists():
+        if not rules:
             Rules.initialize_rules(organization)
+            rules = list(Rules.objects.filter(org=organization).order_by('field', 'severity'))
 
-        self.reset_results()
+        compiled_rules = {category: [] for category, _ in CATEGORIES}
+        for rule in rules:
+            if rule.enabled:
+                compiled_rules[rule.category].append(CompiledRule(rule))
+
+        return compiled_rules
 
     @staticmethod
-    def initialize_cache(file_pk):
+    def initialize_cache(file_pk, chunk_ids=None):
         """
         Initialize the cache for storing the results. This is called before the
         celery tasks are chunked up.
 
+        The results of each chunk are stored under their own key so that the
+        chunks never read or rewrite each other's results. The list of chunks is
+        stored under the cache_key of the file and the results of any previous
+        cleansing of the file are removed.
+
         :param file_pk: Import file primary key
+        :param chunk_ids: list of the ids of the chunks (the first record id of each chunk)
         :return:
         """
-        set_cache_raw(Cleansing.cache_key(file_pk), [])
+        previous_chunk_ids = get_cache_raw(Cleansing.cache_key(file_pk)) or []
+        delete_cache_many(
+            [Cleansing.chunk_cache_key(file_pk, chunk_id) for chunk_id in previous_chunk_ids]
+        )
+
+        set_cache_raw(Cleansing.cache_key(file_pk), list(chunk_ids or []),
+                      CLEANSING_RESULTS_TIMEOUT)
 
     @staticmethod
     def cache_key(file_pk):
         """
-        Static method to return the location of the cleansing results from redis.
+        Static method to return the location of the list of the cleansing result chunks
+        from redis.
 
         :param file_pk: Import file primary key
         :return:
         """
         return "cleansing_results__%s" % file_pk
 
+    @staticmethod
+    def chunk_cache_key(file_pk, chunk_id):
+        """
+        Static method to return the location of the cleansing results of one chunk from redis.
+
+        :param file_pk: Import file primary key
+        :param chunk_id: id of the chunk
+        :return:
+        """
+        return "cleansing_results__%s__%s" % (file_pk, chunk_id)
+
+    @staticmethod
+    def get_results(file_pk, offset=0, limit=None):
+        """
+        Return the cleansing results of the file ordered by record id. The sorted results
+        of the chunks are merged lazily, so only the requested page is built.
+
+        :param file_pk: Import file primary key
+        :param offset: int, number of results to skip
+        :param limit: int, maximum number of results to return, None for all the results
+        :return: iterator of the results (dicts)
+        """
+        chunk_ids = get_cache_raw(Cleansing.cache_key(file_pk)) or []
+        keys = [Cleansing.chunk_cache_key(file_pk, chunk_id) for chunk_id in chunk_ids]
+        chunks = get_cache_raw_many(keys)
+
+        # Decorate the results with their id since heapq.merge does not take a key
+        merged = heapq.merge(
+            *[((result['id'], result) for result in chunks[key]) for key in keys if key in chunks]
+        )
+        stop = None if limit is None else offset + limit
+        return (result for _, result in islice(merged, offset, stop))
+
     def cleanse(self, record_type, data):
         """
         Send in data as a queryset from the BuildingSnapshot ids.
@@ -370,24 +543,14 @@ class Cleansing(object):
         # TODO: NL: Should we check the extra_data field for the data?
         """
 
-        for rule in Rules.objects.filter(
-                org=self.org,
-                category=CATEGORY_MISSING_MATCHING_FIELD,
-                enabled=True
-        ).order_by('field', 'severity'):
+        for rule in self.rules[CATEGORY_MISSING_MATCHING_FIELD]:
             if hasattr(datum, rule.field):
                 value = getattr(datum, rule.field)
-                formatted_field = ASSESSOR_FIELDS_BY_COLUMN[rule.field]['title']
                 if value is None:
                     # Field exists but the value is None. Register a cleansing error
-                    self.results[datum.id]['cleansing_results'].append({
-                        'field': rule.field,
-                        'formatted_field': formatted_field,
-                        'value': value,
-                        'message': formatted_field + ' field not found',
-                        'detailed_message': formatted_field + ' field not found',
-                        'severity': dict(SEVERITY)[rule.severity]
-                    })
+                    self.results[datum.id]['cleansing_results'].append(
+                        rule.result(value, ' field not found', ' field not found')
+                    )
 
     def missing_values(self, datum):
         """
@@ -404,26 +567,16 @@ class Cleansing(object):
         # TODO: Check the extra_data field for the data?
         """
 
-        for rule in Rules.objects.filter(
-                org=self.org,
-                category=CATEGORY_MISSING_VALUES,
-                enabled=True
-        ).order_by('field', 'severity'):
+        for rule in self.rules[CATEGORY_MISSING_VALUES]:
             if hasattr(datum, rule.field):
                 value = getattr(datum, rule.field)
-                formatted_field = ASSESSOR_FIELDS_BY_COLUMN[rule.field]['title']
 
                 if value == '':
                     # TODO: check if the value is zero?
                     # Field exists but the value is empty. Register a cleansing error
-                    self.results[datum.id]['cleansing_results'].append({
-                        'field': rule.field,
-                        'formatted_field': formatted_field,
-                        'value': value,
-                        'message': formatted_field + ' is missing',
-                        'detailed_message': formatted_field + ' is missing',
-                        'severity': dict(SEVERITY)[rule.severity]
-                    })
+                    self.results[datum.id]['cleansing_results'].append(
+                        rule.result(value, ' is missing', ' is missing')
+                    )
 
     def in_range_checking(self, datum):
         """
@@ -432,64 +585,16 @@ class Cleansing(object):
         :param datum: Database record containing the BS version of the fields populated
         :return: None
         """
-        for rule in Rules.objects.filter(org=self.org, category=CATEGORY_IN_RANGE_CHECKING,
-                                         enabled=True) \
-                .order_by('field', 'severity'):
-
+        for rule in self.rules[CATEGORY_IN_RANGE_CHECKING]:
             # check if the field exists
             if hasattr(datum, rule.field):
                 value = getattr(datum, rule.field)
-                formatted_field = ASSESSOR_FIELDS_BY_COLUMN[rule.field]['title']
 
                 # Don't check the out of range errors if the data are empty
                 if value is None:
                     continue
 
-                rule_min = rule.min
-                rule_max = rule.max
-                if rule.type == TYPE_YEAR:
-                    rule_min = int(rule_min)
-                    rule_max = int(rule_max)
-                if rule.type == TYPE_DATE:
-                    rule_min = str(int(rule_min))
-                    rule_max = str(int(rule_max))
-
-                if isinstance(value, datetime):
-                    value = value.astimezone(get_current_timezone()).replace(tzinfo=pytz.UTC)
-                    rule_min = make_aware(datetime.strptime(rule_min, '%Y%m%d'), pytz.UTC)
-                    rule_max = make_aware(datetime.strptime(rule_max, '%Y%m%d'), pytz.UTC)
-
-                    formatted_value = str(make_naive(value, pytz.UTC))
-                    formatted_rule_min = str(make_naive(rule_min, pytz.UTC))
-                    formatted_rule_max = str(make_naive(rule_max, pytz.UTC))
-                elif isinstance(value, date):
-                    rule_min = datetime.strptime(rule_min, '%Y%m%d').date()
-                    rule_max = datetime.strptime(rule_max, '%Y%m%d').date()
-
-                if not isinstance(value, datetime):
-                    formatted_value = str(value)
-                    formatted_rule_min = str(rule_min)
-                    formatted_rule_max = str(rule_max)
-
-                if rule_min is not None and value < rule_min:
-                    self.results[datum.id]['cleansing_results'].append({
-                        'field': rule.field,
-                        'formatted_field': formatted_field,
-                        'value': value,
-                        'message': formatted_field + ' out of range',
-                        'detailed_message': formatted_field + ' [' + formatted_value + '] < ' + formatted_rule_min,
-                        'severity': dict(SEVERITY)[rule.severity]
-                    })
-
-                if rule_max is not None and value > rule_max:
-                    self.results[datum.id]['cleansing_results'].append({
-                        'field': rule.field,
-                        'formatted_field': formatted_field,
-                        'value': value,
-                        'message': formatted_field + ' out of range',
-                        'detailed_message': formatted_field + ' [' + formatted_value + '] > ' + formatted_rule_max,
-                        'severity': dict(SEVERITY)[rule.severity]
-                    })
+                self.results[datum.id]['cleansing_results'].extend(rule.check_range(value))
 
     def data_type_check(self, datum):
         """
@@ -502,49 +607,41 @@ class Cleansing(object):
         :return: None
         """
 
-        for rule in Rules.objects.filter(org=self.org, category=CATEGORY_DATA_TYPE_CHECK,
-                                         enabled=True) \
-                .order_by('field', 'severity'):
+        for rule in self.rules[CATEGORY_DATA_TYPE_CHECK]:
             # check if the field exists
             if hasattr(datum, rule.field):
                 value = getattr(datum, rule.field)
-                formatted_field = ASSESSOR_FIELDS_BY_COLUMN[rule.field]['title']
 
                 # Don't check the out of range errors if the data are empty
                 if value is None:
                     continue
 
                 if type(value).__name__ != rule.type:
-                    self.results[datum.id]['cleansing_results'].append({
-                        'field': rule.field,
-                        'formatted_field': formatted_field,
-                        'value': value,
-                        'message': formatted_field + ' value has incorrect data type',
-                        'detailed_message': formatted_field + ' value ' + str(
-                            value) + ' is not a recognized ' + rule.type + ' format',
-                        'severity': dict(SEVERITY)[rule.severity]
-                    })
-
-    def save_to_cache(self, file_pk):
+                    self.results[datum.id]['cleansing_results'].append(rule.result(
+                        value,
+                        ' value has incorrect data type',
+                        ' value ' + str(value) + ' is not a recognized ' + str(
+                            rule.type) + ' format'
+                    ))
+
+    def save_to_cache(self, file_pk, chunk_id):
         """
-        Save the results to the cache database. The data in the cache are
-        stored as a list of dictionaries. The data in this class are stored as
-        a dict of dict. This is important to remember because the data from the
-        cache cannot be simply loaded into the above structure.
+        Save the results of this chunk to the cache database. The data in the cache
+        are stored as a list of dictionaries sorted by id. The data in this class
+        are stored as a dict of dict. This is important to remember because the
+        data from the cache cannot be simply loaded into the above structure.
+
+        The results are written once under the key of the chunk, without reading
+        the results of the other chunks, so chunks saved in parallel cannot
+        overwrite each other.
 
         :param file_pk: Import file primary key
+        :param chunk_id: id of the chunk, as passed to initialize_cache
         :return: None
         """
 
         # change the format of the data in the cache. Make this a list of
         # objects instead of object of objects.
-        existing_results = get_cache_raw(Cleansing.cache_key(file_pk))
-
-        l = []
-        for key, value in self.results.iteritems():
-            l.append(value)
-
-        existing_results = existing_results + l
-
-        z = sorted(existing_results, key=lambda k: k['id'])
-        set_cache_raw(Cleansing.cache_key(file_pk), z, 86400)  # save the results for 24 hours
+        results = sorted(self.results.values(), key=lambda k: k['id'])
+        set_cache_raw(Cleansing.chunk_cache_key(file_pk, chunk_id), results,
+                      CLEANSING_RESULTS_TIMEOUT)
@@ -36,7 +36,7 @@ def cleanse_data_chunk(record_type, ids, file_pk, increment):
 
     c = Cleansing(super_org.get_parent())
     c.cleanse(record_type, qs)
-    c.save_to_cache(file_pk)
+    c.save_to_cache(file_pk, ids[0])
 
 
 @shared_task
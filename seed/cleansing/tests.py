@@ -6,13 +6,16 @@
 """
 import json
 import logging
+import time
 from os import path
 from unittest import skip
 
 from django.core.cache import cache
 from django.core.files import File
 from django.core.urlresolvers import reverse
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 
 from seed.cleansing.models import Cleansing
 from seed.data_importer import tasks
@@ -512,6 +515,54 @@ class CleansingDataSample(TestCase):
         self.assertEqual(len(c.results), 34)
 
 
+class CleansingQueryCountTests(TestCase):
+    """Check and benchmark the number of queries needed to cleanse a chunk of records."""
+
+    def setUp(self):
+        self.org = Organization.objects.create()
+        for i in range(100):
+            PropertyState.objects.create(
+                organization=self.org,
+                address_line_1='{} Main St'.format(i),
+                year_built=1600 if i % 10 == 0 else 2000,
+                site_eui=5000 if i % 5 == 0 else 50,
+            )
+
+    def test_cleanse_chunk_queries(self):
+        states = list(PropertyState.objects.filter(organization=self.org).order_by('id'))
+
+        # the default rules are created and compiled once
+        with CaptureQueriesContext(connection) as init_queries:
+            c = Cleansing(self.org)
+
+        # and no queries are needed to check the records of the chunk
+        start = time.time()
+        with self.assertNumQueries(0):
+            c.cleanse('property', states)
+        elapsed = time.time() - start
+
+        _log.info("Cleansing {} records: {} queries to load the rules, {:.4f} sec".format(
+            len(states), len(init_queries), elapsed))
+
+        # every 5th record has an out of range site EUI, every 10th also has an old year built
+        self.assertEqual(len(c.results), 20)
+        self.assertListEqual(
+            [r['detailed_message'] for r in c.results[states[0].id]['cleansing_results']],
+            ['Site EUI [5000.0] > 1000.0', 'Year Built [1600] < 1700']
+        )
+
+        # the results of the chunk are saved under their own key
+        Cleansing.initialize_cache(0, [states[0].id])
+        c.save_to_cache(0, states[0].id)
+        results = list(Cleansing.get_results(0))
+        self.assertEqual(len(results), 20)
+        self.assertEqual(results[0]['id'], states[0].id)
+
+        # the rules already exist for the next chunk and are loaded with one query
+        with self.assertNumQueries(1):
+            Cleansing(self.org)
+
+
 class CleansingViewTests(TestCase):
 
     def setUp(self):
@@ -524,11 +575,49 @@ class CleansingViewTests(TestCase):
         self.client.login(**user_details)
 
     def test_get_cleansing_results(self):
-        data = {'test': 'test'}
-        cache.set('cleansing_results__1', data)
+        data = [{'id': 1, 'test': 'test'}]
+        Cleansing.initialize_cache(1, [1])
+        cache.set(Cleansing.chunk_cache_key(1, 1), data)
         response = self.client.get(reverse('apiv2:import_files-cleansing-results.json', args=[1]))
         self.assertEqual(json.loads(response.content)['data'], data)
 
+    def test_get_cleansing_results_chunks(self):
+        # the results of the chunks are merged by id and can be paged through
+        Cleansing.initialize_cache(1, [1, 4, 7])
+        cache.set(Cleansing.chunk_cache_key(1, 1), [{'id': 2}, {'id': 3}])
+        cache.set(Cleansing.chunk_cache_key(1, 7), [{'id': 7}, {'id': 9}])
+        cache.set(Cleansing.chunk_cache_key(1, 4), [{'id': 5}])
+
+        url = reverse('apiv2:import_files-cleansing-results.json', args=[1])
+        response = self.client.get(url)
+        self.assertListEqual(
+            [r['id'] for r in json.loads(response.content)['data']], [2, 3, 5, 7, 9]
+        )
+
+        response = self.client.get(url, {'page': 2, 'per_page': 2})
+        self.assertListEqual([r['id'] for r in json.loads(response.content)['data']], [5, 7])
+
+        # cleansing the file again removes the previous results
+        Cleansing.initialize_cache(1, [1])
+        self.assertIsNone(cache.get(Cleansing.chunk_cache_key(1, 7)))
+        self.assertListEqual(list(Cleansing.get_results(1)), [])
+
+    def test_get_cleansing_results_invalid_page(self):
+        Cleansing.initialize_cache(1, [1])
+        cache.set(Cleansing.chunk_cache_key(1, 1), [{'id': 2}, {'id': 3}, {'id': 5}])
+        url = reverse('apiv2:import_files-cleansing-results.json', args=[1])
+
+        # the page and the number of results per page are at least 1
+        response = self.client.get(url, {'page': 0, 'per_page': 2})
+        self.assertListEqual([r['id'] for r in json.loads(response.content)['data']], [2, 3])
+        response = self.client.get(url, {'page': -3, 'per_page': -2})
+        self.assertListEqual([r['id'] for r in json.loads(response.content)['data']], [2])
+
+        for params in [{'page': 'abc'}, {'per_page': 'abc'}, {'page': 1, 'per_page': '1.5'}]:
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(json.loads(response.content)['status'], 'error')
+
     def test_get_progress(self):
         data = {'status': 'success', 'progress': 85}
         cache.set(':1:SEED:get_progress:PROG:1', data)
@@ -537,6 +626,7 @@ class CleansingViewTests(TestCase):
 
     def test_get_csv(self):
         data = [{
+            'id': 1,
             'address_line_1': '',
             'pm_property_id': '',
             'tax_lot_id': '',
@@ -547,6 +637,7 @@ class CleansingViewTests(TestCase):
                 'severity': '',
             }]
         }]
-        cache.set('cleansing_results__1', data)
+        Cleansing.initialize_cache(1, [1])
+        cache.set(Cleansing.chunk_cache_key(1, 1), data)
         response = self.client.get(reverse('apiv2:import_files-cleansing-results.csv', args=[1]))
         self.assertEqual(200, response.status_code)
@@ -8,7 +8,6 @@
 from __future__ import absolute_import
 
 import collections
-import copy
 import hashlib
 import operator
 import time
@@ -21,7 +20,8 @@ from itertools import chain
 from celery import chord
 from celery import shared_task
 from celery.utils.log import get_task_logger
-from django.db import IntegrityError
+from django.conf import settings
+from django.db import IntegrityError, transaction
 from django.db.models import Q
 from django.utils import timezone
 from unidecode import unidecode
@@ -37,6 +37,7 @@ from seed.data_importer.models import (
     STATUS_READY_TO_MERGE,
     # DuplicateDataError,
 )
+from seed.data_importer.utils import reserve_ids
 from seed.decorators import get_prog_key
 from seed.decorators import lock_and_track
 from seed.green_button import xml_importer
@@ -71,13 +72,31 @@ from seed.models import PropertyAuditLog
 from seed.models import TaxLotAuditLog
 from seed.models import TaxLotProperty
 from seed.models.auditlog import AUDIT_IMPORT
+from seed.utils.address import normalize_addresses
 from seed.utils.buildings import get_source_type
-from seed.utils.cache import set_cache, increment_cache, get_cache, delete_cache
+from seed.utils.cache import (
+    set_cache,
+    increment_cache,
+    get_cache,
+    delete_cache,
+    get_cache_raw,
+    set_cache_raw,
+    make_key,
+)
+from seed.utils.reports import clear_report_summaries
 
 _log = get_task_logger(__name__)
 
 STR_TO_CLASS = {'TaxLotState': TaxLotState, 'PropertyState': PropertyState}
 
+# Number of raw rows handed to each _save_raw_data_chunk task and the maximum number of rows
+# written per INSERT statement when the chunk is saved.
+RAW_SAVE_CHUNK_SIZE = getattr(settings, 'RAW_SAVE_CHUNK_SIZE', 100)
+RAW_SAVE_BATCH_SIZE = getattr(settings, 'RAW_SAVE_BATCH_SIZE', 1000)
+
+# Number of Green Button files imported serially by each task of save_raw_green_button_files
+GREEN_BUTTON_FILES_PER_TASK = getattr(settings, 'GREEN_BUTTON_FILES_PER_TASK', 5)
+
 
 def get_cache_increment_value(chunk):
     denom = len(chunk) or 1
@@ -114,6 +133,7 @@ def finish_mapping(import_file_id, mark_as_done):
         import_file.save()
 
     finish_import_record(import_file.import_record.pk)
+    delete_cache(_get_mapping_plan_key(import_file_id))
     prog_key = get_prog_key('map_data', import_file_id)
     result = {
         'status': 'success',
@@ -133,11 +153,8 @@ def _translate_unit_to_type(unit):
     return unit.lower()
 
 
-def _build_cleaner(org):
-    """Return a cleaner instance that knows about a mapping's unit types.
-
-    Basically, this just tells us how to try and cast types during cleaning
-    based on the Column definition in the database.
+def _build_cleaner_ontology(org):
+    """Return the ontology that tells the cleaner about a mapping's unit types.
 
     :param org: organization instance.
     :returns: dict of dicts. {'types': {'col_name': 'type'},}
@@ -155,31 +172,89 @@ def _build_cleaner(org):
     # Update with our predefined types for our database column types.
     units['types'].update(Column.retrieve_db_types()['types'])
 
-    return cleaners.Cleaner(units)
+    return units
 
 
-@shared_task
-def map_row_chunk(ids, file_pk, source_type, prog_key, increment, *args, **kwargs):
-    """Does the work of matching a mapping to a source type and saving
+def _build_cleaner(org):
+    """Return a cleaner instance that knows about a mapping's unit types.
 
-    :param ids: list of PropertyState IDs to map.
-    :param file_pk: int, the PK for an ImportFile obj.
-    :param source_type: int, represented by either ASSESSED_RAW or PORTFOLIO_RAW.
-    :param prog_key: string, key of the progress key
-    :param increment: double, value by which to increment progress key
-    :param cleaner: (optional), the cleaner class you want to send to mapper.map_row.
-                    (e.g. turn numbers into floats.).
-    :param raw_ids: (optional kwarg), the list of ids in chunk order.
+    Basically, this just tells us how to try and cast types during cleaning
+    based on the Column definition in the database.
 
+    :param org: organization instance.
+    :returns: Cleaner instance.
     """
+    return cleaners.Cleaner(_build_cleaner_ontology(org))
 
-    _log.debug('Mapping row chunks')
-    import_file = ImportFile.objects.get(pk=file_pk)
-    save_type = PORTFOLIO_BS
-    if source_type == ASSESSED_RAW:
-        save_type = ASSESSED_BS
 
-    org = Organization.objects.get(pk=import_file.import_record.super_organization.pk)
+def _save_mapped_states(model_class, states):
+    """Save the mapped states of a chunk with a single batched insert.
+
+    The primary keys are reserved up front because bulk_create does not return them and the
+    audit logs need to point to the new states. If the batched insert fails (e.g. a field is
+    too long) then the states are saved one at a time and the failing rows are skipped.
+
+    :param model_class: class, PropertyState or TaxLotState
+    :param states: list of unsaved state instances
+    :return: list of the states that were saved
+    """
+    if not states:
+        return []
+
+    # bulk_create does not call save(), so calculate the normalized addresses here, once per
+    # distinct address of the chunk
+    normalized_addresses = normalize_addresses(
+        state.address_line_1 for state in states if state.address_line_1 is not None
+    )
+    for state, pk in zip(states, reserve_ids(model_class, len(states))):
+        state.pk = pk
+        state.normalized_address = normalized_addresses.get(state.address_line_1)
+
+    try:
+        with transaction.atomic():
+            model_class.objects.bulk_create(states)
+        return states
+    except Exception as e:
+        _log.error("Unable to bulk save the mapped rows, saving one at a time {}:{}".format(
+            type(e), e.message))
+
+    saved_states = []
+    for state in states:
+        try:
+            # There was an error with a field being too long [> 255 chars].
+            with transaction.atomic():
+                state.save(force_insert=True)
+            saved_states.append(state)
+        except Exception as e:
+            # Could not save the record for some reason. Report out and keep moving
+            # TODO: Need to address this and report back to the user which records were not imported  #noqa
+            _log.error(
+                "Unable to save row the model with row {}:{}".format(type(e), e.message))
+
+    return saved_states
+
+
+def _get_mapping_plan_key(import_file_id):
+    """Return the cache key of the compiled mapping plan of an import file"""
+    return make_key('SEED:map_data:PLAN:{}'.format(import_file_id))
+
+
+def _build_mapping_plan(import_file):
+    """Compile everything that is needed to map the rows of an import file.
+
+    The plan is the same for every chunk of the file, so it is computed once in _map_data and
+    cached for the map_row_chunk tasks.
+
+    :param import_file: ImportFile instance
+    :returns: dict with the following keys:
+        table_mappings: dict, {table: {raw_column: (table, field)}}
+        delimited_fields: dict, fields that may need to be expanded into multiple rows
+        delimited_field_list: list, the raw column names of the delimited fields
+        expand_rows: dict, {table: bool} if the rows need to be expanded for the table
+        extra_data_fields: dict, {table: list of raw columns that map to extra_data}
+        cleaner_ontology: dict, the ontology used to build the cleaner
+    """
+    org = import_file.import_record.super_organization
 
     # get all the table_mappings that exist for the organization
     table_mappings = ColumnMapping.get_column_mappings_by_table_name(org)
@@ -211,9 +286,6 @@ def map_row_chunk(ids, file_pk, source_type, prog_key, increment, *args, **kwarg
         table_mappings['PropertyState'] = debug_inferred_prop_state_mapping
     # TODO: *END TOTAL TERRIBLE HACK**
 
-    map_cleaner = _build_cleaner(org)
-
-    # *** BREAK OUT INTO SEPARATE METHOD ***
     # figure out which import field is defined as the unique field that may have a delimiter of
     # individual values (e.g. tax lot ids). The definition of the delimited field is currently
     # hard coded
@@ -243,46 +315,100 @@ def map_row_chunk(ids, file_pk, source_type, prog_key, increment, *args, **kwarg
             table_mappings['PropertyState'][
                 delimited_fields['jurisdiction_tax_lot_id']['from_field']] = (
                 'PropertyState', 'lot_number')
-    # *** END BREAK OUT ***
 
-    # yes, there are three cascading for loops here. sorry :(
+    delimited_field_list = []
+    for _, v in delimited_fields.iteritems():
+        delimited_field_list.append(v['from_field'])
+
     md = MappingData()
+    expand_rows_by_table = {}
+    extra_data_fields = {}
     for table, mappings in table_mappings.iteritems():
         if not table:
             continue
 
+        # expand the row into multiple rows if needed with the delimited_field replaced with a
+        # single value. This minimizes the need to rewrite the downstream code.
+        expand_rows_by_table[table] = False
+        for k, d in delimited_fields.iteritems():
+            if d['to_table'] == table:
+                expand_rows_by_table[table] = True
+
         # This may be historic, but we need to pull out the extra_data_fields here to pass into
         # mapper.map_row. apply_columns are extra_data columns (the raw column names)
-        extra_data_fields = []
+        extra_data_fields[table] = []
         for k, v in mappings.iteritems():
             if not md.find_column(v[0], v[1]):
-                extra_data_fields.append(k)
-        _log.debug("extra data fields: {}".format(extra_data_fields))
+                extra_data_fields[table].append(k)
+        _log.debug("extra data fields: {}".format(extra_data_fields[table]))
 
-        # All the data live in the PropertyState.extra_data field when the data are imported
-        data = PropertyState.objects.filter(id__in=ids).only('extra_data').iterator()
+    return {
+        'table_mappings': table_mappings,
+        'delimited_fields': delimited_fields,
+        'delimited_field_list': delimited_field_list,
+        'expand_rows': expand_rows_by_table,
+        'extra_data_fields': extra_data_fields,
+        'cleaner_ontology': _build_cleaner_ontology(org),
+    }
 
-        # Since we are importing CSV, then each extra_data field will have the same fields. So
-        # save the map_model_obj outside of for loop to pass into the `save_column_names` methods
-        map_model_obj = None
 
-        # Loop over all the rows
-        for original_row in data:
+def _get_mapping_plan(import_file):
+    """Return the cached mapping plan of the import file, building it if it is not cached"""
+    plan_key = _get_mapping_plan_key(import_file.pk)
+    plan = get_cache_raw(plan_key)
+    if plan is None:
+        plan = _build_mapping_plan(import_file)
+        set_cache_raw(plan_key, plan)
+
+    return plan
+
+
+@shared_task
+def map_row_chunk(ids, file_pk, source_type, prog_key, increment, *args, **kwargs):
+    """Does the work of matching a mapping to a source type and saving
+
+    :param ids: list of PropertyState IDs to map.
+    :param file_pk: int, the PK for an ImportFile obj.
+    :param source_type: int, represented by either ASSESSED_RAW or PORTFOLIO_RAW.
+    :param prog_key: string, key of the progress key
+    :param increment: double, value by which to increment progress key
+    :param cleaner: (optional), the cleaner class you want to send to mapper.map_row.
+                    (e.g. turn numbers into floats.).
+    :param raw_ids: (optional kwarg), the list of ids in chunk order.
+
+    """
+
+    _log.debug('Mapping row chunks')
+    import_file = ImportFile.objects.get(pk=file_pk)
+    save_type = PORTFOLIO_BS
+    if source_type == ASSESSED_RAW:
+        save_type = ASSESSED_BS
 
-            # expand the row into multiple rows if needed with the delimited_field replaced with a
-            # single value. This minimizes the need to rewrite the downstream code.
-            expand_row = False
-            for k, d in delimited_fields.iteritems():
-                if d['to_table'] == table:
-                    expand_row = True
-            # _log.debug("Expand row is set to {}".format(expand_row))
+    org = Organization.objects.get(pk=import_file.import_record.super_organization.pk)
 
-            delimited_field_list = []
-            for _, v in delimited_fields.iteritems():
-                delimited_field_list.append(v['from_field'])
+    # The mappings, delimited fields and cleaner are the same for each chunk of the file, so
+    # they are compiled once by _map_data and reused here.
+    plan = _get_mapping_plan(import_file)
+    delimited_field_list = plan['delimited_field_list']
+    map_cleaner = cleaners.Cleaner(plan['cleaner_ontology'])
 
-            # _log.debug("delimited_field_list is set to {}".format(delimited_field_list))
+    for table, mappings in plan['table_mappings'].iteritems():
+        if not table:
+            continue
+
+        extra_data_fields = plan['extra_data_fields'][table]
+        expand_row = plan['expand_rows'][table]
+
+        # All the data live in the PropertyState.extra_data field when the data are imported
+        data = PropertyState.objects.filter(id__in=ids).only('extra_data').iterator()
 
+        # Hash of a state without any data, used to skip the rows that have nothing mapped
+        empty_hash = hash_state_object(STR_TO_CLASS[table](organization=org),
+                                       include_extra_data=False)
+
+        # Build all of the mapped states of the chunk in memory and save them at once below
+        mapped_states = []
+        for original_row in data:
             # Weeee... the data are in the extra_data column.
             for row in expand_rows(original_row.extra_data, delimited_field_list, expand_row):
                 # TODO: during the mapping the data are saved back in the database
@@ -300,17 +426,12 @@ def map_row_chunk(ids, file_pk, source_type, prog_key, increment, *args, **kwarg
                     **kwargs
                 )
 
-                # save cross related data, that is data that needs to go into the other model's
-                # collection as well.
-
                 # Assign some other arguments here
                 map_model_obj.import_file = import_file
                 map_model_obj.source_type = save_type
-                map_model_obj.organization = import_file.import_record.super_organization  # Not the best place..
+                map_model_obj.organization = org
                 if hasattr(map_model_obj, 'data_state'):
                     map_model_obj.data_state = DATA_STATE_MAPPING
-                if hasattr(map_model_obj, 'organization'):
-                    map_model_obj.organization = import_file.import_record.super_organization
                 if hasattr(map_model_obj, 'clean'):
                     map_model_obj.clean()
 
@@ -319,37 +440,30 @@ def map_row_chunk(ids, file_pk, source_type, prog_key, increment, *args, **kwarg
                 # sure that the object hasn't already been created.
                 # For example, in the test data the tax lot id is the same for many rows. Make sure
                 # to only create/save the object if it hasn't been created before.
-                if hash_state_object(map_model_obj, include_extra_data=False) == hash_state_object(
-                        STR_TO_CLASS[table](organization=map_model_obj.organization),
-                        include_extra_data=False):
+                if hash_state_object(map_model_obj, include_extra_data=False) == empty_hash:
                     # Skip this object as it has no data...
                     continue
 
-                try:
-                    # There was an error with a field being too long [> 255 chars].
-                    map_model_obj.save()
-
-                    # Create an audit log record for the new
-                    # map_model_obj that was created.
+                mapped_states.append(map_model_obj)
 
-                    AuditLogClass = PropertyAuditLog if isinstance(map_model_obj,
-                                                                   PropertyState) else TaxLotAuditLog
-                    AuditLogClass.objects.create(organization=org,
-                                                 state=map_model_obj,
-                                                 name='Import Creation',
-                                                 description='Creation from Import file.',
-                                                 import_filename=import_file,
-                                                 record_type=AUDIT_IMPORT)
+        saved_states = _save_mapped_states(STR_TO_CLASS[table], mapped_states)
 
-                except Exception as e:
-                    # Could not save the record for some reason. Report out and keep moving
-                    # TODO: Need to address this and report back to the user which records were not imported  #noqa
-                    _log.error(
-                        "Unable to save row the model with row {}:{}".format(type(e), e.message))
+        # Create an audit log record for each of the new states that were created.
+        AuditLogClass = PropertyAuditLog if STR_TO_CLASS[table] == PropertyState else TaxLotAuditLog
+        AuditLogClass.objects.bulk_create([
+            AuditLogClass(organization=org,
+                          state_id=state.pk,
+                          name='Import Creation',
+                          description='Creation from Import file.',
+                          import_filename=import_file,
+                          record_type=AUDIT_IMPORT)
+            for state in saved_states
+        ])
 
-        # Make sure that we've saved all of the extra_data column names from the first item in list
-        if map_model_obj:
-            Column.save_column_names(map_model_obj)
+        # Since we are importing CSV, then each extra_data field will have the same fields. So
+        # only the first saved item is needed to save the extra_data column names
+        if saved_states:
+            Column.save_column_names(saved_states[0])
 
     increment_cache(prog_key, increment)
 
@@ -393,6 +507,10 @@ def _map_data(import_file_id, mark_as_done, *args, **kwargs):
         data_state=DATA_STATE_IMPORT,
     ).only('id').iterator()
 
+    # Compile the mapping plan once for all of the chunks. Always rebuild it here since the
+    # mappings may have changed since the last time the file was mapped.
+    set_cache_raw(_get_mapping_plan_key(import_file_id), _build_mapping_plan(import_file))
+
     id_chunks = [[obj.id for obj in chunk] for chunk in batch(qs, 100)]
     increment = get_cache_increment_value(id_chunks)
     tasks = [map_row_chunk.s(ids, import_file_id, source_type, prog_key, increment)
@@ -447,14 +565,16 @@ def _cleanse_data(import_file_id, record_type='property'):
     qs = model.objects.filter(
         import_file=import_file,
         source_type=source_type,
-    ).only('id').iterator()
-
-    # initialize the cache for the cleansing results using the cleansing static method
-    Cleansing.initialize_cache(import_file_id)
+    ).order_by('id').only('id').iterator()
 
     prog_key = get_prog_key('cleanse_data', import_file_id)
 
     id_chunks = [[obj.id for obj in chunk] for chunk in batch(qs, 100)]
+
+    # initialize the cache for the cleansing results using the cleansing static method, each
+    # chunk is identified by its first id
+    Cleansing.initialize_cache(import_file_id, [ids[0] for ids in id_chunks])
+
     increment = get_cache_increment_value(id_chunks)
     tasks = [
         cleanse_data_chunk.s(record_type, ids, import_file_id, increment)
@@ -521,39 +641,45 @@ def map_data(import_file_id, remap=False, mark_as_done=True, *args, **kwargs):
     return {'status': 'success', 'progress_key': prog_key}
 
 
+def _sanitize_raw_row(row):
+    """Strip the keys of a raw row and remove any diacritics from its unicode values."""
+    new_row = {}
+    for k, v in row.iteritems():
+        # remove extra spaces surrounding keys.
+        key = k.strip()
+        if isinstance(v, unicode):
+            new_row[key] = unidecode(v)
+        else:
+            new_row[key] = v
+    return new_row
+
+
 @shared_task
 def _save_raw_data_chunk(chunk, file_pk, prog_key, increment, *args, **kwargs):
-    """Save the raw data to the database."""
+    """Save the raw data to the database.
+
+    All the rows of the chunk are written with a single batched insert. The raw states only
+    contain extra_data (no address), so there is nothing that requires the per-row save().
+    """
     import_file = ImportFile.objects.get(pk=file_pk)
 
-    # Save our "column headers" and sample rows for F/E.
+    # Everything but the extra_data is the same for each row, so resolve it once.
     source_type = get_source_type(import_file)
-    for c in chunk:
-        raw_property = PropertyState(organization=import_file.import_record.super_organization)
-        raw_property.import_file = import_file  # not defined in new data model
-
-        # sanitize c and remove any diacritics
-        new_chunk = {}
-        for k, v in c.iteritems():
-            # remove extra spaces surrounding keys.
-            key = k.strip()
-            if isinstance(v, unicode):
-                new_chunk[key] = unidecode(v)
-            else:
-                new_chunk[key] = v
-        raw_property.extra_data = new_chunk
-        raw_property.source_type = source_type  # not defined in new data model
-        raw_property.data_state = DATA_STATE_IMPORT
+    super_org = import_file.import_record.super_organization
 
-        # We require a save to get our PK
-        # We save here to set our initial source PKs.
-        raw_property.save()
-
-        super_org = import_file.import_record.super_organization
-        raw_property.organization = super_org
+    raw_properties = []
+    for c in chunk:
+        raw_properties.append(
+            PropertyState(
+                organization=super_org,
+                import_file=import_file,
+                source_type=source_type,
+                data_state=DATA_STATE_IMPORT,
+                extra_data=_sanitize_raw_row(c),
+            )
+        )
 
-        # set_initial_sources(raw_property)
-        raw_property.save()
+    PropertyState.objects.bulk_create(raw_properties, batch_size=RAW_SAVE_BATCH_SIZE)
 
     # Indicate progress
     increment_cache(prog_key, increment)
@@ -643,6 +769,28 @@ def _save_raw_green_button_data(file_pk, *args, **kwargs):
     }
 
 
+def save_raw_green_button_files(file_pks):
+    """
+    Import many Green Button files in parallel. The files are split in celery
+    chunks of GREEN_BUTTON_FILES_PER_TASK files, each file of a chunk is
+    streamed and saved by _save_raw_green_button_data.
+
+    :param file_pks: list of ImportFile ids of Green Button files
+    :returns: GroupResult of the chunks
+    """
+    for file_pk in file_pks:
+        prog_key = get_prog_key('save_raw_data', file_pk)
+        set_cache(prog_key, 'not-started', {
+            'status': 'not-started',
+            'progress': 0,
+            'progress_key': prog_key
+        })
+
+    return _save_raw_green_button_data.chunks(
+        [(file_pk,) for file_pk in file_pks], GREEN_BUTTON_FILES_PER_TASK
+    ).apply_async()
+
+
 @shared_task
 @lock_and_track
 def _save_raw_data(file_pk, *args, **kwargs):
@@ -675,7 +823,7 @@ def _save_raw_data(file_pk, *args, **kwargs):
         import_file.num_columns = parser.num_columns()
 
         chunks = []
-        for batch_chunk in batch(rows, 100):
+        for batch_chunk in batch(rows, RAW_SAVE_CHUNK_SIZE):
             import_file.num_rows += len(batch_chunk)
             chunks.append(batch_chunk)
         increment = get_cache_increment_value(chunks)
@@ -832,6 +980,10 @@ def _finish_matching(import_file, progress_key):
     import_file.mapping_completion = 100
     import_file.save()
 
+    # the matched views change the reports of the cycle
+    if import_file.cycle_id:
+        clear_report_summaries([import_file.cycle_id])
+
     result = {
         'status': 'success',
         'progress': 100,
@@ -966,6 +1118,7 @@ class EquivalencePartitioner(object):
         the two objects are definitely different object)
         """
 
+        self.equiv_comparison_key_fields = equivalence_class_description
         self.equiv_comparison_key_func = self.make_resolved_key_calculation_function(
             equivalence_class_description)
 
@@ -1085,7 +1238,7 @@ class EquivalencePartitioner(object):
         return True in [not a and b for (a, b) in zip(original_key, new_key)]
 
     def merge_keys(self, key1, key2):
-        return [a if a else b for (a, b) in zip(key1, key2)]
+        return tuple([a if a else b for (a, b) in zip(key1, key2)])
 
     def identities_are_different(self, key1, key2):
         for (x, y) in zip(key1, key2):
@@ -1108,35 +1261,87 @@ class EquivalencePartitioner(object):
         that has a blank pm_property, we would not want to say the
         value in the custom_id must be the pm_property_id.
 
+        The classes are indexed by the value in each position of their
+        key, so the candidate classes of an object are found with one
+        lookup per position instead of comparing against every class.
+        When several classes are candidates, the oldest class that does
+        not have a different identity is used.
+
         :param list_of_obj:
-        :return:
+        :return: dict, {class_key: [indexes of the objects in the class]}
         """
-        equivalence_classes = collections.defaultdict(list)
-        identities_for_equivalence = {}
+        class_keys = []
+        class_identities = []
+        class_members = []
+        class_ids_by_key = {}
+        index = KeyIndex(len(self.equiv_comparison_key_fields))
 
         for (ndx, obj) in enumerate(list_of_obj):
             cmp_key = self.calculate_comparison_key(obj)
             identity_key = self.calculate_identity_key(obj)
 
-            for class_key in equivalence_classes:
-                if self.calculate_key_equivalence(class_key,
-                                                  cmp_key) and not self.identities_are_different(
-                        identities_for_equivalence[class_key], identity_key):
-
-                    equivalence_classes[class_key].append(ndx)
+            for class_id in index.candidates(cmp_key):
+                if not self.identities_are_different(class_identities[class_id], identity_key):
+                    class_members[class_id].append(ndx)
 
+                    class_key = class_keys[class_id]
                     if self.key_needs_merging(class_key, cmp_key):
                         merged_key = self.merge_keys(class_key, cmp_key)
-                        equivalence_classes[merged_key] = equivalence_classes.pop(class_key)
-                        identities_for_equivalence[merged_key] = identity_key
+                        if class_ids_by_key.get(class_key) == class_id:
+                            del class_ids_by_key[class_key]
+                        class_keys[class_id] = merged_key
+                        class_ids_by_key.setdefault(merged_key, class_id)
+                        class_identities[class_id] = identity_key
+                        index.add(merged_key, class_id)
                     break
             else:
                 can_key = self.calculate_canonical_key(obj)
-                equivalence_classes[can_key].append(ndx)
-                identities_for_equivalence[can_key] = identity_key
+                if can_key in class_ids_by_key:
+                    class_id = class_ids_by_key[can_key]
+                    class_members[class_id].append(ndx)
+                    class_identities[class_id] = identity_key
+                else:
+                    class_id = len(class_keys)
+                    class_keys.append(can_key)
+                    class_identities.append(identity_key)
+                    class_members.append([ndx])
+                    class_ids_by_key[can_key] = class_id
+                    index.add(can_key, class_id)
+
+        equivalence_classes = collections.defaultdict(list)
+        for class_key, members in zip(class_keys, class_members):
+            equivalence_classes[class_key].extend(members)
         return equivalence_classes
 
 
+class KeyIndex(object):
+    """Index of items (e.g. equivalence class ids) by the value in each
+    position of their key.
+
+    Two keys are equivalent if they share a non-None value in the same
+    position (see EquivalencePartitioner.calculate_key_equivalence), so
+    the equivalent items of a key are the union of one dict lookup per
+    position.
+    """
+
+    def __init__(self, key_length):
+        self.positions = [collections.defaultdict(list) for _ in range(key_length)]
+
+    def add(self, key, item):
+        """Add the item under each of the non-None values of the key"""
+        for position, value in zip(self.positions, key):
+            if value is not None:
+                position[value].append(item)
+
+    def candidates(self, key):
+        """Return the sorted, unique items that are equivalent to the key"""
+        result = set()
+        for position, value in zip(self.positions, key):
+            if value is not None and value in position:
+                result.update(position[value])
+        return sorted(result)
+
+
 def match_and_merge_unmatched_objects(unmatched_states, partitioner, org, import_file):
     """Take a list of unmatched_property_states or
     unmatched_tax_lot_states and returns a set of states that
@@ -1220,10 +1425,19 @@ def merge_unmatched_into_views(unmatched_states, partitioner, org, import_file):
         state__organization=org,
         cycle_id=current_match_cycle).select_related('state')
     existing_view_states = collections.defaultdict(dict)
+    existing_view_keys = []
     for view in class_views:
         equivalence_can_key = partitioner.calculate_canonical_key(view.state)
+        if equivalence_can_key not in existing_view_states:
+            existing_view_keys.append(equivalence_can_key)
         existing_view_states[equivalence_can_key][view.cycle] = view
 
+    # Index the keys of the existing views so that each unmatched state only looks at the views
+    # that share a value with it instead of all of the views of the organization.
+    existing_view_index = KeyIndex(len(partitioner.equiv_comparison_key_fields))
+    for key_ndx, key in enumerate(existing_view_keys):
+        existing_view_index.add(key, key_ndx)
+
     matched_views = []
 
     for unmatched in unmatched_states:
@@ -1233,7 +1447,8 @@ def merge_unmatched_into_views(unmatched_states, partitioner, org, import_file):
         # equiv_can_key = partitioner.calculate_canonical_key(unmatched)
         equiv_cmp_key = partitioner.calculate_comparison_key(unmatched)
 
-        for key in existing_view_states:
+        for key_ndx in existing_view_index.candidates(equiv_cmp_key):
+            key = existing_view_keys[key_ndx]
             if partitioner.calculate_key_equivalence(key, equiv_cmp_key):
                 if current_match_cycle in existing_view_states[key]:
                     # There is an existing View for the current cycle that matches us.
@@ -1344,25 +1559,25 @@ def _match_properties_and_taxlots(file_pk, user_pk):
     pair_new_states(merged_property_views, merged_taxlot_views)
 
     # Mark all the unmatched objects as done with matching and mapping
-    # There should be some kind of bulk-update/save thing we can do to
-    # improve upon this.
-    for state in chain(unmatched_properties, unmatched_tax_lots):
-        state.data_state = DATA_STATE_MATCHING
-        state.save()
+    _transition_states(chain(unmatched_properties, unmatched_tax_lots),
+                       data_state=DATA_STATE_MATCHING)
 
+    # The merge state seems backwards, but it isn't for some reason, if they are not marked as
+    # MERGE_STATE_MERGED when called in the merge_unmatched_into_views, then they are new.
+    merged_states = []
+    new_states = []
     for state in map(lambda x: x.state, chain(merged_property_views, merged_taxlot_views)):
-        state.data_state = DATA_STATE_MATCHING
-        # The merge state seems backwards, but it isn't for some reason, if they are not marked as
-        # MERGE_STATE_MERGED when called in the merge_unmatched_into_views, then they are new.
-        if state.merge_state != MERGE_STATE_MERGED:
-            state.merge_state = MERGE_STATE_NEW
-        state.save()
+        if state.merge_state == MERGE_STATE_MERGED:
+            merged_states.append(state)
+        else:
+            new_states.append(state)
+    _transition_states(merged_states, data_state=DATA_STATE_MATCHING)
+    _transition_states(new_states, data_state=DATA_STATE_MATCHING, merge_state=MERGE_STATE_NEW)
 
     # I don't think we arrive at this code ... ever.
-    for state in chain(duplicate_property_states, duplicate_tax_lot_states):
-        state.data_state = DATA_STATE_DELETE
-        # state.merge_state = MERGE_STATE_DUPLICATE
-        state.save()
+    # merge_state=MERGE_STATE_DUPLICATE?
+    _transition_states(chain(duplicate_property_states, duplicate_tax_lot_states),
+                       data_state=DATA_STATE_DELETE)
 
     # This is a kind of vestigial code that I do not particularly understand.
     import_file.mapping_completion = 0
@@ -1371,6 +1586,23 @@ def _match_properties_and_taxlots(file_pk, user_pk):
     return _finish_matching(import_file, prog_key)
 
 
+def _transition_states(states, data_state=None, merge_state=None):
+    """Bulk update the data_state and/or merge_state of a mix of property and tax lot states.
+
+    The states are updated with a few UPDATE statements per model instead of saving each row,
+    and the in-memory objects are updated to match."""
+    ids_by_model = collections.defaultdict(list)
+    for state in states:
+        if data_state is not None:
+            state.data_state = data_state
+        if merge_state is not None:
+            state.merge_state = merge_state
+        ids_by_model[type(state)].append(state.pk)
+
+    for model, ids in ids_by_model.items():
+        model.objects.transition(ids, data_state=data_state, merge_state=merge_state)
+
+
 def list_canonical_property_states(org_id):
     """
     Return a QuerySet of the property states that are part of the inventory
@@ -1562,67 +1794,74 @@ def pair_new_states(merged_property_views, merged_taxlot_views):
     property_keys_orig = dict(
         [(property_m2m_keygen.calculate_comparison_key(p), p.pk) for p in property_objects])
 
-    # property_keys = copy.deepcopy(property_keys_orig)
-
-    # TODO: Refactor this somehow
-    # Do this inelegant step to make sure we are correctly splitting.
-    property_keys = collections.defaultdict(list)
+    # Make sure we are correctly splitting the delimited lot numbers into one key per lot number.
+    property_keys = {}
     for k in property_keys_orig:
-        if k[0] and ";" in k[0]:
-            for lotnum in map(lambda x: x.strip(), k[0].split(";")):
-                k_copy = list(copy.deepcopy(k))
-                k_copy[0] = lotnum
-                property_keys[tuple(k_copy)] = property_keys_orig[k]
-        else:
-            property_keys[k] = property_keys_orig[k]
+        for split_key in _split_lot_number_key(k):
+            property_keys[split_key] = property_keys_orig[k]
 
     taxlot_keys = dict(
         [(taxlot_m2m_keygen.calculate_comparison_key(p), p.pk) for p in taxlot_objects])
 
-    # property_comparison_keys = {property_m2m_keygen.calculate_comparison_key_key(p): p.pk for p in property_objects}
-    # property_canonical_keys = {property_m2m_keygen.calculate_canonical_key(p): p.pk for p in property_objects}
+    # Index the keys by each of their components so that the candidate pairs are found with a
+    # lookup per component instead of comparing every view against every other view.
+    property_key_list = property_keys.keys()
+    property_index = KeyIndex(len(prop_cmp_fmt))
+    for ndx, k in enumerate(property_key_list):
+        property_index.add(k, ndx)
 
-    possible_merges = []  # List of prop.id, tl.id merges.
+    taxlot_key_list = taxlot_keys.keys()
+    taxlot_index = KeyIndex(len(tax_cmp_fmt))
+    for ndx, k in enumerate(taxlot_key_list):
+        taxlot_index.add(k, ndx)
 
-    for pv in merged_property_views:
-        # if pv.state.lot_number and ";" in pv.state.lot_number:
-        #     pdb.set_trace()
+    possible_merges = set()  # Set of prop.id, tl.id merges.
 
+    for pv in merged_property_views:
         pv_key = property_m2m_keygen.calculate_comparison_key(pv.state)
-        # TODO: Refactor pronto.  Iterating over the tax lot is ad implementation.
-        for tlk in taxlot_keys:
-            if pv_key[0] and ";" in pv_key[0]:
-                for lotnum in map(lambda x: x.strip(), pv_key[0].split(";")):
-                    pv_key_copy = list(copy.deepcopy(pv_key))
-                    pv_key_copy[0] = lotnum
-                    pv_key_copy = tuple(pv_key_copy)
-                    if property_m2m_keygen.calculate_key_equivalence(pv_key_copy, tlk):
-                        possible_merges.append((property_keys[pv_key_copy], taxlot_keys[tlk]))
-            else:
-                if property_m2m_keygen.calculate_key_equivalence(pv_key, tlk):
-                    possible_merges.append((property_keys[pv_key], taxlot_keys[tlk]))
+        for split_key in _split_lot_number_key(pv_key):
+            for ndx in taxlot_index.candidates(split_key):
+                possible_merges.add(
+                    (property_keys[split_key], taxlot_keys[taxlot_key_list[ndx]]))
 
     for tlv in merged_taxlot_views:
         tlv_key = taxlot_m2m_keygen.calculate_comparison_key(tlv.state)
-        for pv_key in property_keys:
-            if property_m2m_keygen.calculate_key_equivalence(tlv_key, pv_key):
-                possible_merges.append((property_keys[pv_key], taxlot_keys[tlv_key]))
-
-    # print "Found {} merges".format(len(possible_merges))
-    for m2m in set(possible_merges):
-        pv_pk, tlv_pk = m2m
-        pv = PropertyView.objects.get(pk=pv_pk)
-        tlv = TaxLotView.objects.get(pk=tlv_pk)
-
-        connection = TaxLotProperty.objects.filter(property_view_id=pv_pk,
-                                                   taxlot_view_id=tlv_pk).count()
-        if connection:
+        for ndx in property_index.candidates(tlv_key):
+            possible_merges.add((property_keys[property_key_list[ndx]], taxlot_keys[tlv_key]))
+
+    if not possible_merges:
+        return
+
+    # Fetch all of the existing links of the property views at once
+    existing_links = set()
+    linked_property_views = set()
+    for pv_pk, tlv_pk in TaxLotProperty.objects.filter(
+            property_view_id__in=set(pv_pk for pv_pk, _ in possible_merges)).values_list(
+            'property_view_id', 'taxlot_view_id'):
+        existing_links.add((pv_pk, tlv_pk))
+        linked_property_views.add(pv_pk)
+
+    new_links = []
+    for pv_pk, tlv_pk in sorted(possible_merges):
+        if (pv_pk, tlv_pk) in existing_links:
             continue
 
-        is_primary = TaxLotProperty.objects.filter(property_view_id=pv_pk).count() == 0
+        # the first link of a property view is the primary link
+        is_primary = pv_pk not in linked_property_views
+        linked_property_views.add(pv_pk)
+
+        new_links.append(
+            TaxLotProperty(property_view_id=pv_pk, taxlot_view_id=tlv_pk, cycle=cycle,
+                           primary=is_primary))
 
-        m2m_join = TaxLotProperty(property_view_id=pv_pk, taxlot_view_id=tlv_pk, cycle=cycle,
-                                  primary=is_primary)
-        m2m_join.save()
+    TaxLotProperty.objects.bulk_create(new_links)
 
     return
+
+
+def _split_lot_number_key(key):
+    """Return one key per lot number when the first component of the key is a ';' delimited
+    list of lot numbers"""
+    if key[0] and ";" in key[0]:
+        return [(lotnum.strip(),) + tuple(key[1:]) for lotnum in key[0].split(";")]
+    return [key]
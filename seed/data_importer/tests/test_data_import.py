@@ -28,11 +28,14 @@ from seed.models import (
     ASSESSED_RAW,
     ASSESSED_BS,
     DATA_STATE_IMPORT,
+    DATA_STATE_MAPPING,
     PORTFOLIO_RAW,
     Column,
     Cycle,
+    PropertyAuditLog,
     PropertyState,
     PropertyView,
+    TaxLotAuditLog,
     TaxLotState,
 )
 
@@ -190,6 +193,54 @@ class TestMappingExampleData(DataMappingBaseTestCase):
         # The lot_number should also have the normalized code run, then re-delimited
         self.assertEqual(ps.lot_number, '33366555;33366125;33366148')
 
+        # each mapped state has one import creation audit log
+        for state in PropertyState.objects.filter(import_file=self.import_file,
+                                                  data_state=DATA_STATE_MAPPING):
+            self.assertEqual(
+                PropertyAuditLog.objects.filter(state=state, name='Import Creation').count(), 1
+            )
+        self.assertEqual(
+            TaxLotAuditLog.objects.filter(name='Import Creation').count(), len(ts)
+        )
+
+    def test_mapping_plan(self):
+        """The mapping plan is compiled once per file and not once per chunk."""
+        tasks._save_raw_data(self.import_file.pk, 'fake_cache_key', 1)
+        Column.create_mappings(self.fake_mappings, self.org, self.user)
+
+        plan = tasks._build_mapping_plan(ImportFile.objects.get(pk=self.import_file.pk))
+        self.assertItemsEqual(plan['table_mappings'].keys(), ['PropertyState', 'TaxLotState'])
+        self.assertTrue(plan['expand_rows']['TaxLotState'])
+        self.assertFalse(plan['expand_rows']['PropertyState'])
+        self.assertEqual(
+            plan['delimited_fields']['jurisdiction_tax_lot_id']['to_table'], 'TaxLotState'
+        )
+
+        with patch.object(tasks, '_build_mapping_plan', wraps=tasks._build_mapping_plan) as m:
+            tasks.map_data(self.import_file.pk)
+            self.assertEqual(m.call_count, 1)
+
+        self.assertEqual(TaxLotState.objects.count(), 18)
+
+    def test_save_mapped_states_fallback(self):
+        """If the batched insert fails then only the failing rows are skipped."""
+        states = [
+            PropertyState(organization=self.org, import_file=self.import_file,
+                          data_state=DATA_STATE_MAPPING, address_line_1='123 Main St'),
+            PropertyState(organization=self.org, import_file=self.import_file,
+                          data_state=DATA_STATE_MAPPING, property_name='x' * 300),
+            PropertyState(organization=self.org, import_file=self.import_file,
+                          data_state=DATA_STATE_MAPPING, address_line_1='124 Main St'),
+        ]
+        saved = tasks._save_mapped_states(PropertyState, states)
+
+        self.assertEqual(len(saved), 2)
+        self.assertListEqual(
+            sorted(PropertyState.objects.filter(import_file=self.import_file).values_list(
+                'normalized_address', flat=True)),
+            ['123 main st', '124 main st']
+        )
+
     def test_mapping_no_taxlot(self):
         # update the mappings to not include any taxlot tables in the data
         # note that save_data reads in from the propertystate table, so that will always
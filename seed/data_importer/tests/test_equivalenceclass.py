@@ -5,10 +5,17 @@
 :author
 """
 import logging
+import random
+import time
+from unittest import skip
 
 from django.test import TestCase
 
-from seed.data_importer.tasks import EquivalencePartitioner
+from seed.data_importer.tasks import (
+    EquivalencePartitioner,
+    KeyIndex,
+    _split_lot_number_key,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -74,3 +81,64 @@ class TestEquivalenceClassGenerator(TestCase):
         self.assertEqual(tls3.normalized_address, "123 fake street")
 
         return
+
+    def test_identity_conflict(self):
+        """States that share an address but have different pm_property_ids are not equivalent"""
+        partitioner = EquivalencePartitioner.make_PropertyState_equivalence()
+
+        p1 = PropertyState(pm_property_id=100, normalized_address="123 fake street")
+        p2 = PropertyState(pm_property_id=200, normalized_address="123 fake street")
+        p3 = PropertyState(normalized_address="123 fake street")
+
+        equivalence_classes = partitioner.calculate_equivalence_classes([p1, p2, p3])
+        self.assertEqual(len(equivalence_classes), 2)
+        # p3 has no identity, so it goes into the first matching class
+        self.assertListEqual(sorted(equivalence_classes.values()), [[0, 2], [1]])
+
+    def test_key_index(self):
+        index = KeyIndex(3)
+        index.add((1, None, "a"), 0)
+        index.add((2, None, "b"), 1)
+        index.add((None, "x", "a"), 2)
+
+        self.assertListEqual(index.candidates((None, None, "a")), [0, 2])
+        self.assertListEqual(index.candidates((2, "x", None)), [1, 2])
+        self.assertListEqual(index.candidates((None, None, None)), [])
+
+    def test_split_lot_number_key(self):
+        self.assertListEqual(_split_lot_number_key(("11;12 ", "a")), [("11", "a"), ("12", "a")])
+        self.assertListEqual(_split_lot_number_key(("11", "a")), [("11", "a")])
+        self.assertListEqual(_split_lot_number_key((None, "a")), [(None, "a")])
+
+
+class TestEquivalenceClassBenchmark(TestCase):
+    """Scaling benchmark of the equivalence classes on synthetic states"""
+
+    def _benchmark(self, count):
+        random.seed(count)
+        states = [
+            PropertyState(
+                pm_property_id=str(random.randint(0, count)),
+                custom_id_1=random.choice([None, str(random.randint(0, count))]),
+                normalized_address='{} main st'.format(random.randint(0, count)),
+            )
+            for _ in range(count)
+        ]
+        partitioner = EquivalencePartitioner.make_PropertyState_equivalence()
+
+        start = time.time()
+        equivalence_classes = partitioner.calculate_equivalence_classes(states)
+        logger.info("Calculated {} equivalence classes of {} states in {:.2f}s".format(
+            len(equivalence_classes), count, time.time() - start))
+
+        self.assertEqual(sum(len(v) for v in equivalence_classes.values()), count)
+
+    def test_10k_states(self):
+        self._benchmark(10000)
+
+    def test_100k_states(self):
+        self._benchmark(100000)
+
+    @skip('slow benchmark, run manually')
+    def test_1m_states(self):
+        self._benchmark(1000000)
@@ -8,6 +8,7 @@
 Utility methods pertaining to data import tasks (save, mapping, matching).
 """
 from django.core.cache import cache
+from django.db import connection
 from django.core.exceptions import ValidationError
 from django.utils import timezone
 
@@ -54,6 +55,23 @@ def chunk_iterable(iter, chunk_size):
         yield iter[i:i + chunk_size]
 
 
+def reserve_ids(model, count):
+    """
+    Reserve ``count`` primary keys from the sequence of the model's table. This allows objects
+    to be bulk created with known ids (bulk_create does not return the ids) so that related
+    objects (e.g. audit logs) can be bulk created as well.
+    """
+    if count <= 0:
+        return []
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT nextval(pg_get_serial_sequence(%s, %s)) FROM generate_series(1, %s)",
+            [model._meta.db_table, model._meta.pk.column, count]
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
 class CoercionRobot(object):
 
     def __init__(self):
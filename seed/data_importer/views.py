@@ -72,11 +72,30 @@ from seed.models import (
     TaxLot,
     TaxLotProperty)
 from seed.utils.api import api_endpoint, api_endpoint_class
-from seed.utils.cache import get_cache_raw, get_cache
+from seed.utils.cache import get_cache
 
 _log = logging.getLogger(__name__)
 
 
+def _get_page(page, per_page):
+    """
+    Parse the page and the number of results per page of a paged request,
+    both are at least 1.
+
+    :param page: str or int, the page, 1 if None
+    :param per_page: str or int, the number of results per page, or None for all the results
+    :return: tuple (page, per_page), per_page is None if not set
+    :raises ValueError: if the page or per_page is not an integer
+    """
+    try:
+        page = max(int(page or 1), 1)
+        if per_page is not None:
+            per_page = max(int(per_page), 1)
+    except TypeError:
+        raise ValueError('page and per_page must be integers')
+    return page, per_page
+
+
 @api_endpoint
 @ajax_request
 @login_required
@@ -536,25 +555,20 @@ class ImportFileViewSet(viewsets.ViewSet):
         response_serializer: MappingResultsResponseSerializer
         """
 
-        def get_coparent(state_id, inventory_type):
-            coparent = self.has_coparent(state_id, inventory_type)
-
-            if coparent:
-                result = {}
-                if inventory_type == 'properties':
-                    for k in fields['PropertyState']:
-                        result[k] = getattr(coparent, k)
-                else:
-                    for k in fields['TaxLotState']:
-                        result[k] = getattr(coparent, k)
-                return result
-            else:
-                return None
-
         import_file_id = pk
 
         get_coparents = request.data.get('get_coparents', False)
         get_state_id = request.data.get('state_id', False)
+        try:
+            # a per_page of 0 returns all the states
+            page, per_page = _get_page(
+                request.data.get('page'), request.data.get('per_page') or None
+            )
+        except ValueError:
+            return JsonResponse({
+                'status': 'error',
+                'message': 'page and per_page must be integers'
+            }, status=status.HTTP_400_BAD_REQUEST)
 
         # get the field names that were in the mapping
         import_file = ImportFile.objects.get(id=import_file_id)
@@ -594,10 +608,10 @@ class ImportFileViewSet(viewsets.ViewSet):
 
             if get_coparents:
                 result['matched'] = False
-                coparent = get_coparent(state.id, inventory_type)
+                coparent = self.has_coparent(state.id, inventory_type)
                 if coparent:
                     result['matched'] = True
-                    result['coparent'] = coparent
+                    result['coparent'] = {k: getattr(coparent, k) for k in fields[state.__class__.__name__]}
 
             return {
                 'status': 'success',
@@ -616,40 +630,31 @@ class ImportFileViewSet(viewsets.ViewSet):
             ).values(*fields['TaxLotState'])
 
             # If a record was manually edited then remove the edited version
-            properties = list(properties)
-            tax_lots = list(tax_lots)
-            properties_to_remove = list()
-            taxlots_to_remove = list()
-            for p in properties:
-                if PropertyAuditLog.objects.filter(
-                    state_id=p['id'],
-                    name='Manual Edit'
-                ).exists():
-                    properties_to_remove.append(p['id'])
-            for t in tax_lots:
-                if TaxLotAuditLog.objects.filter(
-                    state_id=t['id'],
-                    name='Manual Edit'
-                ).exists():
-                    taxlots_to_remove.append(t['id'])
-
+            properties_to_remove = self._manually_edited_state_ids(PropertyAuditLog, import_file_id)
+            taxlots_to_remove = self._manually_edited_state_ids(TaxLotAuditLog, import_file_id)
             properties = [p for p in properties if p['id'] not in properties_to_remove]
             tax_lots = [t for t in tax_lots if t['id'] not in taxlots_to_remove]
+            number_properties = len(properties)
+            number_tax_lots = len(tax_lots)
+
+            # Optionally return a single page of the states
+            if per_page is not None:
+                start = (page - 1) * per_page
+                properties = properties[start:start + per_page]
+                tax_lots = tax_lots[start:start + per_page]
 
             if get_coparents:
-                for state in properties:
-                    state['matched'] = False
-                    coparent = get_coparent(state['id'], 'properties')
-                    if coparent:
-                        state['matched'] = True
-                        state['coparent'] = coparent
-
-                for state in tax_lots:
-                    state['matched'] = False
-                    coparent = get_coparent(state['id'], 'taxlots')
-                    if coparent:
-                        state['matched'] = True
-                        state['coparent'] = coparent
+                for states, state_class, audit_log in [
+                    (properties, PropertyState, PropertyAuditLog),
+                    (tax_lots, TaxLotState, TaxLotAuditLog),
+                ]:
+                    coparents = self._get_coparents(
+                        audit_log, state_class, import_file_id, [state['id'] for state in states],
+                        fields[state_class.__name__])
+                    for state in states:
+                        state['matched'] = state['id'] in coparents
+                        if state['matched']:
+                            state['coparent'] = coparents[state['id']]
 
             # properties = list(properties)
             # tax_lots = list(tax_lots)
@@ -662,9 +667,9 @@ class ImportFileViewSet(viewsets.ViewSet):
                 'properties': properties,
                 'tax_lots': tax_lots,
                 'number_properties_returned': len(properties),
-                'number_properties_matching_search': len(properties),
+                'number_properties_matching_search': number_properties,
                 'number_tax_lots_returned': len(tax_lots),
-                'number_tax_lots_matching_search': len(tax_lots),
+                'number_tax_lots_matching_search': number_tax_lots,
             }
 
     @api_endpoint_class
@@ -799,6 +804,68 @@ class ImportFileViewSet(viewsets.ViewSet):
         state_id1 = audit_entry.parent_state1_id
         return audit_entry.parent_state1 if state_id1 != state_id else audit_entry.parent_state2
 
+    @staticmethod
+    def _manually_edited_state_ids(audit_log, import_file_id):
+        """
+        Return the ids of the states of the import file that were manually
+        edited, in one query.
+
+        :param audit_log: PropertyAuditLog or TaxLotAuditLog
+        :param import_file_id: int
+        :return: set
+        """
+        return set(audit_log.objects.filter(
+            state__import_file_id=import_file_id,
+            name='Manual Edit'
+        ).values_list('state_id', flat=True))
+
+    @staticmethod
+    def _get_coparents(audit_log, state_class, import_file_id, state_ids, fields):
+        """
+        Return the coparents of the states, the states they were merged with,
+        as in has_coparent but with one query for the merge records of the
+        import file and one for the coparents.
+
+        :param audit_log: PropertyAuditLog or TaxLotAuditLog
+        :param state_class: PropertyState or TaxLotState
+        :param import_file_id: int, import file of the states
+        :param state_ids: list of ids of the states
+        :param fields: list of the fields of the coparents to return
+        :return: dict of state id to the dict of the fields of its coparent,
+            for the states that have one
+        """
+        if not state_ids:
+            return {}
+
+        state_ids = set(state_ids)
+        creations = audit_log.objects.exclude(import_filename=None).filter(
+            state__import_file_id=import_file_id,
+            name='Import Creation'
+        )
+        merged_records = audit_log.objects.filter(
+            Q(parent1__in=creations) | Q(parent2__in=creations)
+        ).order_by('id').values_list('parent_state1_id', 'parent_state2_id')
+
+        coparent_ids = {}
+        for state_id1, state_id2 in merged_records:
+            for state_id, coparent_id in [(state_id1, state_id2), (state_id2, state_id1)]:
+                if state_id in state_ids and coparent_id is not None:
+                    if state_id in coparent_ids:
+                        _log.warning('More than one merge record found for state {}'.format(state_id))
+                    else:
+                        coparent_ids[state_id] = coparent_id
+
+        coparents = {
+            coparent['id']: coparent
+            for coparent in state_class.objects.filter(
+                id__in=set(coparent_ids.values())
+            ).values(*set(fields) | {'id'})
+        }
+        return {
+            state_id: {k: coparents[coparent_id][k] for k in fields}
+            for state_id, coparent_id in coparent_ids.items() if coparent_id in coparents
+        }
+
     @api_endpoint_class
     @ajax_request_class
     @detail_route(methods=['POST'])
@@ -1280,9 +1347,31 @@ class ImportFileViewSet(viewsets.ViewSet):
               description: Import file ID
               required: true
               paramType: path
+            - name: page
+              description: The page of results to return
+              required: false
+              paramType: query
+            - name: per_page
+              description: The number of results per page, all the results are returned if not set
+              required: false
+              paramType: query
         """
         import_file_id = pk
-        cleansing_results = get_cache_raw(Cleansing.cache_key(import_file_id))
+        try:
+            page, per_page = _get_page(
+                request.query_params.get('page'), request.query_params.get('per_page')
+            )
+        except ValueError:
+            return JsonResponse({
+                'status': 'error',
+                'message': 'page and per_page must be integers'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        if per_page is None:
+            cleansing_results = list(Cleansing.get_results(import_file_id))
+        else:
+            cleansing_results = list(Cleansing.get_results(
+                import_file_id, offset=(page - 1) * per_page, limit=per_page
+            ))
         return JsonResponse({
             'status': 'success',
             'message': 'Cleansing complete',
@@ -1342,7 +1431,7 @@ class ImportFileViewSet(viewsets.ViewSet):
         """
 
         import_file_id = pk
-        cleansing_results = get_cache_raw(Cleansing.cache_key(import_file_id))
+        cleansing_results = Cleansing.get_results(import_file_id)
         response = HttpResponse(content_type='text/csv')
         response['Content-Disposition'] = 'attachment; filename="Data Cleansing Results.csv"'
 
@@ -1567,28 +1656,22 @@ class ImportFileViewSet(viewsets.ViewSet):
             import_file__pk=import_file_id,
             data_state=DATA_STATE_MATCHING,
             merge_state=MERGE_STATE_NEW,
-        ))
+        ).values_list('id', flat=True))
         # If a record was manually edited then remove the edited version
-        properties_to_remove = list()
-        for p in properties:
-            if PropertyAuditLog.objects.filter(
-                state_id=p.id,
-                name='Manual Edit'
-            ).exists():
-                properties_to_remove.append(p.id)
-        properties = [p for p in properties if p.id not in properties_to_remove]
-
-        for state in properties:
-            audit_creation_id = PropertyAuditLog.objects.only('id').exclude(import_filename=None).get(
-                state_id=state.id,
-                name='Import Creation'
-            )
-            if PropertyAuditLog.objects.exclude(record_type=AUDIT_USER_EDIT).filter(
-                parent1_id=audit_creation_id
-            ).exists():
-                properties_matched.append(state.id)
+        properties_to_remove = self._manually_edited_state_ids(PropertyAuditLog, import_file_id)
+        properties = [p for p in properties if p not in properties_to_remove]
+
+        # States of the import file whose import creation record is the first parent of a merge
+        merged_ids = set(PropertyAuditLog.objects.exclude(record_type=AUDIT_USER_EDIT).filter(
+            parent1__state__import_file_id=import_file_id,
+            parent1__name='Import Creation',
+        ).exclude(parent1__import_filename=None).values_list('parent1__state_id', flat=True))
+
+        for state_id in properties:
+            if state_id in merged_ids:
+                properties_matched.append(state_id)
             else:
-                properties_new.append(state.id)
+                properties_new.append(state_id)
 
         tax_lots_new = []
         tax_lots_matched = list(TaxLotState.objects.only('id').filter(
@@ -1602,28 +1685,22 @@ class ImportFileViewSet(viewsets.ViewSet):
             import_file__pk=import_file_id,
             data_state=DATA_STATE_MATCHING,
             merge_state=MERGE_STATE_NEW,
-        ))
+        ).values_list('id', flat=True))
         # If a record was manually edited then remove the edited version
-        taxlots_to_remove = list()
-        for t in taxlots:
-            if TaxLotAuditLog.objects.filter(
-                state_id=t.id,
-                name='Manual Edit'
-            ).exists():
-                taxlots_to_remove.append(t.id)
-        taxlots = [t for t in taxlots if t.id not in taxlots_to_remove]
-
-        for state in taxlots:
-            audit_creation_id = TaxLotAuditLog.objects.only('id').exclude(import_filename=None).get(
-                state_id=state.id,
-                name='Import Creation'
-            )
-            if TaxLotAuditLog.objects.exclude(record_type=AUDIT_USER_EDIT).filter(
-                parent1_id=audit_creation_id
-            ).exists():
-                tax_lots_matched.append(state.id)
+        taxlots_to_remove = self._manually_edited_state_ids(TaxLotAuditLog, import_file_id)
+        taxlots = [t for t in taxlots if t not in taxlots_to_remove]
+
+        # States of the import file whose import creation record is the first parent of a merge
+        merged_ids = set(TaxLotAuditLog.objects.exclude(record_type=AUDIT_USER_EDIT).filter(
+            parent1__state__import_file_id=import_file_id,
+            parent1__name='Import Creation',
+        ).exclude(parent1__import_filename=None).values_list('parent1__state_id', flat=True))
+
+        for state_id in taxlots:
+            if state_id in merged_ids:
+                tax_lots_matched.append(state_id)
             else:
-                tax_lots_new.append(state.id)
+                tax_lots_new.append(state_id)
 
         return {
             'status': 'success',
@@ -5,13 +5,25 @@
 :author
 """
 import json
+import logging
+import threading
+import time
 from functools import wraps
 
 from django.core.serializers.json import DjangoJSONEncoder
 from django.http import HttpResponse, HttpResponseForbidden, HttpResponseBadRequest
 
 from seed.lib.superperms.orgs.models import OrganizationUser
-from seed.utils.cache import make_key, lock_cache, unlock_cache, get_lock
+from seed.utils.cache import (
+    LOCK_TIMEOUT,
+    acquire_lock,
+    get_lock_age,
+    make_key,
+    release_lock,
+    renew_lock,
+)
+
+_log = logging.getLogger(__name__)
 
 SEED_CACHE_PREFIX = 'SEED:{0}'
 LOCK_CACHE_PREFIX = SEED_CACHE_PREFIX + ':LOCK'
@@ -44,8 +56,37 @@ def get_prog_key(func_name, import_file_pk):
     )
 
 
+class _LockHeartbeat(threading.Thread):
+    """Renew a lock in the background while the task holding it runs."""
+
+    def __init__(self, lock_key, token, timeout=LOCK_TIMEOUT):
+        super(_LockHeartbeat, self).__init__(name='lock-heartbeat:{}'.format(lock_key))
+        self.daemon = True
+        self.lock_key = lock_key
+        self.token = token
+        self.timeout = timeout
+        self._stopped = threading.Event()
+
+    def run(self):
+        # renew well before the lock expires, so a slow renewal does not lose it
+        while not self._stopped.wait(self.timeout / 3.0):
+            if not renew_lock(self.lock_key, self.token, self.timeout):
+                _log.warning('Lock {} was lost while the task was running'.format(self.lock_key))
+                return
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+
 def lock_and_track(fn, *args, **kwargs):
-    """Decorator to lock tasks to single executor and provide progress url."""
+    """
+    Decorator to lock tasks to single executor and provide progress url.
+
+    The lock is acquired atomically and renewed by a heartbeat while the task
+    runs, so a task running longer than LOCK_TIMEOUT is not started twice,
+    and it expires LOCK_TIMEOUT after the worker holding it dies.
+    """
     func_name = fn.__name__
 
     @wraps(fn)
@@ -53,18 +94,26 @@ def lock_and_track(fn, *args, **kwargs):
         """Lock and return progress url for updates."""
         lock_key = _get_lock_key(func_name, import_file_pk)
         prog_key = get_prog_key(func_name, import_file_pk)
-        is_locked = get_lock(lock_key)
+        token = acquire_lock(lock_key)
         # If we're already processing a given task, don't proceed.
-        if is_locked:
+        if token is None:
+            lock_age = get_lock_age(lock_key)
+            _log.info('{} for {} skipped, locked for {} seconds'.format(
+                func_name, import_file_pk,
+                '{:.1f}'.format(lock_age) if lock_age is not None else 'unknown'))
             return {'error': 'locked'}
 
-        # Otherwise, set the lock for 1 minute.
-        lock_cache(lock_key)
+        heartbeat = _LockHeartbeat(lock_key, token)
+        heartbeat.start()
+        start = time.time()
         try:
             response = fn(import_file_pk, *args, **kwargs)
         finally:
             # Unset our lock
-            unlock_cache(lock_key)
+            heartbeat.stop()
+            release_lock(lock_key, token)
+            _log.debug('{} for {} held its lock for {:.1f} seconds'.format(
+                func_name, import_file_pk, time.time() - start))
 
         # If our response is a dict, add our progress URL to it.
         if isinstance(response, dict):
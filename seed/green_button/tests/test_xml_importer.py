@@ -6,21 +6,28 @@
 """
 
 import copy
+from datetime import timedelta
 from os import path
+from StringIO import StringIO
 
+import mock
 import xmltodict
+from celery.canvas import chunks
 from django.core.files import File
 from django.test import TestCase
 
 import seed.models
 from seed.audit_logs.models import AuditLog
+from seed.data_importer import tasks
 from seed.data_importer.models import ImportRecord, ImportFile
+from seed.decorators import get_prog_key
 from seed.green_button import xml_importer
 from seed.landing.models import SEEDUser as User
 from seed.lib.superperms.orgs.models import Organization, OrganizationUser
 from seed.models import (
     BuildingSnapshot, TimeSeries
 )
+from seed.utils.cache import get_cache
 
 # sample data corresponds to the data that should be extracted by
 # xml_importer.building_data when called with the file
@@ -288,6 +295,37 @@ class GreenButtonXMLParsingTests(TestCase):
         data = xml_importer.building_data(xml_data)
         self.assertEqual(data, sample_building_data)
 
+    def test_stream_building_data(self):
+        """
+        Test of xml_importer.stream_building_data.
+        """
+        data = xml_importer.stream_building_data(StringIO(self.sample_xml))
+        readings = data.pop('readings')
+
+        expected = copy.deepcopy(sample_building_data)
+        del expected['interval']
+        self.assertEqual(data, expected)
+        self.assertEqual(list(readings), sample_reading_data)
+
+    def test_stream_building_data_interval_blocks(self):
+        """
+        Test that the readings of every IntervalBlock of the file are
+        streamed.
+        """
+        block_start = self.sample_xml.index('<IntervalBlock')
+        block_entry = self.sample_xml[
+            self.sample_xml.rindex('<entry>', 0, block_start):self.sample_xml.index('</feed>')
+        ]
+        xml = self.sample_xml.replace('</feed>', block_entry * 2 + '</feed>')
+
+        data = xml_importer.stream_building_data(StringIO(xml))
+        self.assertEqual(list(data['readings']), sample_reading_data * 3)
+
+    def test_stream_building_data_missing_meter(self):
+        xml = self.sample_xml.replace('ReadingType', 'Other')
+        with self.assertRaises(ValueError):
+            xml_importer.stream_building_data(StringIO(xml))
+
 
 class GreenButtonXMLImportTests(TestCase):
     """
@@ -373,3 +411,80 @@ class GreenButtonXMLImportTests(TestCase):
         """
         xml_importer.import_xml(self.import_file)
         self.assert_models_created()
+
+    def test_create_timeseries(self):
+        """
+        Test that the readings are saved in batches.
+        """
+        cb, meter = xml_importer.create_building_and_meter(
+            sample_building_data, self.import_file
+        )
+        readings = [
+            {
+                'cost': None,
+                'value': str(i),
+                'start_time': str(1357027200 + i * 900),
+                'duration': '900'
+            }
+            for i in range(25)
+        ]
+
+        with self.assertNumQueries(3):
+            count = xml_importer.create_timeseries(meter, iter(readings), batch_size=10)
+
+        self.assertEqual(count, 25)
+        tss = TimeSeries.objects.filter(meter=meter).order_by('begin_time')
+        self.assertEqual([ts.reading for ts in tss], range(25))
+        self.assertEqual(tss[0].end_time - tss[0].begin_time, timedelta(seconds=900))
+
+    def test_save_raw_green_button_files_chunks(self):
+        """
+        Test that the files are split in chunks of GREEN_BUTTON_FILES_PER_TASK
+        files and that the progress of every file is initialized.
+        """
+        file_pks = [self.import_file.pk] + [
+            ImportFile.objects.create(import_record=self.import_record, file=self.sample_xml_file).pk
+            for _ in range(6)
+        ]
+
+        with mock.patch.object(tasks, 'GREEN_BUTTON_FILES_PER_TASK', 3), \
+                mock.patch.object(chunks, 'apply_async', autospec=True) as apply_async:
+            tasks.save_raw_green_button_files(file_pks)
+
+        signature = apply_async.call_args[0][0]
+        self.assertEqual(signature.kwargs['task'].task, tasks._save_raw_green_button_data.name)
+        self.assertEqual(signature.kwargs['n'], 3)
+        self.assertEqual(
+            [list(task.kwargs['it']) for task in signature.group().tasks],
+            [[(pk,) for pk in file_pks[0:3]], [(pk,) for pk in file_pks[3:6]], [(file_pks[6],)]]
+        )
+
+        for file_pk in file_pks:
+            prog_key = get_prog_key('save_raw_data', file_pk)
+            self.assertEqual(get_cache(prog_key), {
+                'status': 'not-started',
+                'progress': 0,
+                'progress_key': prog_key,
+            })
+
+    def test_save_raw_green_button_files(self):
+        """
+        Test that every file is imported and its progress is set to success.
+        """
+        file_pks = [self.import_file.pk] + [
+            ImportFile.objects.create(import_record=self.import_record, file=self.sample_xml_file).pk
+            for _ in range(2)
+        ]
+
+        with mock.patch.object(tasks, 'GREEN_BUTTON_FILES_PER_TASK', 2):
+            tasks.save_raw_green_button_files(file_pks)
+
+        for file_pk in file_pks:
+            self.assertTrue(ImportFile.objects.get(pk=file_pk).raw_save_done)
+            self.assertEqual(
+                get_cache(get_prog_key('save_raw_data', file_pk))['status'], 'success'
+            )
+        self.assertEqual(
+            BuildingSnapshot.objects.filter(address_line_1=sample_building_data['address']).count(),
+            len(file_pks)
+        )
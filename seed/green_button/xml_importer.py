@@ -6,9 +6,14 @@
 """
 from collections import Iterable
 from datetime import datetime
+from xml.etree import cElementTree as ElementTree
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
 
-import xmltodict
 from seed.lib.mcm.reader import ROW_DELIMITER
+from seed.lib.mcm.utils import batch
 
 from seed.models import (
     BuildingSnapshot,
@@ -19,8 +24,12 @@ from seed.models import (
     GREEN_BUTTON_BS,
 )
 from seed.audit_logs.models import AuditLog
+from seed.utils.timeseries import update_rollups
 import seed.models
 
+# Number of TimeSeries readings written per INSERT statement
+TIMESERIES_BATCH_SIZE = getattr(settings, 'TIMESERIES_BATCH_SIZE', 1000)
+
 
 def energy_type(service_category):
     """
@@ -240,16 +249,129 @@ def building_data(xml_data):
     return result
 
 
-def create_models(data, import_file):
+def _local_name(tag):
+    """Returns the tag of an element without its namespace, e.g. 'IntervalBlock'."""
+    return tag.rsplit('}', 1)[-1]
+
+
+def _child_text(elem, name):
+    """Returns the text of the first child of elem named name, or None."""
+    for child in elem:
+        if _local_name(child.tag) == name:
+            return child.text
+    return None
+
+
+def _child(elem, name):
+    """Returns the first child of elem named name, or None."""
+    for child in elem:
+        if _local_name(child.tag) == name:
+            return child
+    return None
+
+
+def reading_element_data(reading_elem):
     """
-    Create a BuildingSnapshot, a CanonicalBuilding, and a Meter. Then, create
-    TimeSeries models for each meter reading in data.
+    Takes an IntervalReading element and returns a flat dictionary in the
+    form returned by interval_data.
+
+    :param reading_elem: IntervalReading Element
+    :returns: dictionary representing a time series reading with keys
+        'cost', 'value', 'start_time', and 'duration'.
+    """
+    time_period = _child(reading_elem, 'timePeriod')
+
+    return {
+        'cost': _child_text(reading_elem, 'cost'),
+        'value': _child_text(reading_elem, 'value'),
+        'start_time': _child_text(time_period, 'start'),
+        'duration': _child_text(time_period, 'duration'),
+    }
+
+
+def _iter_readings(events, root, block):
+    """
+    Yields the readings of the remaining IntervalBlock nodes of the events of
+    iterparse. The parsed nodes are removed from the tree so only the current
+    reading is held in memory.
+    """
+    for event, elem in events:
+        name = _local_name(elem.tag)
+        if event == 'start':
+            if name == 'IntervalBlock':
+                block = elem
+        elif name == 'IntervalReading':
+            yield reading_element_data(elem)
+            block.clear()
+        elif name == 'entry':
+            root.clear()
+
+
+def stream_building_data(xml_file):
+    """
+    Streaming version of building_data. The Green Button XML file is read
+    incrementally with iterparse up to its first IntervalBlock, the remaining
+    nodes are only read as the readings are consumed.
+
+    :param xml_file: file-like object or path of a Green Button XML file
+    :returns: dictionary with the 'address', 'service_category' and 'meter'
+        returned by building_data, and 'readings', a generator of the
+        readings of all of the IntervalBlock nodes of the file in the form
+        returned by interval_data.
+    """
+    events = ElementTree.iterparse(xml_file, events=('start', 'end'))
+    _, root = next(events)
+
+    data = {
+        'address': None,
+        'service_category': None,
+        'meter': None,
+    }
+    block = None
+    in_entry = False
+    for event, elem in events:
+        name = _local_name(elem.tag)
+        if event == 'start':
+            if name == 'entry':
+                in_entry = True
+            elif name == 'IntervalBlock':
+                block = elem
+                break
+        elif name == 'entry':
+            in_entry = False
+            root.clear()
+        elif name == 'title' and in_entry and data['address'] is None:
+            # the title of the first entry, the UsagePoint
+            data['address'] = elem.text
+        elif name == 'ServiceCategory' and data['service_category'] is None:
+            data['service_category'] = _child_text(elem, 'kind')
+        elif name == 'ReadingType' and data['meter'] is None:
+            data['meter'] = {
+                'currency': _child_text(elem, 'currency'),
+                'power_of_ten_multiplier': _child_text(elem, 'powerOfTenMultiplier'),
+                'uom': _child_text(elem, 'uom'),
+            }
+
+    missing = sorted(key for key, value in data.items() if value is None)
+    if missing:
+        raise ValueError(
+            'Green Button file is missing {} before its interval data'.format(', '.join(missing))
+        )
+
+    data['readings'] = _iter_readings(events, root, block) if block is not None else iter([])
+    return data
+
+
+def create_building_and_meter(data, import_file):
+    """
+    Create a BuildingSnapshot, a CanonicalBuilding, and a Meter for the
+    building data of a Green Button XML file.
 
     :param data: dictionary of building data from a Green Button XML file
         in the form returned by xml_importer.building_data
     :param import_file: ImportFile referencing the original xml file; needed
         for linking to BuildingSnapshot and for determining super_organization
-    :returns: the created CanonicalBuilding
+    :returns: tuple of the created CanonicalBuilding and Meter
     """
     # cache data on import_file; this is a proof of concept and we
     # only have two example files available so we hardcode the only
@@ -303,27 +425,67 @@ def create_models(data, import_file):
     )
 
     meter.building_snapshot.add(raw_bs)
-    meter.save()
-
-    # now time series data for the meter
-    for reading in data['interval']['readings']:
-        start_time = int(reading['start_time'])
-        duration = int(reading['duration'])
-
-        begin_time = datetime.fromtimestamp(start_time)
-        end_time = datetime.fromtimestamp(start_time + duration)
-        value = reading['value']
-        cost = reading['cost']
-
-        new_ts = TimeSeries.objects.create(
-            begin_time=begin_time,
-            end_time=end_time,
-            reading=value,
-            cost=cost
+
+    return cb, meter
+
+
+def create_timeseries(meter, readings, batch_size=TIMESERIES_BATCH_SIZE):
+    """
+    Create the TimeSeries models of the meter readings, batch_size readings
+    per INSERT statement, and update the rollups of the meter.
+
+    :param meter: Meter of the readings
+    :param readings: iterable of readings in the form returned by
+        interval_data, e.g. the generator of stream_building_data
+    :param batch_size: int, number of readings saved at once
+    :returns: int, number of TimeSeries created
+    """
+    count = 0
+    first_start_time = last_start_time = None
+    for readings_batch in batch(readings, batch_size):
+        time_series = []
+        for reading in readings_batch:
+            start_time = int(reading['start_time'])
+            duration = int(reading['duration'])
+            if first_start_time is None or start_time < first_start_time:
+                first_start_time = start_time
+            if last_start_time is None or start_time > last_start_time:
+                last_start_time = start_time
+
+            time_series.append(TimeSeries(
+                meter=meter,
+                begin_time=datetime.fromtimestamp(start_time),
+                end_time=datetime.fromtimestamp(start_time + duration),
+                reading=reading['value'],
+                cost=reading['cost'],
+            ))
+
+        TimeSeries.objects.bulk_create(time_series)
+        count += len(time_series)
+
+    if count:
+        update_rollups(
+            [meter.pk],
+            timezone.make_aware(datetime.fromtimestamp(first_start_time)),
+            timezone.make_aware(datetime.fromtimestamp(last_start_time)),
         )
 
-        new_ts.meter = meter
-        new_ts.save()
+    return count
+
+
+def create_models(data, import_file):
+    """
+    Create a BuildingSnapshot, a CanonicalBuilding, and a Meter. Then, create
+    TimeSeries models for each meter reading in data.
+
+    :param data: dictionary of building data from a Green Button XML file
+        in the form returned by xml_importer.building_data
+    :param import_file: ImportFile referencing the original xml file; needed
+        for linking to BuildingSnapshot and for determining super_organization
+    :returns: the created CanonicalBuilding
+    """
+    cb, meter = create_building_and_meter(data, import_file)
+    create_timeseries(meter, data['interval']['readings'])
 
     return cb
 
@@ -334,13 +496,17 @@ def import_xml(import_file):
     building and time series information from the file and constructs
     required database models.
 
+    The file is streamed, so the memory used depends on
+    TIMESERIES_BATCH_SIZE and not on the size of the file.
+
     :param import_file: a seed.models.ImportFile instance representing a
         Green Button XML file that has been previously uploaded
     :returns: the created CanonicalBuilding Inst.
     """
-    xml_file = import_file.local_file
-    xml_string = xml_file.read()
-    raw_data = xmltodict.parse(xml_string)
+    data = stream_building_data(import_file.local_file)
+
+    with transaction.atomic():
+        cb, meter = create_building_and_meter(data, import_file)
+        create_timeseries(meter, data['readings'])
 
-    data = building_data(raw_data)
-    return create_models(data, import_file)
+    return cb
@@ -20,30 +20,72 @@ from django.db.models.fields.related_descriptors import (
 )
 
 
-def batch_qs(qs, batch_size=1000):
-    """
-    From: https://djangosnippets.org/snippets/1170/
+# Number of objects loaded per query, and interval of the progress callbacks, of the exports
+EXPORT_BATCH_SIZE = 1000
+
 
-    Returns a (start, end, total, queryset) tuple for each batch in the given
+def batch_qs(qs, batch_size=EXPORT_BATCH_SIZE):
+    """
+    Returns a (start, end, total, objects) tuple for each batch in the given
     queryset.
 
+    The primary keys are loaded once in the order of the queryset, then each
+    batch is loaded by its primary keys. Unlike slicing the queryset, this
+    does not make the database count and skip the previous rows for every
+    batch.
+
     Usage:
 
     .. code-block::python
 
         # Make sure to order your querset
         article_qs = Article.objects.order_by('id')
-        for start, end, total, qs in batch_qs(article_qs):
+        for start, end, total, articles in batch_qs(article_qs):
             print 'Now processing %s - %s of %s' % (start + 1, end, total)
-            for article in qs:
+            for article in articles:
                 print article.body
     """
     if not qs.ordered:
         qs = qs.order_by('pk')
-    total = qs.count()
+    pks = list(qs.values_list('pk', flat=True))
+    total = len(pks)
     for start in range(0, total, batch_size):
         end = min(start + batch_size, total)
-        yield (start, end, total, qs[start:end])
+        batch_pks = pks[start:end]
+        objs = {obj.pk: obj for obj in qs.filter(pk__in=set(batch_pks))}
+        # objects deleted since the primary keys were loaded are skipped
+        yield (start, end, total, [objs[pk] for pk in batch_pks if pk in objs])
+
+
+def get_related_fields_to_select(fields, model):
+    """
+    Returns the paths of the foreign keys that are followed by the fields, e.g.
+    "canonical_building" for "canonical_building__id", so that the related
+    objects are loaded with the rows (select_related) rather than with one
+    query per row and field. Reverse and many to many relations are exported
+    as blanks and are not loaded.
+
+    :param fields: list of field names
+    :param model: model that is exported
+    :return: sorted list of paths
+    """
+    paths = set()
+    for field in fields:
+        par = model
+        path = []
+        for component in field.split("__"):
+            try:
+                f = par._meta.get_field(component)
+            except FieldDoesNotExist:
+                break
+            if not (f.is_relation and f.concrete and (f.many_to_one or f.one_to_one)):
+                break
+            path.append(component)
+            par = f.related_model
+        if path:
+            paths.add("__".join(path))
+
+    return sorted(paths)
 
 
 def get_field_name_from_model(field, model):
@@ -122,8 +164,12 @@ def construct_obj_row(obj, fields):
 
 
 def qs_to_rows(qs, fields):
-    for start, end, total, sub_qs in batch_qs(qs):
-        for obj in sub_qs:
+    related = get_related_fields_to_select(fields, qs.model)
+    if related:
+        qs = qs.select_related(*related)
+
+    for start, end, total, objs in batch_qs(qs):
+        for obj in objs:
             yield construct_obj_row(obj, fields)
 
 
@@ -252,7 +298,7 @@ class Exporter:
 
             for i, row in enumerate(qs_to_rows(qs, fields)):
                 writer.writerow(row)
-                if cb:
+                if cb and i % EXPORT_BATCH_SIZE == 0:
                     cb(i)
 
         return self.tempfile
@@ -271,7 +317,7 @@ class Exporter:
         for i, row in enumerate(qs_to_rows(qs, fields)):
             for j, v in enumerate(row):
                 worksheet.write(i + 1, j, v)
-            if cb:
+            if cb and i % EXPORT_BATCH_SIZE == 0:
                 cb(i)
 
         self.tempfile = tempfile.mktemp('.xls')
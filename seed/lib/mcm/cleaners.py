@@ -25,6 +25,8 @@ BOOL_SYNONYMS = (
     (u'_', u'y'),
     (u'_', u'1'),
 )
+# Exact matches of the none synonyms, checked before any fuzzy matching
+NONE_SYNONYM_SET = frozenset(synonym for _, synonym in NONE_SYNONYMS)
 PUNCT_REGEX = re.compile('[{0}]'.format(
     re.escape(string.punctuation.replace('.', '').replace('-', '')))
 )
@@ -33,7 +35,8 @@ PUNCT_REGEX = re.compile('[{0}]'.format(
 def default_cleaner(value, *args):
     """Pass-through validation for strings we don't know about."""
     if isinstance(value, unicode):
-        if fuzzy_in_set(value.lower(), NONE_SYNONYMS):
+        lower_value = value.lower()
+        if lower_value in NONE_SYNONYM_SET or fuzzy_in_set(lower_value, NONE_SYNONYMS):
             return None
     return value
 
@@ -123,7 +126,11 @@ def int_cleaner(value, *args):
 
 
 class Cleaner(object):
-    """Cleans values for a given ontology."""
+    """Cleans values for a given ontology.
+
+    Each column of the ontology is resolved to its converter function once, so cleaning a value
+    is a single dict lookup rather than a scan of each of the typed column lists.
+    """
 
     def __init__(self, ontology):
 
@@ -142,19 +149,32 @@ class Cleaner(object):
             lambda x: self.schema[x] == u'integer', self.schema
         )
 
+        self.converters = {}
+        for columns, converter in ((self.int_columns, int_cleaner),
+                                   (self.string_columns, str),
+                                   (self.date_columns, date_cleaner),
+                                   (self.float_columns, float_cleaner)):
+            for column_name in columns:
+                self.converters[column_name] = converter
+
     def clean_value(self, value, column_name):
         """Clean the value, based on characteristics of its column_name."""
         value = default_cleaner(value)
-        if column_name in self.float_columns:
-            return float_cleaner(value)
+        converter = self.converters.get(column_name)
+        if converter is None:
+            return value
 
-        if column_name in self.date_columns:
-            return date_cleaner(value)
+        return converter(value)
 
-        if column_name in self.string_columns:
-            return str(value)
+    def clean_column(self, values, column_name):
+        """Clean a list of values that all belong to the column_name.
 
-        if column_name in self.int_columns:
-            return int_cleaner(value)
+        :param values: list, values of a single column
+        :param column_name: str, name of the column
+        :return: list, cleaned values in the same order
+        """
+        converter = self.converters.get(column_name)
+        if converter is None:
+            return [default_cleaner(value) for value in values]
 
-        return value
+        return [converter(default_cleaner(value)) for value in values]
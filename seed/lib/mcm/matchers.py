@@ -4,8 +4,12 @@
 :copyright (c) 2014 - 2016, The Regents of the University of California, through Lawrence Berkeley National Laboratory (subject to receipt of any required approvals from the U.S. Department of Energy) and contributors. All rights reserved.  # NOQA
 :author
 """
+import heapq
+
 import jellyfish
 
+from seed.utils.lru import LRUCache
+
 
 def sort_scores(a, b):
     """
@@ -26,6 +30,92 @@ def sort_scores(a, b):
         return 1
 
 
+# Maximum number of cached results per matcher and number of cached matchers (one per distinct
+# list of categories)
+MATCH_CACHE_SIZE = 10000
+MATCHER_CACHE_SIZE = 100
+
+
+def _normalize(value):
+    return value.encode('ascii', 'replace').lower()
+
+
+class Matcher(object):
+    """
+    Fuzzy matcher against a fixed list of categories. The categories are normalized once and the
+    results are kept in a bounded LRU cache, since the same values (e.g. 'Not Available', 'Yes')
+    are typically matched many times when cleaning a file.
+    """
+
+    def __init__(self, categories, cache_size=MATCH_CACHE_SIZE):
+        """
+        :param categories: list of tuples to compare against. needs to be
+            [('table1', 'value1'), ('table2', 'value2')] or a list of str
+        :param cache_size: int, maximum number of results to cache
+        """
+        self.categories = []
+        for cat in categories:
+            # verify that the category has two elements, if not, then just
+            # return _ for the first category. Need this because fuzzy_in_set uses the
+            # same method
+            if isinstance(cat, tuple):
+                table_name, category = cat[0], cat[1]
+            else:
+                table_name, category = '_', cat
+            self.categories.append(
+                (table_name, category, _normalize(category), '.'.join([table_name, category]))
+            )
+        self._cache = LRUCache(cache_size)
+
+    def best_match(self, s, top_n=5):
+        """Return the top N best matches of s, see ``best_match``"""
+        key = (s, top_n)
+        scores = self._cache.get(key)
+        if scores is None:
+            scores = self._score(s, top_n)
+            self._cache.set(key, scores)
+
+        # return a copy so that callers can not modify the cached result
+        return list(scores)
+
+    def _score(self, s, top_n):
+        if not self.categories:
+            return []
+
+        normalized = _normalize(s)
+        scores = [
+            (jellyfish.jaro_winkler(normalized, norm_category), sort_key, table_name, category)
+            for table_name, category, norm_category, sort_key in self.categories
+        ]
+
+        # take the top n number of matches, highest score first and then by the table and
+        # category name (same order as sort_scores)
+        top = heapq.nsmallest(top_n, scores, key=lambda score: (-score[0], score[1]))
+
+        # convert to hundreds
+        return [(table_name, category, int(score * 100))
+                for score, _, table_name, category in top]
+
+
+_matchers = LRUCache(MATCHER_CACHE_SIZE)
+
+
+def get_matcher(categories):
+    """Return the (cached) Matcher for the list of categories."""
+    try:
+        key = tuple(categories)
+        hash(key)
+    except TypeError:
+        # the categories can not be used as a key, so do not cache the matcher
+        return Matcher(categories)
+
+    matcher = _matchers.get(key)
+    if matcher is None:
+        matcher = Matcher(categories)
+        _matchers.set(key, matcher)
+    return matcher
+
+
 def best_match(s, categories, top_n=5):
     """
     Return the top N best matches from your categories with the best match
@@ -49,43 +139,7 @@ def best_match(s, categories, top_n=5):
         list of tuples (table, guess, percentage)
 
     """
-
-    # print 'starting match on {}'.format(s)
-    scores = []
-    for cat in categories:
-        # verify that the category has two elements, if not, then just
-        # return _ for the first category. Need this because fuzzy_in_set uses the
-        # same method
-        table_name = '_'
-        category = None
-        if isinstance(cat, tuple):
-            table_name = cat[0]
-            category = cat[1]
-        else:
-            category = cat
-
-        scores.append(
-            (
-                table_name,
-                category,
-                jellyfish.jaro_winkler(
-                    s.encode('ascii', 'replace').lower(),
-                    category.encode('ascii', 'replace').lower()
-                )
-            )
-        )
-
-        # sort first by the ones
-
-    # print 'all scores for {} are {}'.format(s, scores)
-    scores = sorted(scores, cmp=sort_scores)
-    # take the top n number of matches
-    scores = scores[:top_n]
-    # convert to hundreds
-    scores = [(score[0], score[1], int(score[2] * 100)) for score in scores]
-    # print 'ending all categories match of {} with scores {}'.format(s, scores)
-
-    return scores
+    return get_matcher(categories).best_match(s, top_n)
 
 
 def fuzzy_in_set(column_name, ontology, percent_confidence=95):
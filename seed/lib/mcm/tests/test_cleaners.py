@@ -4,7 +4,11 @@
 :copyright (c) 2014 - 2016, The Regents of the University of California, through Lawrence Berkeley National Laboratory (subject to receipt of any required approvals from the U.S. Department of Energy) and contributors. All rights reserved.  # NOQA
 :author
 """
+import csv
 import datetime
+import logging
+import os
+import time
 from decimal import Decimal
 from unittest import TestCase
 
@@ -12,6 +16,8 @@ from django.utils import timezone
 
 from seed.lib.mcm import cleaners
 
+logger = logging.getLogger(__name__)
+
 
 class TestCleaners(TestCase):
 
@@ -33,7 +39,7 @@ class TestCleaners(TestCase):
 
     def test_default_cleaner(self):
         """Make sure we cleanup 'Not Applicables', etc from row data."""
-        for item in [u'N/A', u'Not Available', u'not available']:
+        for item in [u'N/A', u'Not Available', u'not available', u'Not Availabl']:
             self.assertEqual(
                 cleaners.default_cleaner(item),
                 None
@@ -108,3 +114,70 @@ class TestCleaners(TestCase):
         self.assertEqual(self.cleaner.float_columns, ['heading_data1'])
         self.assertEqual(self.cleaner.string_columns, ['str_1'])
         self.assertEqual(self.cleaner.int_columns, ['int_1'])
+
+    def test_converters(self):
+        """Each typed column resolves to exactly one converter."""
+        self.assertEqual(self.cleaner.converters['heading_data1'], cleaners.float_cleaner)
+        self.assertEqual(self.cleaner.converters['heading2'], cleaners.date_cleaner)
+        self.assertEqual(self.cleaner.converters['heading3'], cleaners.date_cleaner)
+        self.assertEqual(self.cleaner.converters['int_1'], cleaners.int_cleaner)
+        self.assertEqual(self.cleaner.converters['str_1'], str)
+        self.assertNotIn('heading1', self.cleaner.converters)
+
+    def test_clean_column(self):
+        self.assertListEqual(
+            self.cleaner.clean_column([u'0.7', u'Not Available', u'12,090'], u'heading_data1'),
+            [0.7, None, 12090.0]
+        )
+        self.assertListEqual(
+            self.cleaner.clean_column([u'Whatever', u'N/A'], u'heading1'),
+            [u'Whatever', None]
+        )
+
+
+class TestCleanerBenchmark(TestCase):
+    """Micro-benchmark of the cleaner over a Portfolio Manager export."""
+
+    def setUp(self):
+        f = os.path.join(os.path.dirname(__file__), 'test_data', 'test_espm.csv')
+        with open(f, 'rb') as csvfile:
+            reader = csv.reader(csvfile)
+            self.headers = [h.decode('utf-8') for h in reader.next()]
+            rows = [[v.decode('utf-8') for v in row] for row in reader]
+
+        # repeat the rows to get something closer to a real export
+        rows = rows * 50
+        self.columns = {h: [row[i] for row in rows] for i, h in enumerate(self.headers)}
+
+        types = {h: 'float' for h in self.headers if '(' in h}
+        types.update({
+            u'Property Id': 'integer',
+            u'Year Built': 'integer',
+            u'ENERGY STAR Score': 'integer',
+            u'Property Name': 'string',
+            u'Year Ending': 'date',
+            u'Generation Date': 'datetime',
+            u'Release Date': 'datetime',
+        })
+        self.cleaner = cleaners.Cleaner({'types': types})
+
+    def test_clean_espm_export(self):
+        start = time.time()
+        by_value = {}
+        for h in self.headers:
+            by_value[h] = [self.cleaner.clean_value(v, h) for v in self.columns[h]]
+        value_time = time.time() - start
+
+        start = time.time()
+        by_column = {}
+        for h in self.headers:
+            by_column[h] = self.cleaner.clean_column(self.columns[h], h)
+        column_time = time.time() - start
+
+        cells = len(self.headers) * len(self.columns[self.headers[0]])
+        logger.info("Cleaned {} cells: clean_value {:.3f}s, clean_column {:.3f}s".format(
+            cells, value_time, column_time))
+
+        self.assertDictEqual(by_value, by_column)
+        self.assertIsNone(by_column[u'Property Notes'][0])
+        self.assertEqual(by_column[u'Year Built'][0], 1990)
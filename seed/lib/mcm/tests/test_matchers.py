@@ -6,6 +6,8 @@
 """
 from unittest import TestCase
 
+from mock import patch
+
 from seed.lib.mcm import matchers
 
 US_STATES = [
@@ -130,3 +132,41 @@ class TestMatchers(TestCase):
         ]
         result = sorted(data, cmp=matchers.sort_scores)  # , reverse=True)
         self.assertListEqual(result, expected)
+
+    def test_top_n_matches_sort_scores(self):
+        """The heap based top n selection returns the same order as sort_scores."""
+        categories = [
+            ('TaxLotState', 'address_line_1'),
+            ('PropertyState', 'address_line_2'),
+            ('TaxLotState', 'pointless'),
+            ('PropertyState', 'address_line_1'),
+            ('TaxLotState', 'address_line_2'),
+        ]
+        matches = matchers.Matcher(categories).best_match('address_line_1', top_n=3)
+        self.assertListEqual(
+            [m[0:2] for m in matches],
+            [
+                ('PropertyState', 'address_line_1'),
+                ('TaxLotState', 'address_line_1'),
+                ('PropertyState', 'address_line_2'),
+            ]
+        )
+
+    def test_matcher_cache(self):
+        """Repeated values are only scored once against the categories."""
+        matcher = matchers.Matcher(US_STATES)
+        with patch.object(matchers.jellyfish, 'jaro_winkler',
+                          wraps=matchers.jellyfish.jaro_winkler) as jw:
+            first = matcher.best_match('Ilinois', top_n=2)
+            second = matcher.best_match('Ilinois', top_n=2)
+            self.assertEqual(jw.call_count, len(US_STATES))
+
+        self.assertListEqual(first, second)
+        self.assertEqual(first[0][1], 'illinois')
+
+        # modifying the result does not modify the cache
+        first.pop()
+        self.assertEqual(len(matcher.best_match('Ilinois', top_n=2)), 2)
+
+    def test_get_matcher(self):
+        self.assertIs(matchers.get_matcher(US_STATES), matchers.get_matcher(list(US_STATES)))
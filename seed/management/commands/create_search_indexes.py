@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""
+:copyright (c) 2014 - 2016, The Regents of the University of California, through Lawrence Berkeley National Laboratory (subject to receipt of any required approvals from the U.S. Department of Energy) and contributors. All rights reserved.  # NOQA
+:author
+"""
+from optparse import make_option
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from seed.models import PropertyState, TaxLotState
+from seed.utils import search_index
+
+
+class Command(BaseCommand):
+    option_list = BaseCommand.option_list + (
+        make_option('--keys',
+                    default='',
+                    help='Comma separated extra_data keys to index, in addition to the keys '
+                         'that are filtered often',
+                    action='store',
+                    type='string',
+                    dest='keys'),
+        make_option('--min-filters',
+                    default=getattr(settings, 'SEARCH_INDEX_MIN_FILTERS', 20),
+                    help='Index the extra_data keys that were filtered on at least this many '
+                         'times',
+                    action='store',
+                    type='int',
+                    dest='min_filters'),
+    )
+    help = 'Creates the trigram indexes of the extra_data keys that are filtered often'
+
+    def handle(self, *args, **options):
+        if not search_index.trigram_available():
+            raise CommandError('The pg_trgm extension is not installed or SEARCH_INDEX_ENABLED '
+                               'is False')
+
+        keys = [k.strip() for k in options['keys'].split(',') if k.strip()]
+        for model in [PropertyState, TaxLotState]:
+            table = model._meta.db_table
+            frequent_keys = search_index.get_frequent_extra_data_keys(
+                table, options['min_filters'])
+            for key in keys + [k for k in frequent_keys if k not in keys]:
+                if search_index.create_extra_data_index(model, key):
+                    self.stdout.write('Created the index of {}.{}'.format(table, key),
+                                      ending='\n')
@@ -1,9 +1,18 @@
 # !/usr/bin/env python
 # encoding: utf-8
 
+from django.db import connections
 from django.db.models import Manager
+from django.db.models.expressions import OrderBy, RawSQL
 from django.db.models.query import QuerySet
 
+# Values of a JSON key that can be cast to numeric, the other values are sorted as nulls
+NUMERIC_REGEX = r'^\s*[-+]?([0-9]+(\.[0-9]*)?|\.[0-9]+)([eE][-+]?[0-9]+)?\s*$'
+
+
+class NullsLastOrderBy(OrderBy):
+    template = '%(expression)s %(ordering)s NULLS LAST'
+
 
 class JsonQuerySet(QuerySet):
     PRIMARY = 'extra_data'
@@ -12,34 +21,80 @@ class JsonQuerySet(QuerySet):
     def _safe_cast(self, cast_fn, val):
         try:
             return cast_fn(val)
-        except TypeError:
-            return val
+        except (TypeError, ValueError):
+            return None
+
+    def _json_order_by_expressions(self, order_by, unit_type):
+        """
+        Return the expressions that order the rows by a key of the JSON field.
+
+        The values are cast to numeric for the numeric units and the values
+        that are not numbers are sorted last. For the other units, the JSON
+        numbers are sorted numerically before the text values.
+        """
+        from seed.models import FLOAT, DECIMAL
+
+        column = '"{}"."{}"'.format(self.model._meta.db_table, self.PRIMARY)
+        text_value = '({} ->> %s)'.format(column)
+
+        if unit_type in (FLOAT, DECIMAL):
+            return [RawSQL(
+                "CASE WHEN {0} ~ %s THEN {0}::numeric END".format(text_value),
+                [order_by, NUMERIC_REGEX, order_by],
+            )]
+
+        return [
+            RawSQL(
+                "CASE WHEN json_typeof({0} -> %s) = 'number' THEN {1}::numeric END".format(
+                    column, text_value),
+                [order_by, order_by],
+            ),
+            RawSQL(text_value, [order_by]),
+        ]
 
     def json_order_by(self, key, order_by, order_by_rev=False, unit=None):
-        from seed.models import FLOAT, DECIMAL, STRING
+        """
+        Order by a key of the JSON field, with the missing values last.
 
-        def get_field(x):
-            return getattr(x, self.PRIMARY).get(order_by, None)
+        On PostgreSQL the ordering is done in the query, so the queryset can
+        still be sliced and paginated. On the other backends the rows are
+        loaded and sorted in Python, and a list is returned.
+
+        :param key: str, unused, kept for compatibility
+        :param order_by: str, key of the JSON field
+        :param order_by_rev: bool, descending order
+        :param unit: Unit of the column of the key, the values are sorted as
+            numbers when it is a FLOAT or DECIMAL unit
+        """
+        from seed.models import FLOAT, DECIMAL, STRING
 
         unit_type = STRING
         if unit:
             unit_type = unit.unit_type
 
-        qs = self
-        qs = list(qs)
+        # the ordering of a SELECT DISTINCT ON must start with the distinct fields
+        if connections[self.db].vendor == 'postgresql' and not self.query.distinct_fields:
+            return self.order_by(*[
+                NullsLastOrderBy(expression, descending=order_by_rev)
+                for expression in self._json_order_by_expressions(order_by, unit_type)
+            ] + ['pk'])
+
+        def get_field(x):
+            return getattr(x, self.PRIMARY).get(order_by, None)
 
         key_fns = {
             STRING: get_field,
             FLOAT: lambda x: self._safe_cast(float, get_field(x)),
             DECIMAL: lambda x: self._safe_cast(float, get_field(x)),
         }
+        key_fn = key_fns.get(unit_type, get_field)
 
-        qs.sort(
-            key=key_fns.get(unit_type, get_field),
-            reverse=order_by_rev,
-        )
+        rows = list(self)
+        with_value = [row for row in rows if key_fn(row) is not None]
+        without_value = [row for row in rows if key_fn(row) is None]
+        with_value.sort(key=key_fn, reverse=order_by_rev)
 
-        return qs
+        return with_value + without_value
 
 
 class JsonManager(Manager):
@@ -0,0 +1,52 @@
+# !/usr/bin/env python
+# encoding: utf-8
+"""
+:copyright (c) 2014 - 2016, The Regents of the University of California, through Lawrence Berkeley National Laboratory (subject to receipt of any required approvals from the U.S. Department of Energy) and contributors. All rights reserved.  # NOQA
+:author
+"""
+from django.db.models import Manager
+from django.db.models.query import QuerySet
+
+from seed.lib.mcm.utils import batch
+
+# Number of ids in each of the UPDATE statements of a state transition
+STATE_TRANSITION_BATCH_SIZE = 5000
+
+
+class StateQuerySet(QuerySet):
+
+    def transition(self, ids, data_state=None, merge_state=None):
+        """Set the data_state and/or merge_state of the states with the given ids.
+
+        The states are updated in place with one UPDATE per batch of ids, so the rows (and
+        their extra_data) are neither loaded nor rewritten.
+
+        :param ids: iterable of state ids
+        :param data_state: int, new data state, or None to leave it unchanged
+        :param merge_state: int, new merge state, or None to leave it unchanged
+        :returns: int, number of states updated
+        """
+        values = {}
+        if data_state is not None:
+            values['data_state'] = data_state
+        if merge_state is not None:
+            values['merge_state'] = merge_state
+
+        if not values:
+            return 0
+
+        # Sort the ids so that concurrent transitions lock the rows in the same order.
+        updated = 0
+        for ids_batch in batch(sorted(set(ids)), STATE_TRANSITION_BATCH_SIZE):
+            updated += self.filter(pk__in=ids_batch).update(**values)
+
+        return updated
+
+
+class StateManager(Manager):
+
+    def get_queryset(self):
+        return StateQuerySet(model=self.model, using=self._db)
+
+    def transition(self, ids, data_state=None, merge_state=None):
+        return self.get_queryset().transition(ids, data_state=data_state, merge_state=merge_state)
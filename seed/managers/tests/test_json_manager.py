@@ -6,7 +6,7 @@
 """
 from django.test import TestCase
 
-from seed.models import BuildingSnapshot
+from seed.models import BuildingSnapshot, FLOAT, Unit
 
 
 class TestJsonManager(TestCase):
@@ -48,9 +48,9 @@ class TestJsonManager(TestCase):
             'counter', order_by='counter'
         ))
 
-        self.assertEqual(buildings3[0].extra_data.get('counter'), None)
-        self.assertEqual(buildings3[1].extra_data['counter'], '10')
-        self.assertEqual(buildings3[2].extra_data['counter'], '1001')
+        self.assertEqual(buildings3[0].extra_data['counter'], '10')
+        self.assertEqual(buildings3[1].extra_data['counter'], '1001')
+        self.assertEqual(buildings3[2].extra_data.get('counter'), None)
 
         # Now test reverse sort on alpha numeric sorting
         buildings4 = list(BuildingSnapshot.objects.all().json_order_by(
@@ -60,3 +60,67 @@ class TestJsonManager(TestCase):
         self.assertEqual(buildings4[0].extra_data['counter'], '1001')
         self.assertEqual(buildings4[1].extra_data['counter'], '10')
         self.assertEqual(buildings4[2].extra_data.get('counter'), None)
+
+    def test_order_by_unit_type(self):
+        """Test that the values are cast to numbers for the numeric units."""
+        BuildingSnapshot.objects.create(extra_data={'ratio': '9'})
+        BuildingSnapshot.objects.create(extra_data={'ratio': '10.5'})
+        BuildingSnapshot.objects.create(extra_data={'ratio': 'n/a'})
+        float_unit = Unit.objects.create(unit_name='ratio', unit_type=FLOAT)
+
+        buildings = BuildingSnapshot.objects.all().json_order_by(
+            'ratio', order_by='ratio', unit=float_unit
+        )
+        self.assertEqual(
+            [b.extra_data['ratio'] for b in buildings], [0.43, '9', '10.5', 'n/a']
+        )
+
+        # the text values are compared as text
+        buildings = BuildingSnapshot.objects.all().json_order_by(
+            'ratio', order_by='ratio', order_by_rev=True
+        )
+        self.assertEqual(
+            [b.extra_data['ratio'] for b in buildings], [0.43, 'n/a', '9', '10.5']
+        )
+
+    def test_order_by_is_a_queryset(self):
+        """Test that the ordering composes with the filters and slicing."""
+        for ratio in [0.5, 0.1, 0.3]:
+            BuildingSnapshot.objects.create(source_type=3, extra_data={'ratio': ratio})
+
+        buildings = BuildingSnapshot.objects.all().json_order_by(
+            'ratio', order_by='ratio'
+        )
+        page = buildings.filter(source_type=3)[:2]
+        self.assertEqual([b.extra_data['ratio'] for b in page], [0.1, 0.3])
+        self.assertEqual(buildings.count(), 4)
+
+
+class TestJsonOrderByLargeQueryset(TestCase):
+    """Sorting a large organization only loads the requested page."""
+    NUM_ROWS = 100000
+    PAGE_SIZE = 25
+
+    def test_order_by_first_page(self):
+        ratios = []
+        buildings = []
+        for i in range(self.NUM_ROWS):
+            if i % 10 == 0:
+                extra_data = {}
+            else:
+                ratio = (i * 7919) % self.NUM_ROWS / 1000.0
+                ratios.append(ratio)
+                extra_data = {'ratio': ratio}
+            buildings.append(BuildingSnapshot(extra_data=extra_data))
+        BuildingSnapshot.objects.bulk_create(buildings, batch_size=5000)
+
+        float_unit = Unit.objects.create(unit_name='ratio', unit_type=FLOAT)
+        with self.assertNumQueries(1):
+            page = list(BuildingSnapshot.objects.json_order_by(
+                'ratio', order_by='ratio', order_by_rev=True, unit=float_unit
+            )[:self.PAGE_SIZE])
+
+        self.assertEqual(
+            [b.extra_data['ratio'] for b in page],
+            sorted(ratios, reverse=True)[:self.PAGE_SIZE]
+        )
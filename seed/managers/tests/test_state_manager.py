@@ -0,0 +1,77 @@
+# !/usr/bin/env python
+# encoding: utf-8
+"""
+:copyright (c) 2014 - 2016, The Regents of the University of California, through Lawrence Berkeley National Laboratory (subject to receipt of any required approvals from the U.S. Department of Energy) and contributors. All rights reserved.  # NOQA
+:author
+"""
+from django.test import TestCase
+
+from seed.lib.superperms.orgs.models import Organization
+from seed.models import (
+    DATA_STATE_IMPORT,
+    DATA_STATE_MATCHING,
+    MERGE_STATE_MERGED,
+    MERGE_STATE_NEW,
+    MERGE_STATE_UNKNOWN,
+    PropertyState,
+    TaxLotState,
+)
+
+
+class TestStateManager(TestCase):
+
+    def setUp(self):
+        self.org = Organization.objects.create(name='my org')
+        self.states = [
+            PropertyState.objects.create(
+                organization=self.org,
+                data_state=DATA_STATE_IMPORT,
+                extra_data={'note': 'state {}'.format(i)},
+            ) for i in range(5)
+        ]
+
+    def test_transition(self):
+        ids = [s.pk for s in self.states[:3]]
+        extra_data = {s.pk: s.extra_data for s in self.states}
+        updated = PropertyState.objects.transition(
+            ids + ids, data_state=DATA_STATE_MATCHING, merge_state=MERGE_STATE_NEW
+        )
+        self.assertEqual(updated, 3)
+
+        for state in PropertyState.objects.filter(pk__in=ids):
+            self.assertEqual(state.data_state, DATA_STATE_MATCHING)
+            self.assertEqual(state.merge_state, MERGE_STATE_NEW)
+            # the extra data is not rewritten
+            self.assertEqual(state.extra_data, extra_data[state.pk])
+
+        # the other states are untouched
+        for state in PropertyState.objects.exclude(pk__in=ids):
+            self.assertEqual(state.data_state, DATA_STATE_IMPORT)
+            self.assertEqual(state.merge_state, MERGE_STATE_UNKNOWN)
+
+    def test_transition_only_given_state(self):
+        ids = [s.pk for s in self.states]
+        PropertyState.objects.transition(ids, merge_state=MERGE_STATE_MERGED)
+
+        for state in PropertyState.objects.filter(pk__in=ids):
+            self.assertEqual(state.data_state, DATA_STATE_IMPORT)
+            self.assertEqual(state.merge_state, MERGE_STATE_MERGED)
+
+        self.assertEqual(PropertyState.objects.transition(ids), 0)
+        self.assertEqual(PropertyState.objects.transition([], data_state=DATA_STATE_MATCHING), 0)
+
+    def test_transition_queryset(self):
+        ids = [s.pk for s in self.states]
+        updated = PropertyState.objects.filter(pk__in=ids[:2]).transition(
+            ids, data_state=DATA_STATE_MATCHING
+        )
+        self.assertEqual(updated, 2)
+        self.assertEqual(
+            PropertyState.objects.filter(data_state=DATA_STATE_MATCHING).count(), 2
+        )
+
+    def test_taxlot_transition(self):
+        tl = TaxLotState.objects.create(organization=self.org, data_state=DATA_STATE_IMPORT)
+        TaxLotState.objects.transition([tl.pk], data_state=DATA_STATE_MATCHING)
+        tl.refresh_from_db()
+        self.assertEqual(tl.data_state, DATA_STATE_MATCHING)
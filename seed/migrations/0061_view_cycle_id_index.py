@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('seed', '0060_column_import_file'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='propertyview',
+            index_together=set([('cycle', 'id')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='taxlotview',
+            index_together=set([('cycle', 'id')]),
+        ),
+    ]
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import logging
+
+from django.db import migrations, transaction, DatabaseError
+
+_log = logging.getLogger(__name__)
+
+# Same as seed.utils.search_index.SEARCH_FIELDS when the migration was written
+SEARCH_FIELDS = {
+    'seed_propertystate': [
+        'pm_parent_property_id',
+        'jurisdiction_property_id',
+        'pm_property_id',
+        'address_line_1',
+        'property_name',
+    ],
+    'seed_taxlotstate': [
+        'jurisdiction_tax_lot_id',
+        'address_line_1',
+        'block_number',
+    ],
+}
+
+
+def forwards(apps, schema_editor):
+    cursor = schema_editor.connection.cursor()
+
+    # The extension needs the CREATE privilege on the database. Without it, the search falls back
+    # to sequential scans, see seed.utils.search_index.trigram_available.
+    try:
+        with transaction.atomic(using=schema_editor.connection.alias):
+            cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    except DatabaseError as e:
+        _log.warning('pg_trgm is not available, the search indexes are not created: {}'.format(e))
+        return
+
+    for table, fields in SEARCH_FIELDS.items():
+        for field in fields:
+            cursor.execute(
+                'CREATE INDEX "{0}_{1}_trgm" ON "{0}" '
+                'USING gin ((UPPER("{1}"::text)) gin_trgm_ops)'.format(table, field)
+            )
+
+
+def backwards(apps, schema_editor):
+    cursor = schema_editor.connection.cursor()
+    for table, fields in SEARCH_FIELDS.items():
+        for field in fields:
+            cursor.execute('DROP INDEX IF EXISTS "{}_{}_trgm"'.format(table, field))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('seed', '0061_view_cycle_id_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(forwards, backwards),
+    ]
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+# Same as seed.utils.timeseries when the migration was written
+ROLLUP_SQL = """
+    INSERT INTO seed_timeseriesrollup
+        (meter_id, resolution, period_start, count, reading_sum, reading_min, reading_max,
+         cost_sum)
+    SELECT meter_id, %(resolution)s, period_start, COUNT(reading), SUM(reading), MIN(reading),
+           MAX(reading), SUM(cost)
+    FROM (
+        SELECT meter_id, reading, cost,
+               date_trunc(%(resolution)s, begin_time AT TIME ZONE %(tz)s) AT TIME ZONE %(tz)s
+               AS period_start
+        FROM seed_timeseries
+        WHERE meter_id IS NOT NULL AND begin_time IS NOT NULL
+    ) readings
+    GROUP BY meter_id, period_start
+"""
+
+
+def forwards(apps, schema_editor):
+    cursor = schema_editor.connection.cursor()
+    for resolution in ['day', 'month']:
+        cursor.execute(ROLLUP_SQL, {'resolution': resolution, 'tz': settings.TIME_ZONE})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('seed', '0062_search_index'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='timeseries',
+            index_together=set([('meter', 'begin_time')]),
+        ),
+        migrations.CreateModel(
+            name='TimeSeriesRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resolution', models.CharField(choices=[('day', 'Day'), ('month', 'Month')], max_length=5)),
+                ('period_start', models.DateTimeField()),
+                ('count', models.IntegerField(default=0)),
+                ('reading_sum', models.FloatField(null=True)),
+                ('reading_min', models.FloatField(null=True)),
+                ('reading_max', models.FloatField(null=True)),
+                ('cost_sum', models.DecimalField(decimal_places=4, max_digits=15, null=True)),
+                ('meter', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeseries_rollups', to='seed.Meter')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='timeseriesrollup',
+            unique_together=set([('meter', 'resolution', 'period_start')]),
+        ),
+        migrations.RunPython(forwards, migrations.RunPython.noop),
+    ]
@@ -7,10 +7,11 @@
 
 import copy
 import logging
-from collections import OrderedDict
+import uuid
+from collections import OrderedDict, defaultdict
 
-from django.db import models
-from django.db.models import Q
+from django.db import connection, models, transaction
+from django.db.models.signals import post_delete, post_save
 from django.utils.translation import ugettext_lazy as _
 
 from seed.landing.models import SEEDUser as User
@@ -21,12 +22,48 @@ from seed.models.models import (
     Unit,
     SEED_DATA_SOURCES,
 )
+from seed.utils.cache import delete_cache_many, get_cache_raw, set_cache_raw
 from seed.utils.constants import VIEW_COLUMNS_PROPERTY
+from seed.utils.inventory import rename_extra_data_key
 
 INVENTORY_MAP = {'property': 'PropertyState', 'taxlot': 'TaxLotState'}
 INVENTORY_MAP_PREPEND = {'property': 'tax', 'taxlot': 'property'}
 _log = logging.getLogger(__name__)
 
+# First key of the PostgreSQL advisory lock taken while creating the columns of an organization,
+# the second key is the organization id
+COLUMN_LOCK_NAMESPACE = 1263
+
+# Lower case names of the database fields of each state table, see _get_db_field_names
+_db_field_names = {}
+
+# Database columns of each inventory type as returned by Column.retrieve_all
+_inventory_db_columns = {}
+
+
+def _get_db_field_names(table_name):
+    """
+    Return the lower case names of the database fields of the table, the
+    fields that MappingData.find_column finds.
+
+    :param table_name: str, PropertyState or TaxLotState
+    :return: set
+    """
+    if not _db_field_names:
+        for column in MappingData().data:
+            _db_field_names.setdefault(column['table'].lower(), set()).add(column['name'].lower())
+    return _db_field_names.get(table_name.lower(), set())
+
+
+def _lock_organization_columns(org_id):
+    """
+    Serialize the creation of the columns of the organization until the end of
+    the transaction, so concurrent imports do not create duplicate columns.
+    """
+    if connection.vendor == 'postgresql':
+        cursor = connection.cursor()
+        cursor.execute('SELECT pg_advisory_xact_lock(%s, %s)', [COLUMN_LOCK_NAMESPACE, org_id or 0])
+
 
 def get_column_mapping(raw_column, organization, attr_name='column_mapped'):
     """Find the ColumnMapping objects that exist in the database from a raw_column
@@ -338,61 +375,69 @@ class Column(models.Model):
         """Save unique column names for extra_data in this organization.
 
         This is a record of all the extra_data keys we've ever seen
-        for a particular organization.
+        for a particular organization. The keys are compared with the column
+        registry of the organization and only the missing columns are created,
+        in a single statement.
 
         :param model_obj: model_obj instance (either PropertyState or TaxLotState).
         """
+        org_id = model_obj.organization_id
+        table_name = model_obj.__class__.__name__
+        db_fields = _get_db_field_names(table_name)
 
-        md = MappingData()
+        # yes i am a db column, thus I am not extra_data
+        columns = {
+            (table_name, key[:511], key.lower() not in db_fields) for key in model_obj.extra_data
+        }
+        missing = columns - Column._column_registry(org_id)
+        if not missing:
+            return
+
+        with transaction.atomic():
+            _lock_organization_columns(org_id)
+
+            # another import may have created some of the columns since the registry was loaded
+            existing = set(Column.objects.filter(
+                organization_id=org_id,
+                table_name=table_name,
+                column_name__in=[column_name for _, column_name, _ in missing],
+            ).values_list('table_name', 'column_name', 'is_extra_data'))
+
+            Column.objects.bulk_create([
+                Column(
+                    organization_id=org_id,
+                    table_name=table_name,
+                    column_name=column_name,
+                    is_extra_data=is_extra_data,
+                )
+                for _, column_name, is_extra_data in sorted(missing - existing)
+            ])
 
-        for key in model_obj.extra_data:
-            # Ascertain if our key is ``extra_data`` or not.
+        # bulk_create does not send the post_save signal
+        clear_column_caches(org_id)
 
-            # This is doing way to much work to find if the fields are extra data, especially
-            # since that has been asked probably many times before.
-            db_field = md.find_column(model_obj.__class__.__name__, key)
-            is_extra_data = False if db_field else True  # yes i am a db column, thus I am not extra_data
+    @staticmethod
+    def _column_registry(org_id):
+        """
+        Return the (table_name, column_name, is_extra_data) of all the columns
+        of the organization. The registry is loaded in one query and cached
+        until a column of the organization is saved or deleted.
 
-            # handle the special edge-case where an old organization may have duplicate columns
-            # in the database. We should make this a migration in the future and put a validation
-            # in the db.
-            for i in range(0, 5):
-                while True:
-                    try:
-                        Column.objects.get_or_create(
-                            column_name=key[:511],
-                            is_extra_data=is_extra_data,
-                            organization=model_obj.organization,
-                            table_name=model_obj.__class__.__name__
-                        )
-                    except Column.MultipleObjectsReturned:
-                        _log.debug(
-                            "Column.MultipleObjectsReturned for {} in save_column_names".format(
-                                key[:511]))
-
-                        columns = Column.objects.filter(column_name=key[:511],
-                                                        is_extra_data=is_extra_data,
-                                                        organization=model_obj.organization,
-                                                        table_name=model_obj.__class__.__name__)
-                        for c in columns:
-                            if not ColumnMapping.objects.filter(
-                                    Q(column_raw=c) | Q(column_mapped=c)).exists():
-                                _log.debug("Deleting column object {}".format(c.column_name))
-                                c.delete()
-
-                        # Check if there are more than one column still
-                        if Column.objects.filter(
-                                column_name=key[:511],
-                                is_extra_data=is_extra_data,
-                                organization=model_obj.organization,
-                                table_name=model_obj.__class__.__name__).count() > 1:
-                            raise Exception(
-                                "Could not fix duplicate columns for {}. Contact dev team").format(
-                                key)
-
-                        continue
-
-                    break
+        :param org_id: int, organization id
+        :return: set
+        """
+        cache_key = Column._column_registry_key(org_id)
+        registry = get_cache_raw(cache_key)
+        if registry is None:
+            registry = set(Column.objects.filter(organization_id=org_id).values_list(
+                'table_name', 'column_name', 'is_extra_data'))
+            set_cache_raw(cache_key, registry)
+
+        return registry
+
+    @staticmethod
+    def _column_registry_key(org_id):
+        return 'SEED:column_registry:{}'.format(org_id)
 
     def to_dict(self):
         """
@@ -499,6 +544,69 @@ class Column(models.Model):
 
         return list(fields)
 
+    @staticmethod
+    def retrieve_extra_data_rename_map(org_id):
+        """
+        Return the name under which each extra data column of the organization is returned in
+        the inventory lists. Extra data keys that collide with the id or with database fields
+        are suffixed with '_extra'. The map is cached per organization and cleared when a column
+        of the organization is saved or deleted.
+
+        { "address_line_1": "address_line_1_extra", "Wookiee": "Wookiee", ... }
+        :param org_id: int, organization id
+        :return: dict
+        """
+        cache_key = Column._extra_data_rename_map_key(org_id)
+        rename_map = get_cache_raw(cache_key)
+        if rename_map is None:
+            db_columns = set(Column.retrieve_db_fields())
+            extra_data_columns = Column.objects.filter(
+                organization_id=org_id, is_extra_data=True
+            ).values_list('column_name', flat=True).distinct()
+
+            rename_map = {c: rename_extra_data_key(c, db_columns) for c in extra_data_columns}
+            set_cache_raw(cache_key, rename_map)
+
+        return rename_map
+
+    @staticmethod
+    def _extra_data_rename_map_key(org_id):
+        return 'SEED:extra_data_rename_map:{}'.format(org_id)
+
+    @staticmethod
+    def _retrieve_inventory_db_columns(inventory_type):
+        """
+        Return the database columns of VIEW_COLUMNS_PROPERTY as listed for the
+        inventory type. They are computed once per process and copied.
+
+        :param inventory_type: Inventory Type (property|taxlot)
+        :return: list of dicts
+        """
+        if inventory_type not in _inventory_db_columns:
+            # Grab the default columns and their details
+            columns = Column._retrieve_db_columns()
+
+            # Clean up the columns
+            for c in columns:
+                if c['table'] == INVENTORY_MAP[inventory_type]:
+                    c['related'] = False
+                    if c.get('pinIfNative', False):
+                        c['pinnedLeft'] = True
+                else:
+                    c['related'] = True
+                    # For now, a related field has a prepended value to make the columns unique.
+                    if c.get('duplicateNameInOtherTable', False):
+                        c['name'] = "{}_{}".format(INVENTORY_MAP_PREPEND[inventory_type], c['name'])
+
+                # Remove some keys that are not needed for the API
+                c.pop('pinIfNative', None)
+                c.pop('duplicateNameInOtherTable', None)
+                c.pop('dbField', None)
+
+            _inventory_db_columns[inventory_type] = columns
+
+        return copy.deepcopy(_inventory_db_columns[inventory_type])
+
     @staticmethod
     def retrieve_all(org_id, inventory_type):
         """
@@ -510,52 +618,36 @@ class Column(models.Model):
         # Note: this method should retrieve the columns from MappingData and then have a method
         # to return for JavaScript (i.e. UI-Grid) or native (standard JSON)
 
+        The columns are cached per organization and inventory type until a
+        Column or ColumnMapping of the organization changes.
+
         :param org_id: Organization ID
         :param inventory_type: Inventory Type (property|taxlot)
 
         :return: dict
         """
+        cache_key = Column._retrieve_all_key(org_id, inventory_type)
+        columns = get_cache_raw(cache_key)
+        if columns is not None:
+            return columns
 
-        # Grab the default columns and their details
-        columns = Column._retrieve_db_columns()
+        columns = Column._retrieve_inventory_db_columns(inventory_type)
 
-        # Clean up the columns
+        # tables of the columns of each name, to find the names that are already used by another
+        # table without scanning the columns
+        tables_by_name = defaultdict(set)
         for c in columns:
-            if c['table'] == INVENTORY_MAP[inventory_type]:
-                c['related'] = False
-                if c.get('pinIfNative', False):
-                    c['pinnedLeft'] = True
-            else:
-                c['related'] = True
-                # For now, a related field has a prepended value to make the columns unique.
-                if c.get('duplicateNameInOtherTable', False):
-                    c['name'] = "{}_{}".format(INVENTORY_MAP_PREPEND[inventory_type], c['name'])
-
-            # Remove some keys that are not needed for the API
-            try:
-                c.pop('pinIfNative')
-            except KeyError:
-                pass
-
-            try:
-                c.pop('duplicateNameInOtherTable')
-            except KeyError:
-                pass
-
-            try:
-                c.pop('dbField')
-            except KeyError:
-                pass
+            tables_by_name[c['name']].add(c['table'])
 
         # Add in all the extra columns
         # don't return columns that have no table_name as these are the columns of the import files
         extra_data_columns = Column.objects.filter(
             organization_id=org_id, is_extra_data=True
-        ).exclude(table_name='').exclude(table_name=None)
+        ).exclude(table_name='').exclude(table_name=None).order_by('pk').values_list(
+            'column_name', 'table_name')
 
-        for edc in extra_data_columns:
-            name = edc.column_name
-            table = edc.table_name
+        for column_name, table in extra_data_columns:
+            name = column_name
 
             # MAKE NOTE ABOUT HOW IMPORTANT THIS IN
             if name == 'id':
@@ -564,23 +656,23 @@ class Column(models.Model):
             # check if the column name is already defined in the list. For example, gross_floor_area
             # is a core field, but can be an extra field in taxlot, meaning that the other one
             # needs to be tagged something else.
-            # for col in columns:
 
             # add _extra if the column is already in the list and it is not the one of
-            while any(col['name'] == name and col['table'] != table for col in columns):
+            while tables_by_name.get(name, set()) - {table}:
                 name += '_extra'
 
             # TODO: need to check if the column name is already in the list and if it is then
             # overwrite the data
 
-            display_name = edc.column_name.title().replace('_', ' ')
+            tables_by_name[name].add(table)
+            display_name = column_name.title().replace('_', ' ')
             columns.append(
                 {
                     'name': name,
-                    'table': edc.table_name,
+                    'table': table,
                     'displayName': display_name,
                     # 'dataType': 'string',  # TODO: how to check dataTypes on extra_data!
-                    'related': edc.table_name != INVENTORY_MAP[inventory_type],
+                    'related': table != INVENTORY_MAP[inventory_type],
                     'extraData': True
                 }
             )
@@ -593,8 +685,32 @@ class Column(models.Model):
             else:
                 uniq.add(c['name'])
 
+        set_cache_raw(cache_key, columns)
         return columns
 
+    @staticmethod
+    def _retrieve_all_key(org_id, inventory_type):
+        return 'SEED:retrieve_all:{}:{}:{}'.format(
+            org_id, inventory_type, Column._columns_version(org_id))
+
+    @staticmethod
+    def _columns_version(org_id):
+        """
+        Return the version of the columns of the organization, which is part of
+        the keys of the cached column lists. Changing the version invalidates
+        all of them at once.
+        """
+        version_key = Column._columns_version_key(org_id)
+        version = get_cache_raw(version_key)
+        if version is None:
+            version = uuid.uuid4().hex
+            set_cache_raw(version_key, version)
+        return version
+
+    @staticmethod
+    def _columns_version_key(org_id):
+        return 'SEED:columns_version:{}'.format(org_id)
+
 
 class ColumnMapping(models.Model):
     """Stores previous user-defined column mapping.
@@ -800,3 +916,34 @@ class ColumnMapping(models.Model):
         """
         count, _ = ColumnMapping.objects.filter(super_organization=organization).delete()
         return count
+
+
+def clear_column_caches(org_id):
+    """
+    Clear the cached column registry, extra data rename map and column lists
+    of the organization
+    """
+    delete_cache_many([
+        Column._column_registry_key(org_id),
+        Column._extra_data_rename_map_key(org_id),
+        # the column lists are cached under the version
+        Column._columns_version_key(org_id),
+    ])
+
+
+def clear_column_caches_of_column(sender, instance, **kwargs):
+    """Clear the column caches of the organization of the saved or deleted column"""
+    if instance.organization_id:
+        clear_column_caches(instance.organization_id)
+
+
+def clear_column_caches_of_column_mapping(sender, instance, **kwargs):
+    """Clear the column caches of the organization of the saved or deleted column mapping"""
+    if instance.super_organization_id:
+        clear_column_caches(instance.super_organization_id)
+
+
+post_save.connect(clear_column_caches_of_column, sender=Column)
+post_delete.connect(clear_column_caches_of_column, sender=Column)
+post_save.connect(clear_column_caches_of_column_mapping, sender=ColumnMapping)
+post_delete.connect(clear_column_caches_of_column_mapping, sender=ColumnMapping)
@@ -514,3 +514,32 @@ class TimeSeries(models.Model):
     meter = models.ForeignKey(
         Meter, related_name='timeseries_data', null=True, blank=True
     )
+
+    class Meta:
+        index_together = [['meter', 'begin_time']]
+
+
+class TimeSeriesRollup(models.Model):
+    """
+    Aggregates of the TimeSeries of a meter per day or month, maintained by
+    seed.utils.timeseries.update_rollups.
+    """
+    DAY = 'day'
+    MONTH = 'month'
+    RESOLUTION_CHOICES = (
+        (DAY, 'Day'),
+        (MONTH, 'Month'),
+    )
+
+    meter = models.ForeignKey(Meter, related_name='timeseries_rollups')
+    resolution = models.CharField(max_length=5, choices=RESOLUTION_CHOICES)
+    period_start = models.DateTimeField()
+    # number of readings, the readings that are null are only part of the cost
+    count = models.IntegerField(default=0)
+    reading_sum = models.FloatField(null=True)
+    reading_min = models.FloatField(null=True)
+    reading_max = models.FloatField(null=True)
+    cost_sum = models.DecimalField(max_digits=15, decimal_places=4, null=True)
+
+    class Meta:
+        unique_together = ('meter', 'resolution', 'period_start')
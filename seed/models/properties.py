@@ -16,6 +16,7 @@ from auditlog import AUDIT_IMPORT
 from auditlog import DATA_UPDATE_TYPE
 from seed.data_importer.models import ImportFile
 from seed.lib.superperms.orgs.models import Organization
+from seed.managers.state import StateManager
 from seed.models import (
     Cycle,
     StatusLabel,
@@ -130,6 +131,8 @@ class PropertyState(models.Model):
 
     extra_data = JsonField(default={}, blank=True)
 
+    objects = StateManager()
+
     def promote(self, cycle):
         """
         Promote the PropertyState to the view table for the given cycle
@@ -251,12 +254,24 @@ class PropertyState(models.Model):
         #     return False
 
         # Calculate and save the normalized address
-        if self.address_line_1 is not None:
-            self.normalized_address = normalize_address_str(self.address_line_1)
-        else:
+        if self.address_line_1 is None:
             self.normalized_address = None
+        elif (not hasattr(self, '_loaded_address_line_1') or
+              self.address_line_1 != self._loaded_address_line_1):
+            # only when the address changed since the state was loaded
+            self.normalized_address = normalize_address_str(self.address_line_1)
+
+        result = super(PropertyState, self).save(*args, **kwargs)
+        self._loaded_address_line_1 = self.address_line_1
+        return result
 
-        return super(PropertyState, self).save(*args, **kwargs)
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super(PropertyState, cls).from_db(db, field_names, values)
+        # keep the loaded address to know in save whether it changed
+        if 'address_line_1' in field_names:
+            instance._loaded_address_line_1 = values[list(field_names).index('address_line_1')]
+        return instance
 
 
 class PropertyView(models.Model):
@@ -273,6 +288,8 @@ class PropertyView(models.Model):
 
     class Meta:
         unique_together = ('property', 'cycle',)
+        # keyset pagination of the inventory lists
+        index_together = [['cycle', 'id']]
 
     def __init__(self, *args, **kwargs):
         self._import_filename = kwargs.pop('import_filename', None)
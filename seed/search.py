@@ -9,7 +9,6 @@ Search methods pertaining to buildings.
 """
 import operator
 import json
-import re
 import logging
 
 from django.db.models import Q
@@ -26,6 +25,7 @@ from .models import (
 )
 from .utils.mapping import get_mappable_types
 from .utils import search as search_utils
+from .utils import search_index
 from seed.public.models import PUBLIC
 from functools import reduce
 
@@ -86,12 +86,7 @@ def search_properties(q, fieldnames=None, queryset=None):
     if queryset is None:
         return PropertyState.objects.none()
     if fieldnames is None:
-        fieldnames = [
-            'pm_parent_property_id'
-            'jurisdiction_property_id'
-            'address_line_1',
-            'property_name',
-        ]
+        fieldnames = search_index.SEARCH_FIELDS['property']
     return _search(q, fieldnames, queryset)
 
 
@@ -99,11 +94,7 @@ def search_taxlots(q, fieldnames=None, queryset=None):
     if queryset is None:
         return TaxLotState.objects.none()
     if fieldnames is None:
-        fieldnames = [
-            'jurisdiction_tax_lot_id',
-            'address'
-            'block_number'
-        ]
+        fieldnames = search_index.SEARCH_FIELDS['taxlot']
     return _search(q, fieldnames, queryset)
 
 
@@ -222,127 +213,37 @@ def filter_other_params(queryset, other_params, db_columns):
     query params and deal with ranges. Ranges should be passed in as '<field name>__lte' or '<field name>__gte'
     e.g. other_params = {'gross_floor_area__lte': 50000}
 
+    The params are parsed once by seed.utils.search.compile_filters, which caches the result, and applied as a
+    single filter on both the database fields and the extra_data keys.
+
     :param Django Queryset queryset: queryset to be filtered
     :param dict other_params: dictionary to be parsed and applied to filter.
     :param dict db_columns: list of column names, extra_data blob outside these
     :returns: Django Queryset:
     """
+    nodes = search_utils.compile_filters(other_params, db_columns)
+    table = queryset.model._meta.db_table
 
-    # Build query as Q objects so we can AND and OR.
-    query_filters = Q()
-    for k, v in other_params.iteritems():
-        in_columns = search_utils.is_column(k, db_columns)
-        if in_columns and k != 'q' and v is not None and v != '' and v != []:
-            exact_match = search_utils.is_exact_match(v)
-            empty_match = search_utils.is_empty_match(v)
-            not_empty_match = search_utils.is_not_empty_match(v)
-            case_insensitive_match = search_utils.is_case_insensitive_match(v)
-            is_numeric_expression = search_utils.is_numeric_expression(v)
-            is_string_expression = search_utils.is_string_expression(v)
-            exclude_filter = search_utils.is_exclude_filter(v)
-            exact_exclude_filter = search_utils.is_exact_exclude_filter(v)
-
-            if exact_match:
-                query_filters &= Q(**{"%s__exact" % k: exact_match.group(2)})
-            elif case_insensitive_match:
-                query_filters &= Q(**{"%s__iexact" % k: case_insensitive_match.group(2)})
-            elif empty_match:
-                query_filters &= Q(**{"%s__exact" %
-                                      k: ''}) | Q(**{"%s__isnull" %
-                                                     k: True})
-            elif not_empty_match:
-                query_filters &= ~Q(**{"%s__exact" %
-                                       k: ''}) & Q(**{"%s__isnull" %
-                                                      k: False})
-            elif is_numeric_expression:
-                parts = search_utils.NUMERIC_EXPRESSION_REGEX.findall(v)
-                query_filters &= search_utils.parse_expression(k, parts)
-            elif is_string_expression:
-                parts = search_utils.STRING_EXPRESSION_REGEX.findall(v)
-                query_filters &= search_utils.parse_expression(k, parts)
-            elif exclude_filter:
-                query_filters &= ~Q(**{"%s__icontains" % k: exclude_filter.group(1)})
-            elif exact_exclude_filter:
-                query_filters &= ~Q(**{"%s__exact" % k: exact_exclude_filter.group(2)})
-            elif ('__lt' in k or
-                  '__lte' in k or
-                  '__gt' in k or
-                  '__gte' in k):
-
-                # Check if this is ISO8601 from a input date. Shorten to YYYY-MM-DD
-                if search_utils.is_date_field(k) and re.match(r'^\d{4}-\d{2}-\d{2}[ T]\d{2}:\d{2}:\d{2}.\d{3}\w$', v):
-                    v = re.search(r'^\d{4}-\d{2}-\d{2}', v).group()
-
-                query_filters &= Q(**{"%s" % k: v})
-            elif ('__isnull' in k or
-                  k == 'import_file_id' or k == 'source_type'):
-                query_filters &= Q(**{"%s" % k: v})
-
-            elif k == 'canonical_building__labels':
-                for l in v:
-                    queryset &= queryset.filter(**{
-                        'canonical_building__labels': l
-                    })
-            else:
-                query_filters &= Q(**{"%s__icontains" % k: v})
+    for node in nodes:
+        if node.kind == search_utils.FILTER_LABELS:
+            for l in node.value:
+                queryset &= queryset.filter(**{
+                    'canonical_building__labels': l
+                })
 
     try:
-        queryset = queryset.filter(query_filters)
+        queryset = queryset.filter(search_utils.filters_q(nodes, table))
     except ValueError:
         # Return nothing if invalid queries happen. Most likely
         # this is caused by using operators in the wrong fields.
         queryset = queryset.none()
 
-    # handle extra_data with json_query
-    for k, v in other_params.iteritems():
-        if (not search_utils.is_column(k, db_columns)) and k != 'q' and v:
-
-            exact_match = search_utils.is_exact_match(v)
-            empty_match = search_utils.is_empty_match(v)
-            not_empty_match = search_utils.is_not_empty_match(v)
-            case_insensitive_match = search_utils.is_case_insensitive_match(v)
-            exclude_filter = search_utils.is_exclude_filter(v)
-            exact_exclude_filter = search_utils.is_exact_exclude_filter(v)
-
-            if empty_match:
-                # Filter for records that DO NOT contain this field OR
-                # contain a blank value for this field.
-                queryset = queryset.filter(
-                    Q(**{'extra_data__at_%s__isnull' % k: True}) |
-                    Q(**{'extra_data__at_%s' % k: ''})
-                )
-            elif not_empty_match:
-                # Only return records that have the key in extra_data, but the
-                # value is not empty.
-                queryset = queryset.filter(
-                    Q(**{'extra_data__at_%s__isnull' % k: False}) & ~Q(**{'extra_data__at_%s' % k: ''})
-                )
-            elif exclude_filter:
-                # Exclude this value
-                queryset = queryset.filter(
-                    ~Q(**{'extra_data__at_%s__icontains' % k: exclude_filter.group(1)})
-                )
-            elif exact_exclude_filter:
-                # Exclude this exact value
-                queryset = queryset.filter(
-                    ~Q(**{'extra_data__at_%s__exact' % k: exact_exclude_filter.group(2)})
-                )
-            elif exact_match:
-                queryset = queryset.filter(
-                    Q(**{'extra_data__at_%s__exact' % k: exact_match.group(2)})
-                )
-            elif case_insensitive_match:
-                queryset = queryset.filter(
-                    Q(**{'extra_data__at_%s__iexact' % k: case_insensitive_match.group(2)})
-                )
-            elif k.endswith(('__gt', '__gte', '__lt', '__lte')):
-                queryset = queryset.filter(
-                    Q(**{'extra_data__at_%s' % k: v})
-                )
-            else:
-                queryset = queryset.filter(
-                    Q(**{'extra_data__at_%s__icontains' % k: v})
-                )
+    # count the keys matched on their text to index the most used ones, see
+    # the create_search_indexes command
+    search_index.record_extra_data_filters(table, [
+        node.key for node in nodes
+        if not node.in_columns and node.kind in search_utils.TEXT_FILTERS
+    ])
     return queryset
 
 
@@ -717,7 +618,9 @@ def orchestrate_search_filter_sort(params, user, skip_sort=False):
 
 
 def get_inventory_fieldnames(inventory_type):
-    """returns a list of field names that will be searched against
+    """returns a list of field names that will be searched against. The
+    fields of the states of the views have trigram indexes, see
+    seed.utils.search_index
     """
     return {
         'property': [
@@ -725,9 +628,23 @@ def get_inventory_fieldnames(inventory_type):
             'jurisdiction_property_identifier'
         ],
         'taxlot': ['jurisdiction_taxlot_id', 'address'],
+        'property_view': [
+            'state__' + f for f in search_index.SEARCH_FIELDS['property']
+        ],
+        'taxlot_view': [
+            'state__' + f for f in search_index.SEARCH_FIELDS['taxlot']
+        ],
+    }[inventory_type]
+
+
+def get_inventory_id_fieldnames(inventory_type):
+    """returns a list of the id fields of the views that are matched exactly
+    by numeric searches
+    """
+    return {
         'property_view': ['property_id', 'cycle_id', 'state_id'],
         'taxlot_view': ['taxlot_id', 'cycle_id', 'state_id'],
-    }[inventory_type]
+    }.get(inventory_type, [])
 
 
 def search_inventory(inventory_type, q, fieldnames=None, queryset=None):
@@ -742,16 +659,21 @@ def search_inventory(inventory_type, q, fieldnames=None, queryset=None):
         'property': Property, 'property_view': PropertyView,
         'taxlot': TaxLot, 'taxlot_view': TaxLotView,
     }[inventory_type]
+    id_fieldnames = []
     if not fieldnames:
         fieldnames = get_inventory_fieldnames(inventory_type)
+        id_fieldnames = get_inventory_id_fieldnames(inventory_type)
     if queryset is None:
         queryset = Model.objects.none()
     if q == '':
         return queryset
-    qgroup = reduce(operator.or_, (
-        Q(**{fieldname + '__icontains': q}) for fieldname in fieldnames
-    ))
-    return queryset.filter(qgroup)
+    # The icontains lookups are served by the trigram indexes of the states
+    # and the ids by their foreign key indexes, rather than casting the ids
+    # to text for every view.
+    lookups = [Q(**{fieldname + '__icontains': q}) for fieldname in fieldnames]
+    if q.isdigit():
+        lookups.extend(Q(**{fieldname: int(q)}) for fieldname in id_fieldnames)
+    return queryset.filter(reduce(operator.or_, lookups))
 
 
 def create_inventory_queryset(inventory_type, orgs, exclude, order_by, other_orgs=None):
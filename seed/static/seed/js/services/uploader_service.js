@@ -12,6 +12,9 @@ angular.module('BE.seed.service.uploader', []).factory('uploader_service', [
 
     var uploader_factory = {};
 
+    // milliseconds between a progress received by check_progress_loop and its next request
+    uploader_factory.PROGRESS_INTERVAL = 2000;
+
     uploader_factory.get_AWS_creds = function () {
       return $http.get(window.BE.urls.get_AWS_creds).then(function (response) {
         return response.data;
@@ -71,6 +74,25 @@ angular.module('BE.seed.service.uploader', []).factory('uploader_service', [
         else return response.data;
       });
     };
+
+    /*
+     * wait_for_progress: waits on the server until the progress for saves, maps, and matches
+     *   differs from the last progress received
+     * @param progress_key: progress_key to grab the progress
+     * @param {obj} last_data: last progress data received, if any
+     */
+    uploader_factory.wait_for_progress = function (progress_key, last_data) {
+      last_data = last_data || {};
+      return $http.post('/api/v2/progress/wait/', {
+        progress_key: progress_key,
+        progress: last_data.progress,
+        status: last_data.status
+      }).then(function (response) {
+        if (response.data.status === 'error') return $q.reject(response);
+        else return response.data;
+      });
+    };
+
     /*
      * check_progress_loop: check loop to update the progress bar
      *
@@ -81,18 +103,20 @@ angular.module('BE.seed.service.uploader', []).factory('uploader_service', [
      * @param {fn} failure_fn: function to call when progress is done and the result was not success
      * @param {obj} progress_bar_obj: progress bar object, attr 'progress'
      *   is set with the progress
+     * @param {obj} last_data: progress received by the previous check, if any
      */
-    uploader_factory.check_progress_loop = function (progress_key, offset, multiplier, success_fn, failure_fn, progress_bar_obj, debug) {
+    uploader_factory.check_progress_loop = function (progress_key, offset, multiplier, success_fn, failure_fn, progress_bar_obj, debug, last_data) {
       debug = !_.isUndefined(debug);
-      uploader_factory.check_progress(progress_key).then(function (data) {
-        $timeout(function () {
-          progress_bar_obj.progress = (data.progress * multiplier) + offset;
-          if (data.progress < 100) {
-            uploader_factory.check_progress_loop(progress_key, offset, multiplier, success_fn, failure_fn, progress_bar_obj, debug);
-          } else {
-            success_fn(data);
-          }
-        }, 750);
+      // the server holds the request until the progress changes
+      uploader_factory.wait_for_progress(progress_key, last_data).then(function (data) {
+        progress_bar_obj.progress = (data.progress * multiplier) + offset;
+        if (data.progress < 100) {
+          $timeout(function () {
+            uploader_factory.check_progress_loop(progress_key, offset, multiplier, success_fn, failure_fn, progress_bar_obj, debug, data);
+          }, uploader_factory.PROGRESS_INTERVAL);
+        } else {
+          success_fn(data);
+        }
       }, failure_fn);
     };
 
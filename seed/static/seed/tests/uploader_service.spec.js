@@ -0,0 +1,50 @@
+/**
+ * :copyright (c) 2014 - 2016, The Regents of the University of California, through Lawrence Berkeley National Laboratory (subject to receipt of any required approvals from the U.S. Department of Energy) and contributors. All rights reserved.
+ * :author
+ */
+describe('The uploader_service service', function () {
+    var uploader_service, $timeout, $rootScope;
+
+    beforeEach(function () {
+        module('BE.seed');
+        inject(function (_uploader_service_, _$timeout_, _$rootScope_, $q) {
+            uploader_service = _uploader_service_;
+            $timeout = _$timeout_;
+            $rootScope = _$rootScope_;
+
+            var progress = [10, 20, 100];
+            spyOn(uploader_service, 'wait_for_progress')
+                .andCallFake(function () {
+                    return $q.when({status: 'parsing', progress: progress.shift()});
+                });
+        });
+    });
+
+    it('waits on the server for the progress to change', function () {
+        // arrange
+        var progress_bar = {progress: 0};
+        var success = jasmine.createSpy('success');
+
+        // act
+        uploader_service.check_progress_loop('key', 0, 1, success, angular.noop, progress_bar);
+        $rootScope.$digest();
+
+        // assert
+        expect(uploader_service.wait_for_progress.callCount).toBe(1);
+        expect(uploader_service.wait_for_progress).toHaveBeenCalledWith('key', undefined);
+        expect(progress_bar.progress).toBe(10);
+
+        // the next request sends the progress received and is made after the interval
+        $timeout.flush(1999);
+        expect(uploader_service.wait_for_progress.callCount).toBe(1);
+        $timeout.flush(1);
+        expect(uploader_service.wait_for_progress.callCount).toBe(2);
+        expect(uploader_service.wait_for_progress.mostRecentCall.args[1].progress).toBe(10);
+        expect(progress_bar.progress).toBe(20);
+
+        $timeout.flush(2000);
+        expect(uploader_service.wait_for_progress.callCount).toBe(3);
+        expect(success).toHaveBeenCalled();
+        $timeout.verifyNoPendingTasks();
+    });
+});
@@ -4,7 +4,13 @@
 :copyright (c) 2014 - 2016, The Regents of the University of California, through Lawrence Berkeley National Laboratory (subject to receipt of any required approvals from the U.S. Department of Energy) and contributors. All rights reserved.  # NOQA
 :author
 """
+import mock
 from django.test import TestCase
+
+from seed.lib.superperms.orgs.models import Organization
+from seed.models import PropertyState
+from seed.test_helpers.fake import FakePropertyStateFactory
+from seed.utils import address
 from seed.utils.address import normalize_address_str
 
 
@@ -77,3 +83,68 @@ class NormalizeStreetAddressTests(TestCase):
         # Straight numbers
         ('straight numbers', 56195600100, '56195600100'),
     ]
+
+
+class NormalizeAddressCacheTests(TestCase):
+
+    def setUp(self):
+        address._normalized_address_cache.clear()
+
+    def test_normalize_address_str_cache(self):
+        with mock.patch.object(address.usaddress, 'tag', wraps=address.usaddress.tag) as tag:
+            self.assertEqual(normalize_address_str('123 Test St.'), '123 test st')
+            self.assertEqual(normalize_address_str('123 Test St.'), '123 test st')
+            self.assertEqual(tag.call_count, 1)
+
+    def test_normalize_address_str_cache_none(self):
+        # an address that normalizes to None is cached as well
+        with mock.patch.object(address, '_normalize_address_str', return_value=None) as normalize:
+            self.assertIsNone(normalize_address_str('???'))
+            self.assertIsNone(normalize_address_str('???'))
+            self.assertEqual(normalize.call_count, 1)
+
+    def test_normalize_addresses(self):
+        addresses = ['100 Main South', '123 Test St.', '100 Main South', None]
+        with mock.patch.object(address.usaddress, 'tag', wraps=address.usaddress.tag) as tag:
+            self.assertEqual(address.normalize_addresses(addresses), {
+                '100 Main South': '100 main s',
+                '123 Test St.': '123 test st',
+                None: None,
+            })
+            self.assertEqual(tag.call_count, 2)
+
+    def test_save_unchanged_address(self):
+        org = Organization.objects.create()
+        state = FakePropertyStateFactory().get_property_state(org, address_line_1='123 Test St.')
+        self.assertEqual(state.normalized_address, '123 test st')
+
+        state = PropertyState.objects.get(pk=state.pk)
+        with mock.patch('seed.models.properties.normalize_address_str') as normalize:
+            state.city = 'Denver'
+            state.save()
+            self.assertFalse(normalize.called)
+
+            state.address_line_1 = '100 Main South'
+            normalize.return_value = '100 main s'
+            state.save()
+            normalize.assert_called_once_with('100 Main South')
+
+        self.assertEqual(PropertyState.objects.get(pk=state.pk).normalized_address, '100 main s')
+
+    def test_save_unchanged_address_normalized_to_none(self):
+        org = Organization.objects.create()
+        state = FakePropertyStateFactory().get_property_state(org, address_line_1='???')
+        PropertyState.objects.filter(pk=state.pk).update(normalized_address=None)
+
+        # the address did not change, it is not normalized again
+        state = PropertyState.objects.get(pk=state.pk)
+        with mock.patch('seed.models.properties.normalize_address_str') as normalize:
+            state.save()
+            self.assertFalse(normalize.called)
+
+        # the address of a state loaded without it is normalized
+        state = PropertyState.objects.defer('address_line_1').get(pk=state.pk)
+        with mock.patch('seed.models.properties.normalize_address_str',
+                        return_value=None) as normalize:
+            state.save()
+            normalize.assert_called_once_with('???')
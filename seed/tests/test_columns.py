@@ -213,6 +213,37 @@ class TestColumns(TestCase):
         self.assertEqual(c.table_name, 'PropertyState')
         self.assertEqual(ps.extra_data['lab'], 'hawkins national laboratory')
 
+    def test_save_columns_registry(self):
+        ps = PropertyState.objects.create(
+            organization=self.fake_org,
+            extra_data={'a': 123, 'lab': 'hawkins national laboratory', 'Address_Line_1': 'x'}
+        )
+        Column.save_column_names(ps)
+        columns = Column.objects.filter(organization=self.fake_org)
+        self.assertEqual(
+            sorted(columns.values_list('column_name', 'table_name', 'is_extra_data')),
+            [
+                ('Address_Line_1', 'PropertyState', False),
+                ('a', 'PropertyState', True),
+                ('lab', 'PropertyState', True),
+            ]
+        )
+
+        # the known columns are not queried again
+        with self.assertNumQueries(0):
+            Column.save_column_names(ps)
+
+        # only the new columns are created
+        ps.extra_data['new'] = 1
+        Column.save_column_names(ps)
+        self.assertEqual(columns.count(), 4)
+        self.assertEqual(columns.filter(column_name='new').count(), 1)
+
+        # the registry is cleared when a column is deleted
+        columns.filter(column_name='lab').delete()
+        Column.save_column_names(ps)
+        self.assertEqual(columns.filter(column_name='lab').count(), 1)
+
 
 class TestColumnMapping(TestCase):
     """Test ColumnMapping utility methods."""
@@ -324,6 +355,35 @@ class TestColumnsByInventory(TestCase):
         self.assertNotIn('not extra data', [d['name'] for d in columns])
         self.assertNotIn('not mapped data', [d['name'] for d in columns])
 
+    def test_column_retrieve_all_cache(self):
+        seed_models.Column.objects.create(
+            column_name=u'Column A',
+            table_name=u'PropertyState',
+            organization=self.fake_org,
+            is_extra_data=True
+        )
+        columns = Column.retrieve_all(self.fake_org.pk, 'property')
+
+        with self.assertNumQueries(0):
+            self.assertEqual(Column.retrieve_all(self.fake_org.pk, 'property'), columns)
+
+        # the cached columns are invalidated when a column changes
+        seed_models.Column.objects.create(
+            column_name=u'Column A',
+            table_name=u'TaxLotState',
+            organization=self.fake_org,
+            is_extra_data=True
+        )
+        names = [c['name'] for c in Column.retrieve_all(self.fake_org.pk, 'property')]
+        self.assertIn(u'Column A', names)
+        self.assertIn(u'Column A_extra', names)
+
+        # and when a column mapping changes
+        Column.retrieve_all(self.fake_org.pk, 'property')
+        ColumnMapping.objects.create(super_organization=self.fake_org)
+        with self.assertNumQueries(1):
+            Column.retrieve_all(self.fake_org.pk, 'property')
+
     def test_column_retrieve_all_duplicate_error(self):
         seed_models.Column.objects.create(
             column_name=u'custom_id_1',
@@ -406,3 +466,34 @@ class TestColumnsByInventory(TestCase):
                 'space_alerts', 'state', 'use_description', 'year_built', 'year_ending']
 
         self.assertItemsEqual(data, c)
+
+    def test_column_retrieve_extra_data_rename_map(self):
+        seed_models.Column.objects.create(
+            column_name=u'Column A',
+            table_name=u'PropertyState',
+            organization=self.fake_org,
+            is_extra_data=True
+        )
+        seed_models.Column.objects.create(
+            column_name=u'address_line_1',
+            table_name=u'PropertyState',
+            organization=self.fake_org,
+            is_extra_data=True
+        )
+
+        rename_map = Column.retrieve_extra_data_rename_map(self.fake_org.pk)
+        self.assertDictEqual(rename_map, {
+            u'Column A': u'Column A',
+            u'address_line_1': u'address_line_1_extra',
+        })
+
+        # saving a column of the organization clears the cached map
+        seed_models.Column.objects.create(
+            column_name=u'id',
+            table_name=u'TaxLotState',
+            organization=self.fake_org,
+            is_extra_data=True
+        )
+        rename_map = Column.retrieve_extra_data_rename_map(self.fake_org.pk)
+        self.assertEqual(rename_map[u'id'], u'id_extra')
+        self.assertEqual(len(rename_map), 3)
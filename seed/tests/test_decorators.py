@@ -5,7 +5,11 @@
 :author
 """
 import json
+import threading
+import time
 
+import mock
+from django.core.cache import cache as django_cache
 from django.http import HttpResponse
 from django.test import TestCase, RequestFactory
 
@@ -13,7 +17,7 @@ from rest_framework.test import APIRequestFactory
 
 from seed import decorators
 from seed.utils.cache import make_key, get_cache, get_lock, increment_cache, \
-    clear_cache
+    clear_cache, set_cache, wait_for_progress, acquire_lock, release_lock, renew_lock
 
 
 class TestException(Exception):
@@ -59,6 +63,97 @@ class TestDecorators(TestCase):
         expected = 100.0
         self.assertEqual(float(get_cache(test_key)['progress']), expected)
 
+    def test_increment_cache_concurrent(self):
+        """The increments of parallel tasks are not lost."""
+        test_key = make_key('increment_concurrent_test')
+
+        def increment():
+            for i in range(50):
+                increment_cache(test_key, 0.25)
+
+        threads = [threading.Thread(target=increment) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(float(get_cache(test_key)['progress']), 50.0)
+
+    def test_set_cache_resets_increments(self):
+        """The increments continue from the progress that was set."""
+        test_key = make_key('set_cache_test')
+        increment_cache(test_key, 25.0)
+        set_cache(test_key, 'parsing', {'progress': 60.0})
+        self.assertEqual(get_cache(test_key)['progress'], 60.0)
+
+        increment_cache(test_key, 10.0)
+        self.assertEqual(get_cache(test_key)['progress'], 70.0)
+
+        set_cache(test_key, 'success', 100.0)
+        self.assertEqual(get_cache(test_key), {'status': 'success', 'progress': 100.0})
+
+    def test_get_cache_does_not_write(self):
+        """Reading the progress does not refresh the key."""
+        test_key = make_key('get_cache_test')
+        set_cache(test_key, 'parsing', 10.0)
+        with mock.patch('seed.utils.cache.set_cache_raw') as set_cache_raw:
+            get_cache(test_key)
+        self.assertFalse(set_cache_raw.called)
+
+    def test_progress_notifies(self):
+        """Every update of the progress is published to its waiters."""
+        test_key = make_key('notify_test')
+        with mock.patch('seed.utils.cache._notify_progress') as notify:
+            set_cache(test_key, 'parsing', 10.0)
+            increment_cache(test_key, 5.0)
+        self.assertEqual(notify.call_args_list, [mock.call(test_key), mock.call(test_key)])
+
+    def test_wait_for_progress(self):
+        """Waiting blocks on the notifications until the progress changes, the task finishes or on timeout."""
+        test_key = make_key('wait_test')
+        set_cache(test_key, 'parsing', 10.0)
+        pubsub = mock.Mock()
+
+        with mock.patch('seed.utils.cache._subscribe_progress', return_value=pubsub) as subscribe, \
+                mock.patch('time.sleep', side_effect=AssertionError('the progress was polled')):
+            # the client does not have the progress yet or it differs from the last one received
+            self.assertEqual(wait_for_progress(test_key)['progress'], 10.0)
+            self.assertEqual(
+                wait_for_progress(test_key, last_progress=5.0, last_status='parsing')['progress'],
+                10.0
+            )
+            self.assertFalse(subscribe.called)
+
+            # the progress changes while waiting
+            pubsub.get_message.side_effect = lambda timeout: increment_cache(test_key, 15.0)
+            data = wait_for_progress(test_key, last_progress=10.0, last_status='parsing')
+            self.assertEqual(data['progress'], 25.0)
+            self.assertEqual(pubsub.get_message.call_count, 1)
+            self.assertLessEqual(pubsub.get_message.call_args[1]['timeout'], 25)
+            subscribe.assert_called_once_with(test_key)
+            self.assertTrue(pubsub.close.called)
+
+            # a finished task is returned even when it did not change
+            subscribe.reset_mock()
+            set_cache(test_key, 'success', 100.0)
+            data = wait_for_progress(test_key, last_progress=100.0, last_status='success')
+            self.assertEqual(data['status'], 'success')
+            self.assertFalse(subscribe.called)
+
+        # nothing changes until the timeout
+        set_cache(test_key, 'parsing', 30.0)
+        pubsub.get_message.side_effect = lambda timeout: time.sleep(timeout)
+        with mock.patch('seed.utils.cache._subscribe_progress', return_value=pubsub):
+            data = wait_for_progress(
+                test_key, last_progress=30.0, last_status='parsing', timeout=0.05)
+        self.assertEqual(data['progress'], 30.0)
+
+        # the other cache backends can not notify, the progress is returned at once
+        with mock.patch('seed.utils.cache._subscribe_progress', return_value=None), \
+                mock.patch('time.sleep', side_effect=AssertionError('the progress was polled')):
+            data = wait_for_progress(test_key, last_progress=30.0, last_status='parsing')
+        self.assertEqual(data['progress'], 30.0)
+
     # Tests for decorators themselves.
 
     def test_locking(self):
@@ -87,6 +182,107 @@ class TestDecorators(TestCase):
         # Even though execution failed part way through a call, we unlock.
         self.assertEqual(int(get_lock(key)), self.unlocked)
 
+    def test_acquire_lock(self):
+        """Only one owner holds the lock, and only the owner releases it."""
+        key = decorators._get_lock_key('fake_func', self.pk)
+        token = acquire_lock(key)
+        self.assertIsNotNone(token)
+        self.assertIsNone(acquire_lock(key))
+        self.assertEqual(get_lock(key), self.locked)
+
+        self.assertFalse(renew_lock(key, 'other'))
+        release_lock(key, 'other')
+        self.assertEqual(get_lock(key), self.locked)
+
+        self.assertTrue(renew_lock(key, token))
+        release_lock(key, token)
+        self.assertEqual(get_lock(key), self.unlocked)
+        self.assertFalse(renew_lock(key, token))
+        self.assertIsNotNone(acquire_lock(key))
+
+    def change_owner_on_read(self, key, acquired):
+        """
+        Return a cache get that lets the lock expire and another worker try to
+        acquire it right after the lock is read, i.e. between the owner check
+        and the write of a non-atomic implementation.
+        """
+        get = django_cache.get
+
+        def get_and_change_owner(*args, **kwargs):
+            value = get(*args, **kwargs)
+            if args and args[0] == key and not acquired:
+                django_cache.delete(key)
+                thread = threading.Thread(target=lambda: acquired.append(acquire_lock(key)))
+                thread.start()
+                thread.join(0.2)
+                self.threads.append(thread)
+            return value
+
+        return get_and_change_owner
+
+    def test_release_lock_owner_changed(self):
+        """Releasing a lock never deletes the lock of a new owner."""
+        key = decorators._get_lock_key('fake_func', self.pk)
+        token = acquire_lock(key)
+        acquired = []
+        self.threads = []
+        with mock.patch.object(django_cache, 'get', self.change_owner_on_read(key, acquired)):
+            release_lock(key, token)
+        for thread in self.threads:
+            thread.join()
+
+        # the other worker either acquired the lock after the release, or the
+        # release was a single operation that could not be interleaved
+        for new_token in acquired:
+            self.assertIsNotNone(new_token)
+            self.assertEqual(get_lock(key), self.locked)
+            self.assertTrue(renew_lock(key, new_token))
+        self.assertFalse(renew_lock(key, token))
+
+    def test_renew_lock_owner_changed(self):
+        """Renewing a lock never overwrites the lock of a new owner."""
+        key = decorators._get_lock_key('fake_func', self.pk)
+        token = acquire_lock(key)
+        acquired = []
+        self.threads = []
+        with mock.patch.object(django_cache, 'get', self.change_owner_on_read(key, acquired)):
+            renewed = renew_lock(key, token)
+        for thread in self.threads:
+            thread.join()
+
+        # exactly one of the workers owns the lock
+        new_token = acquired[0] if acquired else None
+        self.assertNotEqual(renewed, new_token is not None)
+        self.assertEqual(renew_lock(key, token), renewed)
+        if new_token is not None:
+            self.assertTrue(renew_lock(key, new_token))
+
+    def test_locking_already_locked(self):
+        """A task is not run while another executor holds its lock."""
+        key = decorators._get_lock_key('fake_func', self.pk)
+        token = acquire_lock(key)
+
+        @decorators.lock_and_track
+        def fake_func(import_file_pk):
+            self.fail('The task ran while locked')
+
+        self.assertEqual(fake_func(self.pk), {'error': 'locked'})
+        # the lock of the other executor is kept
+        self.assertTrue(renew_lock(key, token))
+
+    def test_lock_heartbeat(self):
+        """The lock is renewed while the task runs, so it does not expire."""
+        key = decorators._get_lock_key('fake_func', self.pk)
+        token = acquire_lock(key, timeout=1)
+        heartbeat = decorators._LockHeartbeat(key, token, timeout=1)
+        heartbeat.start()
+        try:
+            time.sleep(2.5)
+            self.assertEqual(get_lock(key), self.locked)
+        finally:
+            heartbeat.stop()
+        self.assertFalse(heartbeat.is_alive())
+
     def test_progress(self):
         """When a task finishes, it increments the progress counter properly."""
         increment = expected = 25.0
@@ -11,7 +11,11 @@ from django.test import TestCase
 from django.db.models import Manager
 from seed.models import CanonicalBuilding, BuildingSnapshot
 from seed.factory import SEEDFactory
-from seed.lib.exporter import Exporter
+from seed.lib.exporter import (
+    Exporter,
+    batch_qs,
+    get_related_fields_to_select,
+)
 import xlrd
 import unicodecsv as csv
 
@@ -154,6 +158,40 @@ class TestExporters(TestCase):
                 xls_val = worksheet.cell_value(i + 1, j)
                 self.assertEqual(qs_val, xls_val)
 
+    def test_batch_qs(self):
+        """Batches follow the order of the queryset"""
+        qs = BuildingSnapshot.objects.filter(
+            pk__in=[x.pk for x in self.snapshots]
+        ).order_by('-pk')
+
+        batches = list(batch_qs(qs, batch_size=7))
+        self.assertEqual(len(batches), 8)
+        self.assertEqual(batches[-1][:3], (49, 50, 50))
+        self.assertEqual(
+            [obj.pk for _, _, _, objs in batches for obj in objs],
+            list(qs.values_list('pk', flat=True))
+        )
+
+    def test_csv_export_queries(self):
+        """The related objects of the fields are loaded with the rows"""
+        qs = BuildingSnapshot.objects.filter(
+            pk__in=[x.pk for x in self.snapshots]
+        )
+        fields = list(Exporter.fields_from_queryset(qs))
+        fields.append("canonical_building__id")
+        fields.append("canonical_building__canonical_snapshot__pm_property_id")
+
+        self.assertEqual(
+            get_related_fields_to_select(fields, BuildingSnapshot),
+            ['canonical_building', 'canonical_building__canonical_snapshot']
+        )
+
+        exporter = Exporter(str(uuid.uuid4()), 'test_export', 'csv')
+        # the primary keys, then the one batch of buildings
+        with self.assertNumQueries(2):
+            export_filename = exporter.export_csv(qs, fields)
+        os.remove(export_filename)
+
     def tearDown(self):
         for x in self.snapshots:
             x.delete()
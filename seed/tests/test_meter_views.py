@@ -200,3 +200,61 @@ class TestMeterViews(TestCase):
 
         self.assertEqual(resp, {'status': 'success'})
         self.assertEqual(TimeSeries.objects.all().count(), 2)
+
+    def test_get_timeseries_by_resolution(self):
+        """Time series are aggregated per period."""
+        meter = Meter.objects.create(
+            name='test', energy_type=ELECTRICITY, energy_units=KILOWATT_HOURS
+        )
+
+        fake_request = FakeRequest(
+            method='POST',
+            user=self.fake_user,
+            body=json.dumps({
+                'meter_id': meter.pk,
+                'organization_id': self.org.pk,
+                'timeseries': [
+                    {
+                        'begin_time': '2014-07-10T18:14:54.726',
+                        'end_time': '2014-07-10T19:14:54.726',
+                        'cost': 345,
+                        'reading': 23.0,
+                    },
+                    {
+                        'begin_time': '2014-07-09T18:14:54.726',
+                        'end_time': '2014-07-09T19:14:54.726',
+                        'cost': 33,
+                        'reading': 11.0,
+                    }
+                ]
+            })
+        )
+        meters.add_timeseries(fake_request)
+
+        fake_request = FakeRequest(
+            {
+                'meter_id': meter.pk,
+                'start': '2014-01-01',
+                'end': '2015-01-01',
+                'resolution': 'month',
+            },
+            method='GET',
+            user=self.fake_user,
+            body=json.dumps({
+                'organization_id': self.org.pk,
+            })
+        )
+        resp = json.loads(meters.get_timeseries_by_resolution(fake_request).content)
+
+        self.assertEqual(resp['status'], 'success')
+        self.assertEqual(len(resp['timeseries']), 1)
+        month = resp['timeseries'][0]
+        self.assertEqual(month['count'], 2)
+        self.assertEqual(month['reading'], 34.0)
+        self.assertEqual(month['mean'], 17.0)
+        self.assertEqual(month['cost'], 378.0)
+        self.assertTrue(month['begin_time'].startswith('2014-07-01T00:00:00'))
+
+        fake_request.GET['resolution'] = 'minute'
+        resp = json.loads(meters.get_timeseries_by_resolution(fake_request).content)
+        self.assertEqual(resp['status'], 'error')
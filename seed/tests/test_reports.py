@@ -0,0 +1,132 @@
+# !/usr/bin/env python
+# encoding: utf-8
+"""
+:copyright (c) 2014 - 2016, The Regents of the University of California, through Lawrence Berkeley National Laboratory (subject to receipt of any required approvals from the U.S. Department of Energy) and contributors. All rights reserved.  # NOQA
+:author
+"""
+import json
+from datetime import datetime
+
+from django.core.urlresolvers import reverse
+from django.test import TestCase
+from django.utils import timezone
+
+from seed.landing.models import SEEDUser as User
+from seed.lib.superperms.orgs.models import Organization, OrganizationUser
+from seed.models import PropertyView
+from seed.test_helpers.fake import (
+    FakeCycleFactory,
+    FakePropertyFactory,
+    FakePropertyStateFactory,
+)
+from seed.utils.reports import clear_report_summaries, get_aggregated_report
+
+
+class TestPropertyReports(TestCase):
+
+    def setUp(self):
+        user_details = {
+            'username': 'test_user@demo.com',
+            'password': 'test_pass',
+            'email': 'test_user@demo.com'
+        }
+        self.user = User.objects.create_superuser(**user_details)
+        self.org = Organization.objects.create()
+        OrganizationUser.objects.create(user=self.user, organization=self.org)
+        self.cycle = FakeCycleFactory(organization=self.org, user=self.user).get_cycle(
+            start=datetime(2016, 1, 1, tzinfo=timezone.get_current_timezone()))
+        self.property_factory = FakePropertyFactory(organization=self.org)
+        self.property_state_factory = FakePropertyStateFactory()
+
+        for site_eui, use, year_built, area, campus in [
+            (10, 'Office', 1995, 50000, False),
+            (20, 'office', 1999, 150000, False),
+            (30, 'Retail', 2001, 1500000, False),
+            (40, 'office', 1991, 2500000, False),
+            (None, 'office', 1991, 1000, False),
+            (50, 'office', 1991, 1000, True),
+        ]:
+            state = self.property_state_factory.get_property_state(
+                self.org, site_eui=site_eui, use_description=use, year_built=year_built,
+                gross_floor_area=area)
+            PropertyView.objects.create(
+                property=self.property_factory.get_property(campus=campus),
+                cycle=self.cycle, state=state)
+
+        self.client.login(**user_details)
+
+    def tearDown(self):
+        clear_report_summaries([self.cycle.pk])
+
+    def test_aggregated_report(self):
+        data = get_aggregated_report(
+            self.org.pk, [self.cycle], 'site_eui', 'use_description', False)
+
+        self.assertEqual(data[0]['property_counts'], {
+            'yr_e': '2016',
+            'num_properties': 5,
+            'num_properties_w-data': 4,
+        })
+        self.assertEqual(data[0]['chart_data'], [
+            {'x': 20.0, 'y': 'Office', 'yr_e': '2016'},
+            {'x': 30.0, 'y': 'Retail', 'yr_e': '2016'},
+        ])
+
+        data = get_aggregated_report(
+            self.org.pk, [self.cycle], 'site_eui', 'year_built', False)
+        self.assertEqual(data[0]['chart_data'], [
+            {'x': 20.0, 'y': '1990-1999', 'yr_e': '2016'},
+            {'x': 30.0, 'y': '2000-2009', 'yr_e': '2016'},
+        ])
+
+        data = get_aggregated_report(
+            self.org.pk, [self.cycle], 'site_eui', 'gross_floor_area', True)
+        self.assertEqual(data[0]['property_counts']['num_properties'], 6)
+        self.assertEqual(data[0]['chart_data'], [
+            {'x': 30.0, 'y': '0-99k', 'yr_e': '2016'},
+            {'x': 20.0, 'y': '100-199k', 'yr_e': '2016'},
+            {'x': 35.0, 'y': 'over 1,000k', 'yr_e': '2016'},
+        ])
+
+    def test_aggregated_report_summary(self):
+        data = get_aggregated_report(
+            self.org.pk, [self.cycle], 'site_eui', 'year_built', False)
+
+        # the summary of the cycle is reused
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                get_aggregated_report(self.org.pk, [self.cycle], 'site_eui', 'year_built', False),
+                data
+            )
+
+        clear_report_summaries([self.cycle.pk])
+        with self.assertNumQueries(2):
+            get_aggregated_report(self.org.pk, [self.cycle], 'site_eui', 'year_built', False)
+
+    def test_get_aggregated_property_report_data(self):
+        response = self.client.get(reverse('app:aggregated_property_report_data'), {
+            'organization_id': self.org.pk,
+            'start': self.cycle.pk,
+            'end': self.cycle.pk,
+            'x_var': 'site_eui',
+            'y_var': 'use_description',
+        })
+        result = json.loads(response.content)
+        self.assertEqual(result['status'], 'success')
+        self.assertEqual(len(result['aggregated_data']['chart_data']), 2)
+        self.assertEqual(result['aggregated_data']['property_counts'][0]['num_properties'], 5)
+
+    def test_get_property_report_data(self):
+        response = self.client.get(reverse('app:property_report_data'), {
+            'organization_id': self.org.pk,
+            'start': self.cycle.pk,
+            'end': self.cycle.pk,
+            'x_var': 'site_eui',
+            'y_var': 'year_built',
+        })
+        result = json.loads(response.content)
+        self.assertEqual(result['status'], 'success')
+        self.assertEqual(
+            sorted(point['x'] for point in result['data']['chart_data']), [10, 20, 30, 40]
+        )
+        self.assertEqual(result['data']['property_counts'][0]['num_properties_w-data'], 4)
@@ -0,0 +1,226 @@
+# !/usr/bin/env python
+# encoding: utf-8
+"""
+:copyright (c) 2014 - 2016, The Regents of the University of California, through Lawrence Berkeley National Laboratory (subject to receipt of any required approvals from the U.S. Department of Energy) and contributors. All rights reserved.  # NOQA
+:author
+"""
+import threading
+from datetime import datetime
+
+import mock
+from django.test import TestCase
+from django.utils import timezone
+
+from seed import search
+from seed.landing.models import SEEDUser as User
+from seed.lib.superperms.orgs.models import Organization
+from seed.models import (
+    PropertyState,
+    PropertyView,
+    TaxLotState,
+)
+from seed.test_helpers.fake import (
+    FakeCycleFactory,
+    FakePropertyFactory,
+    FakePropertyStateFactory,
+    FakeTaxLotStateFactory,
+)
+from seed.utils import search as search_utils
+from seed.utils import search_index
+from seed.utils.cache import delete_cache
+
+
+class TestSearchIndex(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_superuser(
+            username='test_user@demo.com', email='test_user@demo.com', password='test_pass')
+        self.org = Organization.objects.create()
+        self.cycle = FakeCycleFactory(organization=self.org, user=self.user).get_cycle(
+            start=datetime(2010, 10, 10, tzinfo=timezone.get_current_timezone()))
+        self.property_factory = FakePropertyFactory(organization=self.org)
+        self.property_state_factory = FakePropertyStateFactory()
+        self.taxlot_state_factory = FakeTaxLotStateFactory()
+
+    def tearDown(self):
+        for table in ['seed_propertystate', 'seed_taxlotstate']:
+            delete_cache(search_index._extra_data_index_key(table))
+            search_index.clear_extra_data_filters(table)
+
+    def test_search_properties_fields(self):
+        self.assertEqual(search_index.SEARCH_FIELDS['property'], [
+            'pm_parent_property_id',
+            'jurisdiction_property_id',
+            'pm_property_id',
+            'address_line_1',
+            'property_name',
+        ])
+
+        states = PropertyState.objects.filter(organization=self.org)
+        for field in search_index.SEARCH_FIELDS['property']:
+            state = self.property_state_factory.get_property_state(
+                self.org, **{field: 'searched {} value'.format(field)})
+            result = search.search_properties('D {} VAL'.format(field), queryset=states)
+            self.assertEqual(list(result), [state])
+
+        self.assertEqual(search.search_properties('', queryset=states).count(), 5)
+
+    def test_search_taxlots_fields(self):
+        self.assertEqual(search_index.SEARCH_FIELDS['taxlot'], [
+            'jurisdiction_tax_lot_id',
+            'address_line_1',
+            'block_number',
+        ])
+
+        states = TaxLotState.objects.filter(organization=self.org)
+        for field in search_index.SEARCH_FIELDS['taxlot']:
+            state = self.taxlot_state_factory.get_taxlot_state(
+                self.org, **{field: 'searched {} value'.format(field)})
+            result = search.search_taxlots('d {} val'.format(field), queryset=states)
+            self.assertEqual(list(result), [state])
+
+    def test_search_inventory_views(self):
+        state = self.property_state_factory.get_property_state(
+            self.org, address_line_1='123 Main Street')
+        other_state = self.property_state_factory.get_property_state(
+            self.org, address_line_1='1 Elm Street')
+        view = PropertyView.objects.create(
+            property=self.property_factory.get_property(), cycle=self.cycle, state=state)
+        other_view = PropertyView.objects.create(
+            property=self.property_factory.get_property(), cycle=self.cycle, state=other_state)
+        views = PropertyView.objects.filter(property__organization=self.org)
+
+        # the text is searched in the states of the views
+        result = search.search_inventory('property_view', 'main st', queryset=views)
+        self.assertEqual(list(result), [view])
+        result = search.search_inventory('property_view', 'street', queryset=views)
+        self.assertItemsEqual(list(result), [view, other_view])
+
+        # numbers also match the ids exactly
+        result = search.search_inventory('property_view', str(other_view.property_id),
+                                         queryset=views)
+        self.assertIn(other_view, list(result))
+
+    def test_filter_indexed_extra_data_key(self):
+        if not search_index.trigram_available():
+            self.skipTest('pg_trgm is not installed')
+
+        self.property_state_factory.get_property_state(
+            self.org, extra_data={'Building Type': 'Office'})
+        self.property_state_factory.get_property_state(
+            self.org, extra_data={'Building Type': 'Office Tower'})
+        states = PropertyState.objects.filter(organization=self.org)
+
+        self.assertFalse(search_index.is_extra_data_key_indexed('seed_propertystate',
+                                                                'Building Type'))
+        self.assertTrue(search_index.create_extra_data_index(PropertyState, 'Building Type',
+                                                             concurrently=False))
+        self.assertTrue(search_index.is_extra_data_key_indexed('seed_propertystate',
+                                                               'Building Type'))
+
+        # the exact match is combined with an icontains lookup that the index can serve
+        result = search.filter_other_params(states, {'Building Type': '"Office"'}, {})
+        self.assertIn('LIKE', str(result.query))
+        self.assertEqual(result.count(), 1)
+        result = search.filter_other_params(states, {'Building Type': '^"office tower"'}, {})
+        self.assertEqual(result.count(), 1)
+        result = search.filter_other_params(states, {'Building Type': 'office'}, {})
+        self.assertEqual(result.count(), 2)
+
+    def test_record_extra_data_filters(self):
+        states = PropertyState.objects.filter(organization=self.org)
+        for _ in range(3):
+            search.filter_other_params(states, {'Building Type': 'office'}, {})
+        search.filter_other_params(states, {'Owner': 'city', 'Floors__gte': 3}, {})
+
+        self.assertEqual(
+            search_index.get_frequent_extra_data_keys('seed_propertystate', 1),
+            ['Building Type', 'Owner']
+        )
+        self.assertEqual(
+            search_index.get_frequent_extra_data_keys('seed_propertystate', 2),
+            ['Building Type']
+        )
+
+    def test_record_extra_data_filters_concurrent(self):
+        """The filters counted by parallel requests are not lost."""
+        def record():
+            for _ in range(25):
+                search_index.record_extra_data_filters('seed_taxlotstate', ['Zoning', 'Owner'])
+
+        threads = [threading.Thread(target=record) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(
+            search_index.get_frequent_extra_data_keys('seed_taxlotstate', 100),
+            ['Owner', 'Zoning']
+        )
+        self.assertEqual(search_index.get_frequent_extra_data_keys('seed_taxlotstate', 101), [])
+
+
+class TestCompileFilters(TestCase):
+
+    def setUp(self):
+        self.org = Organization.objects.create()
+        self.property_state_factory = FakePropertyStateFactory()
+        self.db_columns = {'address_line_1': '', 'gross_floor_area': '', 'year_ending': ''}
+
+    def tearDown(self):
+        search_index.clear_extra_data_filters('seed_propertystate')
+
+    def test_compile_filters(self):
+        nodes = search_utils.compile_filters({
+            'address_line_1': '"1 Main St"',
+            'gross_floor_area': '>=1000, <5000',
+            'year_ending__gte': '2016-01-01T00:00:00.000Z',
+            'Building Type': '^"office"',
+            'Owner': '!""',
+            'q': 'ignored',
+        }, self.db_columns)
+
+        self.assertItemsEqual(nodes, [
+            search_utils.FilterNode('address_line_1', search_utils.FILTER_EXACT, '1 Main St', True),
+            search_utils.FilterNode('gross_floor_area', search_utils.FILTER_EXPRESSION,
+                                    (('>=1000,', '>=', '1000'), ('<5000', '<', '5000')), True),
+            search_utils.FilterNode('year_ending__gte', search_utils.FILTER_LOOKUP, '2016-01-01',
+                                    True),
+            search_utils.FilterNode('Building Type', search_utils.FILTER_IEXACT, 'office', False),
+            search_utils.FilterNode('Owner', search_utils.FILTER_NOT_EMPTY, None, False),
+        ])
+
+    def test_compile_filters_cache(self):
+        params = {'address_line_1': 'main', 'Building Type': ['a', 'b']}
+        nodes = search_utils.compile_filters(params, self.db_columns)
+
+        with mock.patch.object(search_utils, 'parse_column_filter') as parse_column_filter:
+            self.assertIs(search_utils.compile_filters(dict(params), self.db_columns), nodes)
+            self.assertFalse(parse_column_filter.called)
+
+        # the same key is a different filter when it is not a database field
+        other_nodes = search_utils.compile_filters(params, {})
+        self.assertFalse(any(node.in_columns for node in other_nodes))
+
+    def test_filter_other_params_single_filter(self):
+        self.property_state_factory.get_property_state(
+            self.org, address_line_1='1 Main St', extra_data={'Building Type': 'Office'})
+        self.property_state_factory.get_property_state(
+            self.org, address_line_1='1 Main St', extra_data={'Building Type': 'Retail'})
+        self.property_state_factory.get_property_state(
+            self.org, address_line_1='2 Main St', extra_data={'Building Type': 'Office'})
+        states = PropertyState.objects.filter(organization=self.org)
+
+        result = search.filter_other_params(states, {
+            'address_line_1': '1 main',
+            'Building Type': '^"office"',
+        }, self.db_columns)
+        self.assertEqual(result.count(), 1)
+        self.assertEqual(result[0].extra_data['Building Type'], 'Office')
+
+        result = search.filter_other_params(states, {
+            'address_line_1': '1 main',
+            'Building Type': '!retail',
+        }, self.db_columns)
+        self.assertEqual(result.count(), 1)
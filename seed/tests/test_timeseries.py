@@ -0,0 +1,136 @@
+# !/usr/bin/env python
+# encoding: utf-8
+"""
+:copyright (c) 2014 - 2016, The Regents of the University of California, through Lawrence Berkeley National Laboratory (subject to receipt of any required approvals from the U.S. Department of Energy) and contributors. All rights reserved.  # NOQA
+:author
+"""
+from datetime import datetime, timedelta
+
+import numpy as np
+from django.test import TestCase
+from django.utils import timezone
+
+from seed.models import (
+    ELECTRICITY, KILOWATT_HOURS, Meter, TimeSeries, TimeSeriesRollup
+)
+from seed.utils import timeseries
+
+
+class TestTimeSeriesRollups(TestCase):
+
+    def setUp(self):
+        self.meter = Meter.objects.create(
+            name='test', energy_type=ELECTRICITY, energy_units=KILOWATT_HOURS
+        )
+        self.tz = timezone.get_default_timezone()
+        # hourly readings from Jan 31 to Feb 2, local time
+        self.start = self.tz.localize(datetime(2016, 1, 31))
+        self.add_readings(self.start, 72)
+
+    def add_readings(self, start, num, reading=1.0):
+        readings = []
+        for i in range(num):
+            begin_time = start + timedelta(hours=i)
+            readings.append(TimeSeries(
+                meter=self.meter,
+                begin_time=begin_time,
+                end_time=begin_time + timedelta(hours=1),
+                reading=reading + i,
+                cost=1,
+            ))
+        TimeSeries.objects.bulk_create(readings)
+        timeseries.update_rollups(
+            [self.meter.pk], readings[0].begin_time, readings[-1].begin_time)
+
+    def rollups(self, resolution):
+        return list(TimeSeriesRollup.objects.filter(
+            meter=self.meter, resolution=resolution
+        ).order_by('period_start').values_list(
+            'period_start', 'count', 'reading_sum', 'reading_min', 'reading_max', 'cost_sum'))
+
+    def test_update_rollups(self):
+        days = self.rollups(TimeSeriesRollup.DAY)
+        self.assertEqual(len(days), 3)
+        self.assertEqual(days[0], (self.start, 24, sum(range(1, 25)), 1, 24, 24))
+        self.assertEqual(days[2][0], self.tz.localize(datetime(2016, 2, 2)))
+
+        months = self.rollups(TimeSeriesRollup.MONTH)
+        self.assertEqual(months, [
+            (self.tz.localize(datetime(2016, 1, 1)), 24, sum(range(1, 25)), 1, 24, 24),
+            (self.tz.localize(datetime(2016, 2, 1)), 48, sum(range(25, 73)), 25, 72, 48),
+        ])
+
+        # only the periods of the new readings are recomputed
+        self.add_readings(self.tz.localize(datetime(2016, 2, 3)), 2, reading=100)
+        months = self.rollups(TimeSeriesRollup.MONTH)
+        self.assertEqual(months[0][1:], (24, sum(range(1, 25)), 1, 24, 24))
+        self.assertEqual(months[1][1:], (50, sum(range(25, 73)) + 201, 25, 101, 50))
+        self.assertEqual(len(self.rollups(TimeSeriesRollup.DAY)), 4)
+
+    def test_get_timeseries_range(self):
+        end = self.start + timedelta(days=3)
+
+        raw = timeseries.get_timeseries_range(self.meter.pk, self.start, end)
+        self.assertEqual(len(raw), 72)
+        self.assertEqual(raw[0]['reading'], 1)
+
+        days = timeseries.get_timeseries_range(self.meter.pk, self.start, end, 'day')
+        self.assertEqual([d['count'] for d in days], [24, 24, 24])
+        self.assertEqual(days[0]['mean'], sum(range(1, 25)) / 24.0)
+        self.assertEqual(days[0]['end_time'], self.tz.localize(datetime(2016, 2, 1)))
+
+        # resampled from the raw readings
+        hours = timeseries.get_timeseries_range(
+            self.meter.pk, self.start + timedelta(minutes=30), self.start + timedelta(hours=3),
+            'hour')
+        self.assertEqual([h['reading'] for h in hours], [1, 2, 3])
+
+        # resampled from the daily rollups, Jan 31 2016 is a Sunday
+        weeks = timeseries.get_timeseries_range(self.meter.pk, self.start, end, 'week')
+        self.assertEqual(len(weeks), 2)
+        self.assertEqual(weeks[0]['begin_time'], self.tz.localize(datetime(2016, 1, 25)))
+        self.assertEqual(weeks[0]['reading'], sum(range(1, 25)))
+        self.assertEqual(weeks[1]['count'], 48)
+        self.assertEqual(weeks[1]['min'], 25)
+        self.assertEqual(weeks[1]['max'], 72)
+        self.assertEqual(weeks[1]['cost'], 48)
+
+        # resampled from the monthly rollups
+        years = timeseries.get_timeseries_range(self.meter.pk, self.start, end, 'year')
+        self.assertEqual(len(years), 1)
+        self.assertEqual(years[0]['reading'], sum(range(1, 73)))
+        self.assertEqual(years[0]['mean'], sum(range(1, 73)) / 72.0)
+
+        with self.assertRaises(ValueError):
+            timeseries.get_timeseries_range(self.meter.pk, self.start, end, 'minute')
+
+    def test_get_rollups(self):
+        other_meter = Meter.objects.create(
+            name='other', energy_type=ELECTRICITY, energy_units=KILOWATT_HOURS
+        )
+        with self.assertNumQueries(1):
+            rollups = timeseries.get_rollups(
+                [self.meter.pk, other_meter.pk], TimeSeriesRollup.MONTH,
+                self.start, self.start + timedelta(days=3))
+
+        self.assertEqual(rollups[other_meter.pk], [])
+        self.assertEqual([r['reading'] for r in rollups[self.meter.pk]],
+                         [sum(range(1, 25)), sum(range(25, 73))])
+
+    def test_resample(self):
+        readings = np.array([1, 2, np.nan, 4, 5, 6, 7.])
+        result = timeseries.resample(
+            times=np.array([-1, 0, 5, 10, 25, 30, 40.]),
+            edges=np.array([0, 10, 20, 30.]),
+            sums=readings,
+            counts=(~np.isnan(readings)).astype(float),
+            mins=readings,
+            maxs=readings,
+            costs=np.array([1, 1, 1, np.nan, 1, 1, 1.]),
+        )
+
+        self.assertEqual(result['count'].tolist(), [1, 1, 1])
+        self.assertEqual(result['sum'].tolist(), [2, 4, 5])
+        self.assertEqual(result['min'].tolist(), [2, 4, 5])
+        self.assertEqual(result['max'].tolist(), [2, 4, 5])
+        self.assertEqual(result['cost'].tolist(), [2, 0, 1])
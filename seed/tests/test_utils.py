@@ -6,6 +6,11 @@
 """
 from django.test import TestCase
 from seed.utils.generic import split_model_fields
+from seed.utils.inventory import (
+    InventoryRowSerializer,
+    extra_data_keys_for_columns,
+    rename_extra_data_key,
+)
 
 
 class DummyClass(object):
@@ -42,3 +47,50 @@ class TestGenericUtils(TestCase):
         obj_fields, non_obj_fields = split_model_fields(obj, fields_to_split)
         self.assertEqual(obj_fields, [])
         self.assertEqual(non_obj_fields, [f4])
+
+
+class TestInventoryUtils(TestCase):
+
+    def test_rename_extra_data_key(self):
+        db_columns = ['address_line_1', 'address_line_1_extra', 'city']
+        self.assertEqual(rename_extra_data_key('id', db_columns), 'id_extra')
+        self.assertEqual(rename_extra_data_key('city', db_columns), 'city_extra')
+        self.assertEqual(rename_extra_data_key('address_line_1', db_columns),
+                         'address_line_1_extra_extra')
+        self.assertEqual(rename_extra_data_key('paint color', db_columns), 'paint color')
+
+    def test_extra_data_keys_for_columns(self):
+        db_columns = ['address_line_1', 'address_line_1_extra', 'city']
+        self.assertListEqual(
+            extra_data_keys_for_columns(
+                ['address_line_1', 'address_line_1_extra_extra', 'city_extra', 'id_extra',
+                 'paint color'],
+                db_columns
+            ),
+            # a column is also displayed for an extra_data key of the same name when that name
+            # does not collide with a database field
+            ['address_line_1', 'address_line_1_extra', 'address_line_1_extra_extra', 'city',
+             'city_extra', 'id', 'id_extra', 'paint color']
+        )
+
+    def test_inventory_row_serializer(self):
+        serializer = InventoryRowSerializer(['address_line_1', 'city'],
+                                            {'address_line_1': 'address_line_1_extra'})
+        state_values = ({'id': 1, 'city': 'Golden'},
+                        {'address_line_1': '1 Main St', 'city': 'Denver', 'color': 'pink'})
+
+        self.assertDictEqual(serializer.serialize(state_values), {
+            'id': 1,
+            'city': 'Golden',
+            'address_line_1_extra': '1 Main St',
+            'city_extra': 'Denver',
+            'color': 'pink',
+        })
+        # the keys that were not in the rename map are added to it
+        self.assertEqual(serializer.rename_map['city'], 'city_extra')
+
+        self.assertDictEqual(
+            serializer.serialize(state_values, columns={'id', 'color', 'state_id'},
+                                 extra_fields={'state_id': 10}),
+            {'id': 1, 'color': 'pink', 'state_id': 10}
+        )
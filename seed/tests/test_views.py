@@ -9,6 +9,7 @@ from datetime import date, datetime, timedelta
 from django.utils import timezone
 from unittest import skip
 
+import mock
 from django.core.cache import cache
 from django.core.urlresolvers import reverse, reverse_lazy
 from django.test import TestCase
@@ -23,6 +24,8 @@ from seed.lib.superperms.orgs.models import Organization, OrganizationUser
 from seed.models import (
     ASSESSED_RAW,
     ASSESSED_BS,
+    AUDIT_IMPORT,
+    AUDIT_USER_EDIT,
     BuildingSnapshot,
     CanonicalBuilding,
     COMPOSITE_BS,
@@ -30,8 +33,11 @@ from seed.models import (
     ColumnMapping,
     Cycle,
     FLOAT,
+    DATA_STATE_MATCHING,
+    MERGE_STATE_NEW,
     Property,
     ProjectBuilding,
+    PropertyAuditLog,
     PropertyState,
     PropertyView,
     StatusLabel,
@@ -56,7 +62,8 @@ from seed.views.main import (
 COLUMNS_TO_SEND = DEFAULT_CUSTOM_COLUMNS + ['postal_code', 'pm_parent_property_id',
                                             'calculated_taxlot_ids', 'primary', 'extra_data_field',
                                             'jurisdiction_tax_lot_id', 'is secret lair',
-                                            'paint color', 'number of secret gadgets']
+                                            'paint color', 'number of secret gadgets',
+                                            'block_number']
 
 
 class MainViewTests(TestCase):
@@ -1614,6 +1621,101 @@ class ImportFileViewsTests(TestCase):
             '/api/v2/import_files/' + str(self.import_file.pk) + '/matching_results/')
         self.assertEqual('success', json.loads(response.content)['status'])
 
+    def create_matched_states(self):
+        """Import three states, merge the first one and manually edit the last one"""
+        states = []
+        for i in range(3):
+            state = PropertyState.objects.create(
+                organization=self.org,
+                import_file=self.import_file,
+                data_state=DATA_STATE_MATCHING,
+                merge_state=MERGE_STATE_NEW,
+                address_line_1='{} Main St'.format(i),
+            )
+            PropertyAuditLog.objects.create(
+                organization=self.org,
+                state=state,
+                name='Import Creation',
+                import_filename='file.csv',
+                record_type=AUDIT_IMPORT,
+            )
+            states.append(state)
+
+        existing = PropertyState.objects.create(organization=self.org, address_line_1='existing')
+        merged = PropertyState.objects.create(organization=self.org)
+        PropertyAuditLog.objects.create(
+            organization=self.org,
+            state=merged,
+            parent1=PropertyAuditLog.objects.get(state=states[0]),
+            parent_state1=states[0],
+            parent_state2=existing,
+            name='System Match',
+            record_type=AUDIT_IMPORT,
+        )
+        PropertyAuditLog.objects.create(
+            organization=self.org,
+            state=states[2],
+            name='Manual Edit',
+            record_type=AUDIT_USER_EDIT,
+        )
+        return states, existing
+
+    def test_get_matching_results_merged(self):
+        states, _ = self.create_matched_states()
+        response = self.client.get(
+            '/api/v2/import_files/' + str(self.import_file.pk) + '/matching_results/')
+        result = json.loads(response.content)
+        self.assertEqual(result['properties']['matched_ids'], [states[0].pk])
+        self.assertEqual(result['properties']['unmatched_ids'], [states[1].pk])
+
+    def test_filtered_mapping_results_coparents(self):
+        states, existing = self.create_matched_states()
+        self.import_file.save_cached_mapped_columns([
+            {'from_field': 'Address', 'to_field': 'address_line_1', 'to_table_name': 'PropertyState'}
+        ])
+        response = self.client.post(
+            '/api/v2/import_files/' + str(self.import_file.pk) + '/filtered_mapping_results/',
+            data=json.dumps({'get_coparents': True}),
+            content_type='application/json'
+        )
+        result = json.loads(response.content)
+        self.assertEqual([p['id'] for p in result['properties']], [states[0].pk, states[1].pk])
+        self.assertTrue(result['properties'][0]['matched'])
+        self.assertEqual(result['properties'][0]['coparent']['id'], existing.pk)
+        self.assertEqual(result['properties'][0]['coparent']['address_line_1'], 'existing')
+        self.assertFalse(result['properties'][1]['matched'])
+
+        # a single page of the states
+        response = self.client.post(
+            '/api/v2/import_files/' + str(self.import_file.pk) + '/filtered_mapping_results/',
+            data=json.dumps({'page': 2, 'per_page': 1}),
+            content_type='application/json'
+        )
+        result = json.loads(response.content)
+        self.assertEqual([p['id'] for p in result['properties']], [states[1].pk])
+        self.assertEqual(result['number_properties_matching_search'], 2)
+
+    def test_filtered_mapping_results_invalid_page(self):
+        states, _ = self.create_matched_states()
+        self.import_file.save_cached_mapped_columns([
+            {'from_field': 'Address', 'to_field': 'address_line_1', 'to_table_name': 'PropertyState'}
+        ])
+        url = '/api/v2/import_files/' + str(self.import_file.pk) + '/filtered_mapping_results/'
+
+        # the page and the number of states per page are at least 1
+        for page, per_page in [(0, 1), (-1, -5)]:
+            response = self.client.post(
+                url, data=json.dumps({'page': page, 'per_page': per_page}),
+                content_type='application/json'
+            )
+            result = json.loads(response.content)
+            self.assertEqual([p['id'] for p in result['properties']], [states[0].pk])
+
+        for data in [{'page': 'abc', 'per_page': 1}, {'per_page': 'abc'}]:
+            response = self.client.post(url, data=json.dumps(data), content_type='application/json')
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(json.loads(response.content)['status'], 'error')
+
 
 @skip('Fix for new data model')
 class ReportViewsTests(TestCase):
@@ -2356,6 +2458,39 @@ class TestMCMViews(TestCase):
         self.assertEqual(body.get('progress', 0), test_progress['progress'])
         self.assertEqual(body.get('progress_key', ''), progress_key)
 
+    def test_progress_wait(self):
+        """The progress is returned as soon as it differs from the last one received."""
+        progress_key = decorators.get_prog_key('fun_func', 24)
+        set_cache(progress_key, 'parsing', 50.0)
+        resp = self.client.post(
+            reverse_lazy('apiv2:progress_wait'),
+            data=json.dumps({
+                'progress_key': progress_key,
+                'progress': 25.0,
+                'status': 'parsing',
+            }),
+            content_type='application/json'
+        )
+
+        self.assertEqual(resp.status_code, 200)
+        body = json.loads(resp.content)
+        self.assertEqual(body['progress'], 50.0)
+        self.assertEqual(body['status'], 'parsing')
+        self.assertEqual(body['progress_key'], progress_key)
+
+    def test_progress_does_not_block(self):
+        """The progress is read and returned at once, requests never wait for it to change."""
+        progress_key = decorators.get_prog_key('fun_func', 24)
+        set_cache(progress_key, 'parsing', 50.0)
+        with mock.patch('time.sleep', side_effect=AssertionError('the request waited')):
+            for i in range(5):
+                resp = self.client.post(
+                    reverse_lazy('apiv2:progress'),
+                    data=json.dumps({'progress_key': progress_key}),
+                    content_type='application/json'
+                )
+                self.assertEqual(json.loads(resp.content)['progress'], 50.0)
+
     @skip('Fix for new data model')
     def test_reset_mapped_w_previous_matches(self):
         """Ensure we ignore mapped buildings with children BuildingSnapshots."""
@@ -2831,6 +2966,75 @@ class InventoryViewTests(TestCase):
         self.assertEquals(pagination['has_previous'], False)
         self.assertEquals(pagination['total'], 1)
 
+    def test_get_properties_cursor(self):
+        property_views = []
+        for i in range(5):
+            state = self.property_state_factory.get_property_state(self.org)
+            property_views.append(PropertyView.objects.create(
+                property=self.property_factory.get_property(), cycle=self.cycle, state=state
+            ))
+        filter_properties_url = '/api/v2/properties/filter/?{}={}&{}={}&{}={}'.format(
+            'organization_id', self.org.pk,
+            'cycle', self.cycle.pk,
+            'per_page', 2
+        )
+        result = json.loads(self.client.post(
+            filter_properties_url, data={'columns': COLUMNS_TO_SEND}
+        ).content)
+        self.assertListEqual([r['property_view_id'] for r in result['results']],
+                             [pv.pk for pv in property_views[:2]])
+        pagination = result['pagination']
+        self.assertEquals(pagination['total'], 5)
+        self.assertEquals(pagination['num_pages'], 3)
+        self.assertEquals(pagination['has_next'], True)
+        self.assertEquals(pagination['next_cursor'], property_views[1].pk)
+
+        # the next page is the views after the cursor, the page number is passed by the client
+        result = json.loads(self.client.post(
+            filter_properties_url + '&page=2&cursor={}'.format(pagination['next_cursor']),
+            data={'columns': COLUMNS_TO_SEND}
+        ).content)
+        self.assertListEqual([r['property_view_id'] for r in result['results']],
+                             [pv.pk for pv in property_views[2:4]])
+        pagination = result['pagination']
+        self.assertEquals(pagination['page'], 2)
+        self.assertEquals(pagination['start'], 3)
+        self.assertEquals(pagination['end'], 4)
+        self.assertEquals(pagination['has_previous'], True)
+        self.assertEquals(pagination['next_cursor'], property_views[3].pk)
+
+        # an invalid cursor returns the first page
+        result = json.loads(self.client.post(
+            filter_properties_url + '&cursor=abc', data={'columns': COLUMNS_TO_SEND}
+        ).content)
+        self.assertListEqual([r['property_view_id'] for r in result['results']],
+                             [pv.pk for pv in property_views[:2]])
+        self.assertEquals(result['pagination']['page'], 1)
+
+    def test_get_properties_projection(self):
+        extra_data = {
+            'paint color': 'pink',
+            'not requested': 'secret',
+        }
+        state = self.property_state_factory.get_property_state(
+            self.org,
+            extra_data=json.dumps(extra_data)
+        )
+        PropertyView.objects.create(
+            property=self.property_factory.get_property(), cycle=self.cycle, state=state
+        )
+        response = self.client.post('/api/v2/properties/filter/?{}={}&{}={}'.format(
+            'organization_id', self.org.pk,
+            'cycle', self.cycle.pk,
+        ), data={'columns': ['address_line_1', 'paint color']})
+        result = json.loads(response.content)['results'][0]
+
+        # only the requested fields and extra data are returned
+        self.assertEquals(result['address_line_1'], state.address_line_1)
+        self.assertEquals(result['paint color'], 'pink')
+        self.assertNotIn('postal_code', result)
+        self.assertNotIn('not requested', result)
+
     def test_get_properties_empty_page(self):
         filter_properties_url = '/api/v2/properties/filter/?{}={}&{}={}&{}={}'.format(
             'organization_id', self.org.pk,
@@ -10,6 +10,17 @@ import re
 import usaddress
 from streetaddress import StreetAddressFormatter
 
+from seed.utils.lru import LRUCache
+
+# Maximum number of normalized addresses kept in memory. Files often repeat the same addresses,
+# and tagging an address with usaddress is the slow part of the normalization.
+NORMALIZED_ADDRESS_CACHE_SIZE = 10000
+
+_normalized_address_cache = LRUCache(NORMALIZED_ADDRESS_CACHE_SIZE)
+
+# Returned by the cache for the addresses it does not have, None is a valid normalized address
+_MISSING = object()
+
 
 def _normalize_address_direction(direction):
     direction = direction.lower().replace('.', '')
@@ -81,6 +92,8 @@ def normalize_address_str(address_val):
     If an invalid address_val is provided, None is returned.
 
     If a valid address is provided, a normalized version is returned.
+
+    The results are kept in a bounded LRU cache.
     """
 
     # if this string is empty the regular expression in the sa wont
@@ -88,6 +101,29 @@ def normalize_address_str(address_val):
     if not address_val:
         return None
 
+    normalized_address = _normalized_address_cache.get(address_val, _MISSING)
+    if normalized_address is _MISSING:
+        normalized_address = _normalize_address_str(address_val)
+        _normalized_address_cache.set(address_val, normalized_address)
+    return normalized_address
+
+
+def normalize_addresses(address_vals):
+    """
+    Normalize many addresses at once, e.g. the addresses of a chunk of
+    mapped rows. Each distinct address is only normalized once.
+
+    :param address_vals: iterable of addresses
+    :returns: dict of each distinct address to its normalized address
+    """
+    return {
+        address_val: normalize_address_str(address_val)
+        for address_val in set(address_vals)
+    }
+
+
+def _normalize_address_str(address_val):
+    """Normalize the address, see normalize_address_str"""
     address_val = unicode(address_val).encode('utf-8')
 
     # Do some string replacements to remove odd characters that we come across
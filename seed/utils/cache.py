@@ -4,9 +4,25 @@
 :copyright (c) 2014 - 2016, The Regents of the University of California, through Lawrence Berkeley National Laboratory (subject to receipt of any required approvals from the U.S. Department of Energy) and contributors. All rights reserved.  # NOQA
 :author
 """
+from __future__ import absolute_import
+
+import threading
+import time
+import uuid
+
+from django.conf import settings
 from django.core.cache import cache as django_cache
 from django.core.cache.backends.base import DEFAULT_TIMEOUT
 
+# Seconds the progress of a task is kept after its last update. The progress is not refreshed
+# when it is read.
+PROGRESS_TIMEOUT = getattr(settings, 'PROGRESS_TIMEOUT', 24 * 60 * 60)
+
+FINISHED_STATUSES = ['success', 'error', 'warning']
+
+# Seconds a lock is held when it is not renewed, see acquire_lock
+LOCK_TIMEOUT = getattr(settings, 'LOCK_TIMEOUT', 60)
+
 
 def make_key(key):
     return unicode(django_cache.make_key(key))
@@ -20,6 +36,33 @@ def get_cache_raw(key, default=None):
     return django_cache.get(key, default)
 
 
+def get_cache_raw_many(keys):
+    """Return a dict of the keys that are in the cache to their values"""
+    return django_cache.get_many(keys)
+
+
+def add_cache_raw(key, data, timeout=DEFAULT_TIMEOUT):
+    """Set the key only if it is not in the cache. Return True if it was set"""
+    return django_cache.add(key, data, timeout)
+
+
+def incr_cache_raw(key, delta=1, timeout=DEFAULT_TIMEOUT):
+    """
+    Atomically increment the integer counter of the key (INCRBY on redis),
+    creating it with the timeout when it does not exist.
+
+    :return: int, the new value of the counter
+    """
+    # add only sets the counter when there is none
+    add_cache_raw(key, 0, timeout)
+    try:
+        return django_cache.incr(key, delta)
+    except ValueError:
+        # the counter expired since it was added
+        set_cache_raw(key, delta, timeout)
+        return delta
+
+
 def set_cache(progress_key, status, data):
     """
     Sets the cache key to a pickled dictionary containing at least status and progress.
@@ -34,23 +77,36 @@ def set_cache(progress_key, status, data):
     else:
         result = data
     result['status'] = status
-    set_cache_raw(progress_key, result, DEFAULT_TIMEOUT)
+    set_cache_raw(progress_key, result, PROGRESS_TIMEOUT)
+
+    # the increments of increment_cache continue from the new progress
+    progress = result.get('progress')
+    if isinstance(progress, (int, long, float)):
+        set_cache_raw(_progress_counter_key(progress_key), _to_hundredths(progress),
+                      PROGRESS_TIMEOUT)
+    else:
+        delete_cache(_progress_counter_key(progress_key))
 
+    _notify_progress(progress_key)
     return result
 
 
 def get_cache(progress_key, default=None):
-    """Unpickles the cache key to a dictionary and resets the timeout"""
+    """
+    Unpickles the cache key to a dictionary. The progress is read from the
+    counter of increment_cache when the key has one.
+    """
     if default is not None:
         if not isinstance(default, dict):
             default = {'status': 'Unknown', 'progress': default}
-    data = get_cache_raw(progress_key, default)
+    counter_key = _progress_counter_key(progress_key)
+    values = get_cache_raw_many([progress_key, counter_key])
+    data = values.get(progress_key, default)
     if data is None:
         # Cache accessed before it was created
         data = {'status': 'parsing', 'progress': 0.0}
-    else:
-        # Set cache to same value to reset timeout
-        set_cache(progress_key, data['status'], data)
+    elif counter_key in values and isinstance(data, dict):
+        data['progress'] = min(values[counter_key] / 100.0, 100.0)
     return data
 
 
@@ -79,33 +135,205 @@ def delete_cache(progress_key):
     django_cache.delete(progress_key)
 
 
-def lock_cache(progress_key, timeout=60):
-    """Set the lock with a default timeout of 1 minute"""
-    set_cache_raw(progress_key, 1, timeout)
+def delete_cache_many(keys):
+    """Delete all of the keys from the cache"""
+    django_cache.delete_many(keys)
+
+
+# Compare-and-expire and compare-and-delete of the locks on redis, run as one atomic script
+_RENEW_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('expire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+_RELEASE_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+# Serializes the lock operations on the other cache backends. This only makes them atomic within
+# the process, which is enough for the local memory cache of the tests.
+_lock_mutex = threading.Lock()
+
+
+def _redis_lock(lock_key, token):
+    """
+    Return the redis client, the redis key and the stored value of the lock,
+    or None when the cache is not redis.
+    """
+    if not hasattr(django_cache, 'prep_value'):
+        return None
+    return (
+        django_cache.get_client(lock_key, write=True),
+        django_cache.make_key(lock_key),
+        django_cache.prep_value(token),
+    )
+
+
+def acquire_lock(lock_key, timeout=LOCK_TIMEOUT):
+    """
+    Atomically set the lock if it is not already set (SET NX EX on redis).
+
+    :param lock_key: str
+    :param timeout: int, seconds until the lock expires unless it is renewed
+    :return: str, the token of the new owner of the lock, or None when the
+        lock is already held
+    """
+    token = u'{}:{}'.format(uuid.uuid4().hex, repr(time.time()))
+    redis_lock = _redis_lock(lock_key, token)
+    if redis_lock:
+        client, key, value = redis_lock
+        acquired = client.set(key, value, ex=int(timeout), nx=True)
+    else:
+        with _lock_mutex:
+            acquired = django_cache.add(lock_key, token, timeout)
+    return token if acquired else None
+
+
+def renew_lock(lock_key, token, timeout=LOCK_TIMEOUT):
+    """
+    Extend the lock for another timeout if the token still owns it. The check
+    and the renewal are a single atomic operation.
+
+    :return: bool, False when the lock expired or is held by another owner
+    """
+    redis_lock = _redis_lock(lock_key, token)
+    if redis_lock:
+        client, key, value = redis_lock
+        return bool(client.eval(_RENEW_LOCK_SCRIPT, 1, key, value, int(timeout)))
+
+    with _lock_mutex:
+        if get_cache_raw(lock_key) != token:
+            return False
+        set_cache_raw(lock_key, token, timeout)
+        return True
+
+
+def release_lock(lock_key, token):
+    """
+    Unset the lock if the token still owns it. The check and the deletion
+    are a single atomic operation.
+    """
+    redis_lock = _redis_lock(lock_key, token)
+    if redis_lock:
+        client, key, value = redis_lock
+        client.eval(_RELEASE_LOCK_SCRIPT, 1, key, value)
+        return
+
+    with _lock_mutex:
+        if get_cache_raw(lock_key) == token:
+            delete_cache(lock_key)
 
 
-def unlock_cache(progress_key, timeout=DEFAULT_TIMEOUT):
-    """Unset the lock"""
-    set_cache_raw(progress_key, 0, timeout)
+def get_lock_age(lock_key):
+    """Return the seconds since the lock was acquired, or None if it is not held"""
+    token = get_cache_raw(lock_key)
+    try:
+        return time.time() - float(token.split(':')[1])
+    except (AttributeError, IndexError, ValueError):
+        return None
 
 
 def get_lock(lock_key, default=0):
     """Return the locked status. If the lock key does not exist, return 0"""
-    return get_cache_raw(lock_key, default)
+    return 1 if get_cache_raw(lock_key) else default
+
+
+def _progress_counter_key(progress_key):
+    return u'{}:COUNTER'.format(progress_key)
+
+
+def _to_hundredths(progress):
+    return int(round(float(progress) * 100))
 
 
 def increment_cache(key, increment):
-    """Increment cache by value increment, never exceed 100."""
-    increment = round(increment, 2)
-    value = get_cache(key)
-    value = float(value['progress'])
-    if value + increment >= 100.0:
-        value = 100.0
-    else:
-        value += increment
+    """
+    Increment cache by value increment, never exceed 100.
+
+    The progress is summed in an integer counter of hundredths of a percent
+    with the atomic incr of the cache (INCRBY on redis), so the increments of
+    tasks running in parallel are not lost.
+    """
+    value = incr_cache_raw(_progress_counter_key(key), _to_hundredths(increment), PROGRESS_TIMEOUT)
+    value = min(value / 100.0, 100.0)
+
+    result = {'status': 'parsing', 'progress': value}
+    set_cache_raw(key, result, PROGRESS_TIMEOUT)
+    _notify_progress(key)
+    return result
+
+
+def _progress_channel(progress_key):
+    return u'{}:CHANNEL'.format(django_cache.make_key(progress_key))
+
+
+def _notify_progress(progress_key):
+    """Publish on the redis channel of the progress key that its progress changed"""
+    if hasattr(django_cache, 'prep_value'):
+        client = django_cache.get_client(progress_key, write=True)
+        client.publish(_progress_channel(progress_key), 1)
+
+
+def _subscribe_progress(progress_key):
+    """
+    Return a redis pubsub subscribed to the notifications of the progress key,
+    or None when the cache is not redis.
+    """
+    if not hasattr(django_cache, 'prep_value'):
+        return None
+    client = django_cache.get_client(progress_key, write=True)
+    pubsub = client.pubsub(ignore_subscribe_messages=True)
+    pubsub.subscribe(_progress_channel(progress_key))
+    return pubsub
+
+
+def wait_for_progress(progress_key, last_progress=None, last_status=None, timeout=25):
+    """
+    Wait until the progress of the key differs from the last progress and
+    status, or until the task is finished or the timeout expires. Used by the
+    long polling progress endpoint.
+
+    The waiting request blocks on a redis subscription to the notifications
+    of set_cache and increment_cache instead of reading the progress in a
+    loop. The other cache backends can not notify, the progress is returned
+    at once and the client asks again later.
+
+    :param progress_key: str
+    :param last_progress: float, progress the client already has
+    :param last_status: str, status the client already has
+    :param timeout: float, maximum seconds to wait
+    :return: dict, the progress data of the key as returned by get_cache
+    """
+    def changed(data):
+        return (
+            data.get('status') != last_status or
+            last_progress is None or
+            abs(float(data.get('progress') or 0) - float(last_progress)) >= 0.01 or
+            data.get('status') in FINISHED_STATUSES
+        )
+
+    data = get_cache(progress_key)
+    if changed(data) or timeout <= 0:
+        return data
 
-    set_cache(key, 'parsing', value)
-    return {'status': 'parsing', 'progress': value}
+    pubsub = _subscribe_progress(progress_key)
+    if pubsub is None:
+        return data
+    try:
+        deadline = time.time() + timeout
+        while True:
+            # read the progress again, it may have changed before the subscription
+            data = get_cache(progress_key)
+            remaining = deadline - time.time()
+            if changed(data) or remaining <= 0:
+                return data
+            pubsub.get_message(timeout=remaining)
+    finally:
+        pubsub.close()
 
 
 def clear_cache():
@@ -0,0 +1,238 @@
+# !/usr/bin/env python
+# encoding: utf-8
+"""
+:copyright (c) 2014 - 2016, The Regents of the University of California, through Lawrence Berkeley National Laboratory (subject to receipt of any required approvals from the U.S. Department of Energy) and contributors. All rights reserved.  # NOQA
+:author
+"""
+import math
+from collections import OrderedDict
+
+from django.db import connection
+
+COUNT_EXACT = 'exact'
+COUNT_APPROXIMATE = 'approximate'
+
+
+def approximate_count(queryset):
+    """
+    Return the number of rows of the queryset as estimated by the Postgres planner. This avoids
+    scanning all the rows of large cycles at the cost of an approximate number.
+
+    :param queryset: QuerySet
+    :return: int
+    """
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+        plan = cursor.fetchone()[0]
+
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def paginate_views(views, page=1, per_page=1, cursor=None, count=COUNT_EXACT):
+    """
+    Return one page of the views along with the pagination data of the inventory list endpoints.
+
+    The views are ordered by pk within the filtered cycle, i.e. by (cycle, pk). A page is either
+    selected by its number (OFFSET) or, when a cursor is passed, as the views following the
+    cursor (the last pk of the previous page), which stays fast deep into large cycles. In cursor
+    mode the rows before the cursor are not counted, the page number is the one passed by the
+    client. The count is computed once, or estimated by the planner if count is
+    COUNT_APPROXIMATE.
+
+    :param views: QuerySet of PropertyView or TaxLotView, already filtered on the cycle
+    :param page: page number, pages out of range return the last page as the Paginator does
+    :param per_page: int, number of views per page
+    :param cursor: pk of the last view of the previous page, or None. An invalid cursor returns
+        the first page
+    :param count: COUNT_EXACT or COUNT_APPROXIMATE
+    :return: tuple, (list of views, pagination dict)
+    """
+    per_page = int(per_page)
+    views = views.order_by('pk')
+
+    if count == COUNT_APPROXIMATE:
+        total = approximate_count(views)
+    else:
+        total = views.count()
+    num_pages = max(1, int(math.ceil(total / float(per_page))))
+
+    try:
+        page = int(page)
+    except (TypeError, ValueError):
+        page = 1
+
+    if cursor is not None:
+        try:
+            cursor = int(cursor)
+        except (TypeError, ValueError):
+            cursor = None
+            page = 1
+
+    if cursor is not None:
+        page = max(page, 1)
+        offset = (page - 1) * per_page
+        page_views = list(views.filter(pk__gt=cursor)[:per_page + 1])
+    else:
+        if page < 1 or page > num_pages:
+            page = num_pages
+        offset = (page - 1) * per_page
+        page_views = list(views[offset:offset + per_page + 1])
+
+    # One extra view is fetched to know if there is a next page without relying on the count
+    has_next = len(page_views) > per_page
+    page_views = page_views[:per_page]
+
+    pagination = {
+        'page': page,
+        'start': offset + 1 if page_views else 0,
+        'end': offset + len(page_views),
+        'num_pages': num_pages,
+        'has_next': has_next,
+        'has_previous': cursor is not None or offset > 0,
+        'total': total,
+        'next_cursor': page_views[-1].pk if has_next else None,
+    }
+
+    return page_views, pagination
+
+
+def rename_extra_data_key(key, db_columns):
+    """
+    Return the name of the extra_data key in the inventory results. Keys that collide with the id
+    or with database fields are suffixed with '_extra'.
+
+    :param key: str, extra_data key
+    :param db_columns: list or set of the database field names
+    :return: str
+    """
+    if key == 'id':
+        key += '_extra'
+
+    while key in db_columns:
+        key += '_extra'
+
+    return key
+
+
+def extra_data_keys_for_columns(columns, db_columns):
+    """
+    Return the extra_data keys that are displayed under the requested columns, i.e. the reverse of
+    rename_extra_data_key.
+
+    :param columns: list of column names
+    :param db_columns: list or set of the database field names
+    :return: list of extra_data keys
+    """
+    keys = []
+    for column in columns:
+        key = column
+        while True:
+            if rename_extra_data_key(key, db_columns) == column:
+                keys.append(key)
+            if not key.endswith('_extra'):
+                break
+            key = key[:-len('_extra')]
+
+    return sorted(set(keys))
+
+
+def get_state_values(state_model, state_ids, columns=None, db_columns=()):
+    """
+    Load the fields and extra_data of the states, projected on the requested columns in the
+    database so that unneeded fields and extra_data keys are never loaded.
+
+    :param state_model: PropertyState or TaxLotState
+    :param state_ids: list of state ids
+    :param columns: list of requested column names, or None for all the fields and extra_data
+    :param db_columns: list or set of the database field names, used to find the extra_data keys
+        of the columns
+    :return: dict of state id to a tuple of (dict of fields, dict of extra_data)
+    """
+    # Same fields as model_to_dict
+    model_fields = [f.name for f in state_model._meta.concrete_fields
+                    if f.editable and f.name != 'extra_data']
+
+    if columns is None:
+        fields = model_fields + ['extra_data']
+        extra_select = OrderedDict()
+        select_params = []
+    else:
+        fields = [f for f in model_fields if f in columns or f == 'id']
+        extra_select = OrderedDict()
+        select_params = []
+        for ndx, key in enumerate(extra_data_keys_for_columns(columns, db_columns)):
+            extra_select['_extra_data_{}'.format(ndx)] = '"{}"."extra_data" -> %s'.format(
+                state_model._meta.db_table)
+            select_params.append(key)
+        extra_keys = dict(zip(extra_select.keys(), select_params))
+
+    qs = state_model.objects.filter(pk__in=state_ids)
+    if extra_select:
+        qs = qs.extra(select=extra_select, select_params=select_params)
+
+    results = {}
+    for row in qs.values(*(fields + extra_select.keys())):
+        if columns is None:
+            extra_data = row.pop('extra_data') or {}
+        else:
+            # Keys that are not in the extra_data of the state come back as null
+            extra_data = {}
+            for alias in extra_select:
+                value = row.pop(alias)
+                if value is not None:
+                    extra_data[extra_keys[alias]] = value
+
+        results[row['id']] = (row, extra_data)
+
+    return results
+
+
+class InventoryRowSerializer(object):
+    """
+    Build the rows of the inventory lists from the values returned by get_state_values. The
+    extra_data keys are renamed with a lookup in the rename map of the organization (see
+    Column.retrieve_extra_data_rename_map), so each row is built in a single pass.
+    """
+
+    def __init__(self, db_columns, rename_map=None):
+        """
+        :param db_columns: list of the database field names
+        :param rename_map: dict of extra_data key to the name in the rows. Keys that are missing
+            from the map are renamed once and added to it.
+        """
+        self.db_columns = set(db_columns)
+        self.rename_map = dict(rename_map or {})
+
+    def output_key(self, key):
+        try:
+            return self.rename_map[key]
+        except KeyError:
+            name = self.rename_map[key] = rename_extra_data_key(key, self.db_columns)
+            return name
+
+    def serialize(self, state_values, columns=None, extra_fields=None):
+        """
+        Return the row of a state.
+
+        :param state_values: tuple of (dict of fields, dict of extra_data) of the state
+        :param columns: set of the column names to keep, or None to keep all of them
+        :param extra_fields: dict of additional values to add to the row before the extra_data
+        :return: dict
+        """
+        fields, extra_data = state_values
+        row = fields.copy()
+        if extra_fields:
+            row.update(extra_fields)
+
+        rename_map = self.rename_map
+        for key, value in extra_data.iteritems():
+            try:
+                row[rename_map[key]] = value
+            except KeyError:
+                row[self.output_key(key)] = value
+
+        if columns is not None:
+            row = {key: value for key, value in row.iteritems() if key in columns}
+
+        return row
@@ -0,0 +1,213 @@
+# !/usr/bin/env python
+# encoding: utf-8
+"""
+:copyright (c) 2014 - 2016, The Regents of the University of California, through Lawrence Berkeley National Laboratory (subject to receipt of any required approvals from the U.S. Department of Energy) and contributors. All rights reserved.  # NOQA
+:author
+
+Aggregation of the property reports in the database. The properties of each
+cycle are grouped in buckets of the y variable and only the count and median
+of the x variable of each bucket are returned.
+"""
+from django.conf import settings
+from django.db.models import (
+    Aggregate, Case, Count, F, FloatField, Func, IntegerField, Q, Value, When,
+)
+from django.db.models.functions import Lower
+
+from seed.models import PropertyState, PropertyView
+from seed.utils.cache import delete_cache_many, get_cache_raw_many, set_cache_raw
+
+REPORT_X_VARS = [
+    'site_eui', 'source_eui', 'site_eui_weather_normalized',
+    'source_eui_weather_normalized', 'energy_score',
+]
+REPORT_Y_VARS = ['gross_floor_area', 'use_description', 'year_built']
+
+GROSS_FLOOR_AREA_BINS = {
+    0: '0-99k',
+    100000: '100-199k',
+    200000: '200k-299k',
+    300000: '300k-399k',
+    400000: '400-499k',
+    500000: '500-599k',
+    600000: '600-699k',
+    700000: '700-799k',
+    800000: '800-899k',
+    900000: '900-999k',
+    1000000: 'over 1,000k',
+}
+
+# Seconds the aggregated reports of a cycle are kept. They are also cleared when a file is matched
+# into the cycle. 0 disables the summaries.
+REPORT_SUMMARY_TIMEOUT = getattr(settings, 'REPORT_SUMMARY_TIMEOUT', 3600)
+
+
+class Median(Aggregate):
+    """Continuous median, the mean of the two middle values of an even number of values"""
+    function = 'percentile_cont'
+    name = 'Median'
+    template = '%(function)s(0.5) WITHIN GROUP (ORDER BY %(expressions)s)'
+
+    def __init__(self, expression, **extra):
+        super(Median, self).__init__(expression, output_field=FloatField(), **extra)
+
+
+def has_value_q(field, prefix='state__'):
+    """
+    Return the Q of the views whose state has a value, i.e. a truthy value, for the field.
+
+    :param field: str, PropertyState field
+    :param prefix: str, path from the filtered model to the state
+    :return: Q
+    """
+    internal_type = PropertyState._meta.get_field(field).get_internal_type()
+    empty = '' if internal_type in ('CharField', 'TextField') else 0
+    lookup = prefix + field
+    return Q(**{lookup + '__isnull': False}) & ~Q(**{lookup: empty})
+
+
+def report_views(organization_id, cycle_ids, campus_only):
+    """
+    Return the property views of the reports.
+
+    :param organization_id: int
+    :param cycle_ids: list of cycle ids
+    :param campus_only: bool, False to exclude the campus properties
+    :return: QuerySet of PropertyView
+    """
+    views = PropertyView.objects.filter(
+        property__organization_id=organization_id,
+        cycle_id__in=cycle_ids,
+    )
+    if not campus_only:
+        views = views.filter(property__campus=False)
+    return views
+
+
+def get_property_counts(views, x_var, y_var):
+    """
+    Return the number of views and the number of views with values for both variables, per cycle.
+
+    :return: dict of cycle id to a tuple of (num_properties, num_properties_with_data)
+    """
+    counts = views.order_by().values('cycle_id').annotate(
+        num_properties=Count('id'),
+        num_with_data=Count(Case(
+            When(has_value_q(x_var) & has_value_q(y_var), then=Value(1)),
+            output_field=IntegerField(),
+        )),
+    )
+    return {c['cycle_id']: (c['num_properties'], c['num_with_data']) for c in counts}
+
+
+def _bucket_expression(y_var):
+    """Return the expression of the bucket of the y variable"""
+    if y_var == 'use_description':
+        return Lower('state__use_description')
+    elif y_var == 'year_built':
+        # integer division, i.e. the decade
+        return F('state__year_built') / 10 * 10
+    elif y_var == 'gross_floor_area':
+        max_bin = max(GROSS_FLOOR_AREA_BINS)
+        return Func(
+            Func(F('state__gross_floor_area') / Value(100000.0), function='FLOOR') *
+            Value(100000),
+            Value(max_bin),
+            function='LEAST',
+            output_field=FloatField(),
+        )
+    raise ValueError('Invalid y_var {}'.format(y_var))
+
+
+def _bucket_label(y_var, bucket):
+    """Return the label of the bucket in the charts"""
+    if y_var == 'use_description':
+        return bucket.capitalize()
+    elif y_var == 'year_built':
+        decade = str(bucket)
+        return '%s-%s' % (decade, '%s9' % decade[:-1])  # 1990-1999
+    return GROSS_FLOOR_AREA_BINS[int(bucket)]
+
+
+def aggregate_views(views, x_var, y_var):
+    """
+    Return the median of the x variable per cycle and bucket of the y variable, computed in the
+    database.
+
+    :return: list of dicts with the cycle_id, bucket, x (the median) and num_properties
+    """
+    return list(
+        views.filter(has_value_q(x_var) & has_value_q(y_var))
+        .order_by()
+        .annotate(bucket=_bucket_expression(y_var))
+        .values('cycle_id', 'bucket')
+        .annotate(x=Median('state__' + x_var), num_properties=Count('id'))
+        .order_by('cycle_id', 'bucket')
+    )
+
+
+def report_summary_key(cycle_id, x_var, y_var, campus_only):
+    return 'SEED:report_summary:{}:{}:{}:{}'.format(cycle_id, x_var, y_var, int(bool(campus_only)))
+
+
+def clear_report_summaries(cycle_ids):
+    """Clear the cached aggregated reports of the cycles, e.g. after matching"""
+    delete_cache_many([
+        report_summary_key(cycle_id, x_var, y_var, campus_only)
+        for cycle_id in cycle_ids
+        for x_var in REPORT_X_VARS
+        for y_var in REPORT_Y_VARS
+        for campus_only in (False, True)
+    ])
+
+
+def get_aggregated_report(organization_id, cycles, x_var, y_var, campus_only):
+    """
+    Return the aggregated report of each cycle, in the format of
+    Report.get_raw_report_data, with one chart point per bucket.
+
+    The reports of the cycles are kept in the cache for REPORT_SUMMARY_TIMEOUT, so only the cycles
+    without a summary are aggregated.
+
+    :param organization_id: int
+    :param cycles: list of Cycle
+    :param x_var: str, one of REPORT_X_VARS
+    :param y_var: str, one of REPORT_Y_VARS
+    :param campus_only: bool, False to exclude the campus properties
+    :return: list of dicts with the cycle_id, chart_data and property_counts
+    """
+    keys = {c.pk: report_summary_key(c.pk, x_var, y_var, campus_only) for c in cycles}
+    summaries = {}
+    if REPORT_SUMMARY_TIMEOUT:
+        cached = get_cache_raw_many(keys.values())
+        summaries = {pk: cached[key] for pk, key in keys.items() if key in cached}
+
+    missing = [c for c in cycles if c.pk not in summaries]
+    if missing:
+        views = report_views(organization_id, [c.pk for c in missing], campus_only)
+        counts = get_property_counts(views, x_var, y_var)
+        chart_data = {c.pk: [] for c in missing}
+        for row in aggregate_views(views, x_var, y_var):
+            chart_data[row['cycle_id']].append({
+                'x': row['x'],
+                'y': _bucket_label(y_var, row['bucket']),
+            })
+
+        for cycle in missing:
+            num_properties, num_with_data = counts.get(cycle.pk, (0, 0))
+            yr_e = cycle.end.strftime('%Y')
+            for point in chart_data[cycle.pk]:
+                point['yr_e'] = yr_e
+            summaries[cycle.pk] = {
+                'cycle_id': cycle.pk,
+                'chart_data': chart_data[cycle.pk],
+                'property_counts': {
+                    'yr_e': yr_e,
+                    'num_properties': num_properties,
+                    'num_properties_w-data': num_with_data,
+                },
+            }
+            if REPORT_SUMMARY_TIMEOUT:
+                set_cache_raw(keys[cycle.pk], summaries[cycle.pk], REPORT_SUMMARY_TIMEOUT)
+
+    return [summaries[c.pk] for c in cycles]
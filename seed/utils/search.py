@@ -6,10 +6,14 @@
 """
 import re
 import operator
+from collections import namedtuple
 
 from django.db.models import Q
 from functools import reduce
 
+from seed.utils import search_index
+from seed.utils.lru import LRUCache
+
 
 SUFFIXES = ['__lt', '__gt', '__lte', '__gte', '__isnull']
 DATE_FIELDS = ['year_ending']
@@ -184,3 +188,217 @@ def parse_expression(k, parts):
         else:
             query_filters.append(q_object)
     return reduce(operator.and_, query_filters, Q())
+
+
+# Kinds of the parsed filter params
+FILTER_EXACT = 'exact'
+FILTER_IEXACT = 'iexact'
+FILTER_EMPTY = 'empty'
+FILTER_NOT_EMPTY = 'not_empty'
+FILTER_EXPRESSION = 'expression'
+FILTER_EXCLUDE = 'exclude'
+FILTER_EXACT_EXCLUDE = 'exact_exclude'
+FILTER_LOOKUP = 'lookup'
+FILTER_LABELS = 'labels'
+FILTER_CONTAINS = 'contains'
+
+# Filters matched on the text of an extra_data key, which can use its trigram index
+TEXT_FILTERS = {FILTER_EXACT, FILTER_IEXACT, FILTER_CONTAINS}
+
+RANGE_SUFFIXES = ('__gt', '__gte', '__lt', '__lte')
+LOOKUP_KEYS = {'import_file_id', 'source_type'}
+ISO_DATETIME_REGEX = re.compile(r'^\d{4}-\d{2}-\d{2}[ T]\d{2}:\d{2}:\d{2}.\d{3}\w$')
+
+# Number of parsed param sets that are kept by compile_filters
+FILTER_CACHE_SIZE = 1000
+
+FilterNode = namedtuple('FilterNode', ['key', 'kind', 'value', 'in_columns'])
+"""
+A parsed filter param.
+
+key: the param name, e.g. 'gross_floor_area__gte' or an extra_data key
+kind: one of the FILTER_* constants
+value: the value to match, the expression parts for FILTER_EXPRESSION
+in_columns: True for a database field, False for an extra_data key
+"""
+
+_filter_cache = LRUCache(FILTER_CACHE_SIZE)
+
+
+def parse_column_filter(k, v):
+    """
+    Parse the filter param on a database field, see filter_other_params for
+    the syntax. Returns None if the param does not filter anything.
+    """
+    if v is None or v == '' or v == []:
+        return None
+
+    exact_match = is_exact_match(v)
+    if exact_match:
+        return FilterNode(k, FILTER_EXACT, exact_match.group(2), True)
+    case_insensitive_match = is_case_insensitive_match(v)
+    if case_insensitive_match:
+        return FilterNode(k, FILTER_IEXACT, case_insensitive_match.group(2), True)
+    if is_empty_match(v):
+        return FilterNode(k, FILTER_EMPTY, None, True)
+    if is_not_empty_match(v):
+        return FilterNode(k, FILTER_NOT_EMPTY, None, True)
+    parts = is_numeric_expression(v) or is_string_expression(v)
+    if parts:
+        return FilterNode(k, FILTER_EXPRESSION, tuple(parts), True)
+    exclude_filter = is_exclude_filter(v)
+    if exclude_filter:
+        return FilterNode(k, FILTER_EXCLUDE, exclude_filter.group(1), True)
+    exact_exclude_filter = is_exact_exclude_filter(v)
+    if exact_exclude_filter:
+        return FilterNode(k, FILTER_EXACT_EXCLUDE, exact_exclude_filter.group(2), True)
+    if any(suffix in k for suffix in RANGE_SUFFIXES):
+        # Check if this is ISO8601 from a input date. Shorten to YYYY-MM-DD
+        if is_date_field(k) and is_string_query(v) and ISO_DATETIME_REGEX.match(v):
+            v = v[:10]
+        return FilterNode(k, FILTER_LOOKUP, v, True)
+    if '__isnull' in k or k in LOOKUP_KEYS:
+        return FilterNode(k, FILTER_LOOKUP, v, True)
+    if k == 'canonical_building__labels':
+        return FilterNode(k, FILTER_LABELS, tuple(v), True)
+    return FilterNode(k, FILTER_CONTAINS, v, True)
+
+
+def parse_extra_data_filter(k, v):
+    """
+    Parse the filter param on an extra_data key, see filter_other_params for
+    the syntax. Returns None if the param does not filter anything.
+    """
+    if not v:
+        return None
+
+    if is_empty_match(v):
+        return FilterNode(k, FILTER_EMPTY, None, False)
+    if is_not_empty_match(v):
+        return FilterNode(k, FILTER_NOT_EMPTY, None, False)
+    exclude_filter = is_exclude_filter(v)
+    if exclude_filter:
+        return FilterNode(k, FILTER_EXCLUDE, exclude_filter.group(1), False)
+    exact_exclude_filter = is_exact_exclude_filter(v)
+    if exact_exclude_filter:
+        return FilterNode(k, FILTER_EXACT_EXCLUDE, exact_exclude_filter.group(2), False)
+    exact_match = is_exact_match(v)
+    if exact_match:
+        return FilterNode(k, FILTER_EXACT, exact_match.group(2), False)
+    case_insensitive_match = is_case_insensitive_match(v)
+    if case_insensitive_match:
+        return FilterNode(k, FILTER_IEXACT, case_insensitive_match.group(2), False)
+    if k.endswith(RANGE_SUFFIXES):
+        return FilterNode(k, FILTER_LOOKUP, v, False)
+    return FilterNode(k, FILTER_CONTAINS, v, False)
+
+
+def _hashable(v):
+    if isinstance(v, list):
+        return tuple(v)
+    return v
+
+
+def compile_filters(other_params, db_columns):
+    """
+    Parse the filter params once into a tuple of FilterNode. The result is
+    cached by the normalized params (and whether each key is a database
+    field), so the same filters sent again, e.g. by a polling dashboard, are
+    not parsed again.
+
+    :param dict other_params: filter params, see filter_other_params
+    :param dict db_columns: database fields, the other keys are extra_data
+    :returns: tuple of FilterNode
+    """
+    params = [(k, v, is_column(k, db_columns)) for k, v in other_params.iteritems() if k != 'q']
+    try:
+        cache_key = tuple(sorted((k, _hashable(v), in_columns) for k, v, in_columns in params))
+        nodes = _filter_cache.get(cache_key)
+    except TypeError:
+        # unhashable values are parsed every time
+        cache_key = nodes = None
+    if nodes is not None:
+        return nodes
+
+    nodes = []
+    for k, v, in_columns in params:
+        if in_columns:
+            node = parse_column_filter(k, v)
+        else:
+            node = parse_extra_data_filter(k, v)
+        if node is not None:
+            nodes.append(node)
+    nodes = tuple(nodes)
+
+    if cache_key is not None:
+        _filter_cache.set(cache_key, nodes)
+    return nodes
+
+
+def indexed_extra_data_q(table, key, value):
+    """
+    Return an icontains lookup on the extra_data key, which is implied by an
+    exact or iexact match on the same value, when the key has a trigram index.
+    Adding it to the exact match lets Postgres look up the candidates in the
+    index instead of reading the extra_data of every row.
+
+    :param table: str, name of the table that is filtered
+    :param key: str, extra_data key
+    :param value: str, value that is matched
+    :returns: Q, empty if the key is not indexed
+    """
+    if len(value) < search_index.TRIGRAM_MIN_LENGTH or \
+            not search_index.is_extra_data_key_indexed(table, key):
+        return Q()
+
+    return Q(**{'extra_data__at_%s__icontains' % key: value})
+
+
+def filter_node_q(node, table):
+    """
+    Return the Q of a parsed filter.
+
+    :param node: FilterNode, not FILTER_LABELS
+    :param table: str, name of the table that is filtered, for the extra_data
+        trigram indexes
+    :returns: Q
+    """
+    field = node.key if node.in_columns else 'extra_data__at_%s' % node.key
+    kind = node.kind
+
+    if kind == FILTER_EXACT or kind == FILTER_IEXACT:
+        q = Q(**{'%s__%s' % (field, kind): node.value})
+        if not node.in_columns:
+            q &= indexed_extra_data_q(table, node.key, node.value)
+        return q
+    elif kind == FILTER_EMPTY:
+        return Q(**{'%s__exact' % field: ''}) | Q(**{'%s__isnull' % field: True})
+    elif kind == FILTER_NOT_EMPTY:
+        return ~Q(**{'%s__exact' % field: ''}) & Q(**{'%s__isnull' % field: False})
+    elif kind == FILTER_EXPRESSION:
+        return parse_expression(field, node.value)
+    elif kind == FILTER_EXCLUDE:
+        return ~Q(**{'%s__icontains' % field: node.value})
+    elif kind == FILTER_EXACT_EXCLUDE:
+        return ~Q(**{'%s__exact' % field: node.value})
+    elif kind == FILTER_LOOKUP:
+        return Q(**{field: node.value})
+    elif kind == FILTER_CONTAINS:
+        return Q(**{'%s__icontains' % field: node.value})
+
+    raise ValueError('Unknown filter {}'.format(kind))
+
+
+def filters_q(nodes, table):
+    """
+    Return the combined Q of the parsed filters on the database fields and the
+    extra_data keys. The label filters are not included, each label is a
+    separate join (see filter_other_params).
+
+    :param nodes: tuple of FilterNode, from compile_filters
+    :param table: str, name of the table that is filtered
+    :returns: Q
+    """
+    return reduce(operator.and_, (
+        filter_node_q(node, table) for node in nodes if node.kind != FILTER_LABELS
+    ), Q())
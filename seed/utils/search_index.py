@@ -0,0 +1,238 @@
+# !/usr/bin/env python
+# encoding: utf-8
+"""
+:copyright (c) 2014 - 2016, The Regents of the University of California, through Lawrence Berkeley National Laboratory (subject to receipt of any required approvals from the U.S. Department of Energy) and contributors. All rights reserved.  # NOQA
+:author
+
+Trigram search indexes of the inventory.
+
+The case insensitive lookups (icontains, iexact) are compiled by Django to
+``UPPER(<column>::text) LIKE UPPER(%s)``. The indexes are GIN pg_trgm indexes
+built on that same expression, so the existing queries can use them without
+being rewritten:
+
+* the searchable fields of the states (SEARCH_FIELDS) are indexed by the
+  migration that installs pg_trgm,
+* the extra_data keys that are filtered often are indexed on demand, one
+  expression index per table and key (see create_extra_data_index and the
+  create_search_indexes command). States that do not have the key are not in
+  the index, so a single index serves every organization that uses the key.
+"""
+import hashlib
+import logging
+
+from django.conf import settings
+from django.db import connection, DatabaseError
+
+from seed.utils.cache import (
+    add_cache_raw,
+    delete_cache,
+    delete_cache_many,
+    get_cache_raw,
+    get_cache_raw_many,
+    incr_cache_raw,
+    set_cache_raw,
+)
+
+_log = logging.getLogger(__name__)
+
+# State fields searched by the free text search of the inventory, indexed by 0062_search_index
+SEARCH_FIELDS = {
+    'property': [
+        'pm_parent_property_id',
+        'jurisdiction_property_id',
+        'pm_property_id',
+        'address_line_1',
+        'property_name',
+    ],
+    'taxlot': [
+        'jurisdiction_tax_lot_id',
+        'address_line_1',
+        'block_number',
+    ],
+}
+
+# Patterns shorter than a trigram cannot be looked up in the indexes
+TRIGRAM_MIN_LENGTH = 3
+
+EXTRA_DATA_INDEX_TIMEOUT = 3600
+EXTRA_DATA_FILTERS_TIMEOUT = 7 * 86400
+
+_available = None
+
+
+def trigram_available():
+    """
+    Return True if the pg_trgm extension is installed and the search indexes are enabled with the
+    SEARCH_INDEX_ENABLED setting. The extension check is done once per process.
+
+    :return: bool
+    """
+    global _available
+
+    if not getattr(settings, 'SEARCH_INDEX_ENABLED', True):
+        return False
+
+    if _available is None:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+            _available = cursor.fetchone() is not None
+
+    return _available
+
+
+def trigram_index_name(table, field):
+    """Name of the trigram index of a field, as created by the migration"""
+    return '{}_{}_trgm'.format(table, field)
+
+
+def extra_data_index_name(table, key):
+    """
+    Name of the trigram index of an extra_data key. The key is hashed to fit in the 63 characters
+    of the Postgres identifiers.
+    """
+    digest = hashlib.md5(key.encode('utf-8')).hexdigest()[:12]
+    return '{}_ed_{}_trgm'.format(table, digest)
+
+
+def _extra_data_index_key(table):
+    return 'SEED:search_index:extra_data:{}'.format(table)
+
+
+def _extra_data_filters_key(table):
+    """Key of the number of the extra_data keys of the table that are counted"""
+    return 'SEED:search_index:filters:{}'.format(table)
+
+
+def _extra_data_filter_key(table, slot):
+    """Key of the name of the slot-th extra_data key of the table that is counted"""
+    return '{}:key:{}'.format(_extra_data_filters_key(table), slot)
+
+
+def _extra_data_filter_count_key(table, key):
+    """Key of the counter of the filters on the extra_data key of the table"""
+    digest = hashlib.md5(key.encode('utf-8')).hexdigest()[:12]
+    return '{}:count:{}'.format(_extra_data_filters_key(table), digest)
+
+
+def _get_counted_extra_data_keys(table):
+    num_keys = get_cache_raw(_extra_data_filters_key(table)) or 0
+    return set(get_cache_raw_many(
+        [_extra_data_filter_key(table, slot) for slot in range(1, num_keys + 1)]
+    ).values())
+
+
+def get_extra_data_index_names(table):
+    """
+    Return the set of the names of the extra_data trigram indexes of the table.
+
+    :param table: str, name of the table
+    :return: set
+    """
+    key = _extra_data_index_key(table)
+    names = get_cache_raw(key)
+    if names is None:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT indexname FROM pg_indexes WHERE tablename = %s AND indexname LIKE %s",
+                [table, r'{}\_ed\_%\_trgm'.format(table.replace('_', r'\_'))]
+            )
+            names = set(row[0] for row in cursor.fetchall())
+        set_cache_raw(key, names, EXTRA_DATA_INDEX_TIMEOUT)
+
+    return names
+
+
+def is_extra_data_key_indexed(table, key):
+    """Return True if the extra_data key has a trigram index in the table"""
+    if not trigram_available():
+        return False
+
+    return extra_data_index_name(table, key) in get_extra_data_index_names(table)
+
+
+def create_extra_data_index(model, key, concurrently=True):
+    """
+    Create the trigram index of an extra_data key. The index is on the same expression as the
+    ``extra_data__at_<key>__icontains`` lookups.
+
+    :param model: model with an extra_data JsonField, e.g. PropertyState
+    :param key: str, extra_data key
+    :param concurrently: bool, build the index without locking the table. This cannot be done in
+        a transaction.
+    :return: bool, True if the index was created
+    """
+    table = model._meta.db_table
+    if not trigram_available() or "'" in key or '%' in key:
+        # Keys are interpolated in the SQL of the lookups as is (see
+        # django_pgjson.lookups.KeyTransform), the lookups cannot be indexed for these keys
+        return False
+
+    name = extra_data_index_name(table, key)
+    if name in get_extra_data_index_names(table):
+        return False
+
+    sql = 'CREATE INDEX {} "{}" ON "{}" USING gin ' \
+          '((UPPER(("extra_data"->>\'{}\')::text)) gin_trgm_ops)'.format(
+              'CONCURRENTLY' if concurrently else '', name, table, key)
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(sql)
+    except DatabaseError as e:
+        _log.error('Could not create the search index of {}.{}: {}'.format(table, key, e))
+        return False
+    finally:
+        delete_cache(_extra_data_index_key(table))
+
+    _log.info('Created the search index {} of {}.{}'.format(name, table, key))
+    return True
+
+
+def record_extra_data_filters(table, keys):
+    """
+    Count the filters on the extra_data keys of a table, see get_frequent_extra_data_keys.
+
+    Each key has its own counter incremented with the atomic incr of the
+    cache, so the counts of concurrent requests are not lost. The first time
+    a key is counted its name is registered in the next slot of the table,
+    the slots are numbered by an atomic counter as well.
+
+    :param table: str, name of the table
+    :param keys: list of the extra_data keys that are filtered on
+    """
+    for key in set(keys):
+        count_key = _extra_data_filter_count_key(table, key)
+        if add_cache_raw(count_key, 0, EXTRA_DATA_FILTERS_TIMEOUT):
+            slot = incr_cache_raw(_extra_data_filters_key(table), 1, EXTRA_DATA_FILTERS_TIMEOUT)
+            set_cache_raw(_extra_data_filter_key(table, slot), key, EXTRA_DATA_FILTERS_TIMEOUT)
+        incr_cache_raw(count_key, 1, EXTRA_DATA_FILTERS_TIMEOUT)
+
+
+def get_frequent_extra_data_keys(table, min_filters):
+    """
+    Return the extra_data keys of a table that were filtered on at least min_filters times.
+
+    :param table: str, name of the table
+    :param min_filters: int
+    :return: list of keys, most filtered first
+    """
+    count_keys = {
+        _extra_data_filter_count_key(table, key): key
+        for key in _get_counted_extra_data_keys(table)
+    }
+    counts = {
+        count_keys[count_key]: count
+        for count_key, count in get_cache_raw_many(count_keys.keys()).iteritems()
+    }
+    keys = [k for k, count in counts.iteritems() if count >= min_filters]
+    return sorted(keys, key=lambda k: (-counts[k], k))
+
+
+def clear_extra_data_filters(table):
+    """Delete the counts of the filters on the extra_data keys of a table"""
+    num_keys = get_cache_raw(_extra_data_filters_key(table)) or 0
+    delete_cache_many(
+        [_extra_data_filter_count_key(table, key) for key in _get_counted_extra_data_keys(table)] +
+        [_extra_data_filter_key(table, slot) for slot in range(1, num_keys + 1)] +
+        [_extra_data_filters_key(table)]
+    )
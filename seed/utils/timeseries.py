@@ -0,0 +1,325 @@
+# !/usr/bin/env python
+# encoding: utf-8
+"""
+:copyright (c) 2014 - 2016, The Regents of the University of California, through Lawrence Berkeley National Laboratory (subject to receipt of any required approvals from the U.S. Department of Energy) and contributors. All rights reserved.  # NOQA
+:author
+
+Rollups and resampling of the TimeSeries of the meters.
+
+The daily and monthly aggregates of the readings of each meter are kept in
+TimeSeriesRollup and updated in the database when readings are added. Other
+resolutions are aggregated on the fly with NumPy, from the rollups when they
+are finer than the requested resolution, from the raw readings otherwise.
+The periods are aligned on the TIME_ZONE of the settings.
+"""
+import calendar
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from seed.models import TimeSeries, TimeSeriesRollup
+
+RAW = 'raw'
+HOUR = 'hour'
+DAY = TimeSeriesRollup.DAY
+WEEK = 'week'
+MONTH = TimeSeriesRollup.MONTH
+YEAR = 'year'
+
+# Resolutions kept in TimeSeriesRollup
+ROLLUP_RESOLUTIONS = [DAY, MONTH]
+
+# Source of the resolutions that are resampled, the finest rollup that divides the periods
+RESAMPLE_SOURCES = {
+    HOUR: RAW,
+    WEEK: DAY,
+    YEAR: MONTH,
+}
+
+RESOLUTIONS = [RAW, HOUR, DAY, WEEK, MONTH, YEAR]
+
+_ROLLUP_SQL = """
+    INSERT INTO seed_timeseriesrollup
+        (meter_id, resolution, period_start, count, reading_sum, reading_min, reading_max,
+         cost_sum)
+    SELECT meter_id, %(resolution)s, period_start, COUNT(reading), SUM(reading), MIN(reading),
+           MAX(reading), SUM(cost)
+    FROM (
+        SELECT meter_id, reading, cost,
+               date_trunc(%(resolution)s, begin_time AT TIME ZONE %(tz)s) AT TIME ZONE %(tz)s
+               AS period_start
+        FROM seed_timeseries
+        WHERE meter_id = ANY(%(meter_ids)s)
+          AND begin_time >= %(start)s AND begin_time < %(end)s
+    ) readings
+    GROUP BY meter_id, period_start
+"""
+
+
+def truncate(dt, resolution):
+    """
+    Return the start of the period of the resolution that contains dt, in the
+    time zone of the settings.
+
+    :param dt: aware datetime
+    :param resolution: str, one of RESOLUTIONS except RAW
+    :return: aware datetime
+    """
+    tz = timezone.get_default_timezone()
+    local = timezone.localtime(dt, tz).replace(tzinfo=None)
+    if resolution == HOUR:
+        local = local.replace(minute=0, second=0, microsecond=0)
+    else:
+        local = local.replace(hour=0, minute=0, second=0, microsecond=0)
+        if resolution == WEEK:
+            local -= timedelta(days=local.weekday())
+        elif resolution == MONTH:
+            local = local.replace(day=1)
+        elif resolution == YEAR:
+            local = local.replace(month=1, day=1)
+    return tz.normalize(tz.localize(local))
+
+
+def next_period(period_start, resolution):
+    """
+    Return the start of the period that follows period_start.
+
+    :param period_start: aware datetime, as returned by truncate
+    :param resolution: str, one of RESOLUTIONS except RAW
+    :return: aware datetime
+    """
+    if resolution == HOUR:
+        return period_start + timedelta(hours=1)
+
+    tz = timezone.get_default_timezone()
+    local = timezone.localtime(period_start, tz).replace(tzinfo=None)
+    if resolution == DAY:
+        local += timedelta(days=1)
+    elif resolution == WEEK:
+        local += timedelta(days=7)
+    elif resolution == MONTH:
+        local = (local.replace(day=28) + timedelta(days=4)).replace(day=1)
+    elif resolution == YEAR:
+        local = local.replace(year=local.year + 1)
+    return tz.normalize(tz.localize(local))
+
+
+def period_edges(start, end, resolution):
+    """
+    Return the starts of the periods that overlap [start, end), followed by
+    the end of the last period.
+
+    :return: list of aware datetimes
+    """
+    edges = [truncate(start, resolution)]
+    while edges[-1] < end:
+        edges.append(next_period(edges[-1], resolution))
+    return edges
+
+
+def update_rollups(meter_ids, start=None, end=None):
+    """
+    Recompute the rollups of the periods of the meters that contain readings
+    beginning in [start, end], e.g. after readings were added. Only the
+    readings of those periods are aggregated, in the database.
+
+    :param meter_ids: list of Meter ids
+    :param start: aware datetime, defaults to the first reading of the meters
+    :param end: aware datetime, defaults to the last reading of the meters
+    """
+    meter_ids = list(meter_ids)
+    if not meter_ids:
+        return
+    if start is None or end is None:
+        bounds = TimeSeries.objects.filter(meter_id__in=meter_ids).aggregate(
+            start=Min('begin_time'), end=Max('begin_time'))
+        start = start or bounds['start']
+        end = end or bounds['end']
+        if start is None:
+            return
+
+    with transaction.atomic():
+        cursor = connection.cursor()
+        for resolution in ROLLUP_RESOLUTIONS:
+            period_start = truncate(start, resolution)
+            period_end = next_period(truncate(end, resolution), resolution)
+            TimeSeriesRollup.objects.filter(
+                meter_id__in=meter_ids,
+                resolution=resolution,
+                period_start__gte=period_start,
+                period_start__lt=period_end,
+            ).delete()
+            cursor.execute(_ROLLUP_SQL, {
+                'resolution': resolution,
+                'tz': settings.TIME_ZONE,
+                'meter_ids': meter_ids,
+                'start': period_start,
+                'end': period_end,
+            })
+
+
+def _timestamp(dt):
+    return calendar.timegm(dt.utctimetuple())
+
+
+def _column(rows, index, dtype=float):
+    """Return the column of the rows as an array, None is nan"""
+    return np.array([row[index] for row in rows], dtype=dtype)
+
+
+def resample(times, edges, sums, counts, mins, maxs, costs):
+    """
+    Aggregate values in the periods delimited by the edges, vectorized with NumPy.
+
+    The values are either raw readings, with a count of 1 and the reading as
+    the sum, min and max, or aggregates of finer periods. nan values, e.g. of
+    missing readings, are ignored.
+
+    :param times: array of the times of the values, in seconds since epoch
+    :param edges: sorted array of the starts of the periods followed by the
+        end of the last period, in seconds since epoch
+    :param sums: array of the sums of the readings
+    :param counts: array of the number of readings of the sums
+    :param mins: array of the minimum readings
+    :param maxs: array of the maximum readings
+    :param costs: array of the costs
+    :return: dict of arrays of the aggregates of each period, with the keys
+        'count', 'sum', 'min', 'max' and 'cost'
+    """
+    num_periods = len(edges) - 1
+    periods = np.searchsorted(edges, times, side='right') - 1
+    in_range = (periods >= 0) & (periods < num_periods)
+    periods = periods[in_range]
+
+    result = {
+        'count': np.bincount(
+            periods, weights=np.nan_to_num(counts[in_range]), minlength=num_periods),
+        'sum': np.bincount(
+            periods, weights=np.nan_to_num(sums[in_range]), minlength=num_periods),
+        'cost': np.bincount(
+            periods, weights=np.nan_to_num(costs[in_range]), minlength=num_periods),
+        'min': np.full(num_periods, np.nan),
+        'max': np.full(num_periods, np.nan),
+    }
+    # fmin and fmax ignore the nan values
+    np.fmin.at(result['min'], periods, mins[in_range])
+    np.fmax.at(result['max'], periods, maxs[in_range])
+
+    # periods with costs but without readings have no sum
+    result['sum'][result['count'] == 0] = np.nan
+    return result
+
+
+def _rollup_data(rollup):
+    count = rollup.count
+    return {
+        'begin_time': rollup.period_start,
+        'end_time': next_period(rollup.period_start, rollup.resolution),
+        'count': count,
+        'reading': rollup.reading_sum,
+        'min': rollup.reading_min,
+        'max': rollup.reading_max,
+        'mean': rollup.reading_sum / count if count else None,
+        'cost': float(rollup.cost_sum) if rollup.cost_sum is not None else None,
+    }
+
+
+def get_rollups(meter_ids, resolution, start, end):
+    """
+    Return the rollups of the meters in [start, end), in a single query.
+
+    :param meter_ids: list of Meter ids
+    :param resolution: str, one of ROLLUP_RESOLUTIONS
+    :param start: aware datetime
+    :param end: aware datetime
+    :return: dict of meter id to the list of the periods, see get_timeseries_range
+    """
+    result = {meter_id: [] for meter_id in meter_ids}
+    rollups = TimeSeriesRollup.objects.filter(
+        meter_id__in=meter_ids,
+        resolution=resolution,
+        period_start__gte=truncate(start, resolution),
+        period_start__lt=end,
+    ).order_by('meter_id', 'period_start')
+    for rollup in rollups:
+        result[rollup.meter_id].append(_rollup_data(rollup))
+    return result
+
+
+def get_timeseries_range(meter_id, start, end, resolution=RAW):
+    """
+    Return the readings of a meter in [start, end) at the resolution.
+
+    :param meter_id: int, Meter id
+    :param start: aware datetime
+    :param end: aware datetime
+    :param resolution: str, one of RESOLUTIONS
+    :return: list of dicts with the begin_time, end_time, count, reading (the
+        sum of the readings), min, max, mean and cost of each period, or of
+        each reading for RAW
+    """
+    if resolution not in RESOLUTIONS:
+        raise ValueError('Invalid resolution {}'.format(resolution))
+
+    if resolution in ROLLUP_RESOLUTIONS:
+        return get_rollups([meter_id], resolution, start, end)[meter_id]
+
+    source = RESAMPLE_SOURCES.get(resolution, RAW)
+    if source == RAW:
+        rows = list(TimeSeries.objects.filter(
+            meter_id=meter_id,
+            begin_time__gte=start if resolution == RAW else truncate(start, resolution),
+            begin_time__lt=end,
+        ).order_by('begin_time').values_list('begin_time', 'end_time', 'reading', 'cost'))
+        if resolution == RAW:
+            return [{
+                'begin_time': begin_time,
+                'end_time': end_time,
+                'count': 1 if reading is not None else 0,
+                'reading': reading,
+                'min': reading,
+                'max': reading,
+                'mean': reading,
+                'cost': float(cost) if cost is not None else None,
+            } for begin_time, end_time, reading, cost in rows]
+
+        readings = _column(rows, 2)
+        counts = (~np.isnan(readings)).astype(float)
+        columns = (readings, counts, readings, readings, _column(rows, 3))
+    else:
+        rows = list(TimeSeriesRollup.objects.filter(
+            meter_id=meter_id,
+            resolution=source,
+            period_start__gte=truncate(start, resolution),
+            period_start__lt=end,
+        ).order_by('period_start').values_list(
+            'period_start', 'count', 'reading_sum', 'reading_min', 'reading_max', 'cost_sum'))
+        columns = tuple(_column(rows, i) for i in (2, 1, 3, 4, 5))
+
+    if not rows:
+        return []
+
+    edges = period_edges(start, end, resolution)
+    times = np.array([_timestamp(row[0]) for row in rows], dtype=float)
+    aggregates = resample(
+        times, np.array([_timestamp(edge) for edge in edges], dtype=float), *columns)
+
+    result = []
+    for i in np.flatnonzero((aggregates['count'] > 0) | (aggregates['cost'] != 0)):
+        count = int(aggregates['count'][i])
+        reading = aggregates['sum'][i]
+        result.append({
+            'begin_time': edges[i],
+            'end_time': edges[i + 1],
+            'count': count,
+            'reading': None if np.isnan(reading) else float(reading),
+            'min': None if np.isnan(aggregates['min'][i]) else float(aggregates['min'][i]),
+            'max': None if np.isnan(aggregates['max'][i]) else float(aggregates['max'][i]),
+            'mean': float(reading) / count if count else None,
+            'cost': float(aggregates['cost'][i]),
+        })
+    return result
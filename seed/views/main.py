@@ -49,7 +49,7 @@ from seed.utils.buildings import (
     get_columns as utils_get_columns,
     get_buildings_for_user_count
 )
-from seed.utils.cache import get_cache, set_cache
+from seed.utils.cache import get_cache, set_cache, wait_for_progress
 from seed.utils.projects import (
     get_projects,
 )
@@ -1064,6 +1064,55 @@ def progress(request):
         })
 
 
+# Maximum seconds a progress_wait request is held open
+PROGRESS_WAIT_TIMEOUT = getattr(settings, 'PROGRESS_WAIT_TIMEOUT', 25)
+
+
+@api_endpoint
+@ajax_request
+@login_required
+@api_view(['POST'])
+def progress_wait(request):
+    """
+    Long polling version of progress. The request is held until the progress
+    of the task differs from the progress the client already has, the task is
+    finished, or the timeout expires. The request waits on a redis
+    subscription, it does not read the progress in a loop.
+
+    Payload::
+
+        {
+            'progress_key': The progress key from starting a background task,
+            'progress': The last progress received, optional,
+            'status': The last status received, optional,
+            'timeout': Maximum seconds to wait, optional
+        }
+
+    Returns::
+
+        {
+            'progress_key': The same progress key,
+            'progress': Percent completion,
+            'status': Status of the task
+        }
+    """
+    progress_key = request.data.get('progress_key')
+    try:
+        timeout = min(float(request.data.get('timeout', PROGRESS_WAIT_TIMEOUT)),
+                      PROGRESS_WAIT_TIMEOUT)
+    except (TypeError, ValueError):
+        timeout = PROGRESS_WAIT_TIMEOUT
+
+    data = wait_for_progress(
+        progress_key,
+        last_progress=request.data.get('progress'),
+        last_status=request.data.get('status'),
+        timeout=timeout,
+    )
+    data.setdefault('progress_key', progress_key)
+    return JsonResponse(data)
+
+
 # @api_endpoint
 # @ajax_request
 # @login_required
@@ -7,6 +7,7 @@
 import json
 
 from django.contrib.auth.decorators import login_required
+from django.utils import timezone
 
 from seed.decorators import ajax_request
 from seed.lib.superperms.orgs.decorators import has_perm
@@ -19,6 +20,7 @@ from seed.models import (
     TimeSeries
 )
 from seed.utils.time import convert_datestr
+from seed.utils.timeseries import RAW, RESOLUTIONS, get_timeseries_range, update_rollups
 
 
 @ajax_request
@@ -120,7 +122,7 @@ def get_timeseries(request):
 
     paginated_ts = TimeSeries.objects.filter(
         meter_id=meter_id
-    )[offset:offset + num]
+    ).order_by('begin_time', 'id')[offset:offset + num]
 
     for ts in paginated_ts:
         t = obj_to_dict(ts)
@@ -129,6 +131,53 @@ def get_timeseries(request):
     return result
 
 
+def _aware_datestr(datestr):
+    """Converts a date string into an aware datetime, in the default time zone if it has none."""
+    dt = convert_datestr(datestr)
+    if dt is not None and timezone.is_naive(dt):
+        dt = timezone.make_aware(dt)
+    return dt
+
+
+@ajax_request
+@login_required
+@has_perm('requires_viewer')
+def get_timeseries_by_resolution(request):
+    """Return the time series data of a meter in a time range, aggregated per period.
+
+    The day and month periods are read from the rollups of the meter, the
+    other periods are aggregated from the rollups or readings in the range.
+
+    Expected GET params:
+
+    meter_id: int, unique identifier for the meter.
+    start: str, date of the beginning of the range.
+    end: str, date of the end of the range, excluded.
+    resolution: str, one of raw, hour, day, week, month and year. Defaults to raw.
+    """
+    meter_id = request.GET.get('meter_id', '')
+    start = _aware_datestr(request.GET.get('start'))
+    end = _aware_datestr(request.GET.get('end'))
+    resolution = request.GET.get('resolution', RAW)
+
+    if not meter_id:
+        return {'status': 'error', 'message': 'No meter id specified'}
+    if start is None or end is None:
+        return {'status': 'error', 'message': 'Invalid or missing start or end date'}
+    if resolution not in RESOLUTIONS:
+        return {
+            'status': 'error',
+            'message': 'Invalid resolution, use one of {}'.format(', '.join(RESOLUTIONS))
+        }
+
+    return {
+        'status': 'success',
+        'meter_id': meter_id,
+        'resolution': resolution,
+        'timeseries': get_timeseries_range(int(meter_id), start, end, resolution),
+    }
+
+
 @ajax_request
 @login_required
 @has_perm('can_modify_data')
@@ -157,13 +206,20 @@ def add_timeseries(request):
     except Meter.DoesNotExist:
         return {'status': 'error', 'message': 'Meter ID does not match'}
 
-    for ts_item in ts_data:
-        TimeSeries.objects.create(
-            begin_time=convert_datestr(ts_item.get('begin_time', None)),
-            end_time=convert_datestr(ts_item.get('end_time', None)),
+    time_series = [
+        TimeSeries(
+            begin_time=_aware_datestr(ts_item.get('begin_time', None)),
+            end_time=_aware_datestr(ts_item.get('end_time', None)),
             reading=ts_item.get('reading', None),
             cost=ts_item.get('cost', None),
             meter=meter
         )
+        for ts_item in ts_data
+    ]
+    TimeSeries.objects.bulk_create(time_series)
+
+    begin_times = [ts.begin_time for ts in time_series if ts.begin_time]
+    if begin_times:
+        update_rollups([meter.pk], min(begin_times), max(begin_times))
 
     return {'status': 'success'}
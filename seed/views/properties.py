@@ -10,8 +10,6 @@ import re
 from collections import defaultdict
 from os import path
 
-from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
-from django.forms.models import model_to_dict
 from django.http import JsonResponse
 from rest_framework import status
 from rest_framework.decorators import list_route, detail_route
@@ -32,6 +30,12 @@ from seed.serializers.taxlots import (
     TaxLotViewSerializer, TaxLotStateSerializer, TaxLotSerializer
 )
 from seed.utils.api import api_endpoint_class
+from seed.utils.inventory import (
+    COUNT_EXACT,
+    InventoryRowSerializer,
+    get_state_values,
+    paginate_views,
+)
 from seed.utils.time import convert_to_js_timestamp
 
 # Global toggle that controls whether or not to display the raw extra
@@ -124,6 +128,8 @@ class PropertyViewSet(GenericViewSet):
 
         page = request.query_params.get('page', 1)
         per_page = request.query_params.get('per_page', 1)
+        cursor = request.query_params.get('cursor')
+        count = request.query_params.get('count', COUNT_EXACT)
         org_id = request.query_params.get('organization_id', None)
         cycle_id = request.query_params.get('cycle')
         if not org_id:
@@ -146,31 +152,14 @@ class PropertyViewSet(GenericViewSet):
                     'results': []
                 })
 
-        property_views_list = PropertyView.objects.select_related('property', 'state', 'cycle') \
+        property_views_list = PropertyView.objects.select_related('property') \
             .filter(property__organization_id=request.query_params['organization_id'], cycle=cycle)
 
-        paginator = Paginator(property_views_list, per_page)
-
-        try:
-            property_views = paginator.page(page)
-            page = int(page)
-        except PageNotAnInteger:
-            property_views = paginator.page(1)
-            page = 1
-        except EmptyPage:
-            property_views = paginator.page(paginator.num_pages)
-            page = paginator.num_pages
+        property_views, pagination = paginate_views(property_views_list, page, per_page,
+                                                    cursor=cursor, count=count)
 
         response = {
-            'pagination': {
-                'page': page,
-                'start': paginator.page(page).start_index(),
-                'end': paginator.page(page).end_index(),
-                'num_pages': paginator.num_pages,
-                'has_next': paginator.page(page).has_next(),
-                'has_previous': paginator.page(page).has_previous(),
-                'total': paginator.count
-            },
+            'pagination': pagination,
             'results': []
         }
 
@@ -182,44 +171,31 @@ class PropertyViewSet(GenericViewSet):
         taxlot_view_ids = [j.taxlot_view_id for j in joins]
 
         # Get all tax lot views that are related
-        taxlot_views = TaxLotView.objects.select_related('taxlot', 'state', 'cycle').filter(
-            pk__in=taxlot_view_ids)
-
-        # Map tax lot view id to tax lot view's state data, so we can reference these easily and save some queries.
-        db_columns = Column.retrieve_db_fields()
-        for lot in taxlot_views:
-            # Each object in the response is built from the state data, with related data added on.
-            l = model_to_dict(lot.state, exclude=['extra_data'])
-
-            for extra_data_field, extra_data_value in lot.state.extra_data.items():
-                if extra_data_field == 'id':
-                    extra_data_field += '_extra'
-
-                # Check if the extra data field is already a database field
-                while extra_data_field in db_columns:
-                    extra_data_field += '_extra'
-
+        taxlot_views = TaxLotView.objects.filter(pk__in=taxlot_view_ids).only(
+            'id', 'taxlot', 'state')
+
+        # Only the requested columns of the related tax lots are loaded, while the properties
+        # are projected on the requested columns when there are any.
+        db_columns = set(Column.retrieve_db_fields())
+        taxlot_states = get_state_values(TaxLotState, [t.state_id for t in taxlot_views],
+                                         columns=columns, db_columns=db_columns)
+        property_states = get_state_values(PropertyState, [p.state_id for p in property_views],
+                                           columns=columns or None, db_columns=db_columns)
+
+        serializer = InventoryRowSerializer(db_columns,
+                                            Column.retrieve_extra_data_rename_map(org_id))
+        columns = set(columns)
+
+        # Map tax lot view id to tax lot view's state data, so we can reference these easily and
+        # save some queries. Only return the requested rows. speeds up the json string time
         taxlot_map = {}
         for taxlot_view in taxlot_views:
-            l = model_to_dict(taxlot_view.state, exclude=['extra_data'])
-            l['taxlot_state_id'] = taxlot_view.state.id
-
-            # Add extra data fields right to this object.
-            for extra_data_field, extra_data_value in taxlot_view.state.extra_data.items():
-                if extra_data_field == 'id':
-                    extra_data_field += '_extra'
-
-                while extra_data_field in db_columns:
-                    extra_data_field += '_extra'
-
-                l[extra_data_field] = extra_data_value
+            l = serializer.serialize(taxlot_states[taxlot_view.state_id], columns=columns,
+                                     extra_fields={'taxlot_state_id': taxlot_view.state_id})
 
-            # Only return the requested rows. speeds up the json string time
-            l = {key: value for key, value in l.items() if key in columns}
-
-            taxlot_map[taxlot_view.pk] = l
             # Replace taxlot_view id with taxlot id
-            taxlot_map[taxlot_view.pk]['id'] = taxlot_view.taxlot.id
+            l['id'] = taxlot_view.taxlot_id
+            taxlot_map[taxlot_view.pk] = l
 
         # A mapping of property view pk to a list of taxlot state info for a taxlot view
         join_map = {}
@@ -236,21 +212,12 @@ class PropertyViewSet(GenericViewSet):
 
         for prop in property_views:
             # Each object in the response is built from the state data, with related data added on.
-            p = model_to_dict(prop.state, exclude=['extra_data'])
-
-            for extra_data_field, extra_data_value in prop.state.extra_data.items():
-                if extra_data_field == 'id':
-                    extra_data_field += '_extra'
-
-                while extra_data_field in db_columns:
-                    extra_data_field += '_extra'
-
-                p[extra_data_field] = extra_data_value
+            p = serializer.serialize(property_states[prop.state_id])
 
             # Use property_id instead of default (state_id)
             p['id'] = prop.property_id
 
-            p['property_state_id'] = prop.state.id
+            p['property_state_id'] = prop.state_id
             p['property_view_id'] = prop.id
 
             p['campus'] = prop.property.campus
@@ -288,6 +255,15 @@ class PropertyViewSet(GenericViewSet):
               description: The number of items per page to return
               required: false
               paramType: query
+            - name: cursor
+              description: The view id of the last item of the previous page, returned as
+                           next_cursor in the pagination. Used instead of page to go to the next page
+              required: false
+              paramType: query
+            - name: count
+              description: Either exact (default) or approximate to estimate the total number of items
+              required: false
+              paramType: query
         """
         return self._get_filtered_results(request, columns=[])
 
@@ -318,6 +294,15 @@ class PropertyViewSet(GenericViewSet):
               description: The number of items per page to return
               required: false
               paramType: query
+            - name: cursor
+              description: The view id of the last item of the previous page, returned as
+                           next_cursor in the pagination. Used instead of page to go to the next page
+              required: false
+              paramType: query
+            - name: count
+              description: Either exact (default) or approximate to estimate the total number of items
+              required: false
+              paramType: query
             - name: column filter data
               description: Object containing columns to filter on, should be a JSON object with a single key "columns"
                            whose value is a list of strings, each representing a column name
@@ -714,6 +699,8 @@ class TaxLotViewSet(GenericViewSet):
     def _get_filtered_results(self, request, columns):
         page = request.query_params.get('page', 1)
         per_page = request.query_params.get('per_page', 1)
+        cursor = request.query_params.get('cursor')
+        count = request.query_params.get('count', COUNT_EXACT)
         org_id = request.query_params.get('organization_id', None)
         cycle_id = request.query_params.get('cycle')
         if not org_id:
@@ -737,79 +724,58 @@ class TaxLotViewSet(GenericViewSet):
                     'results': []
                 })
 
-        taxlot_views_list = TaxLotView.objects.select_related('taxlot', 'state', 'cycle') \
+        taxlot_views_list = TaxLotView.objects \
             .filter(taxlot__organization_id=request.query_params['organization_id'], cycle=cycle)
 
-        paginator = Paginator(taxlot_views_list, per_page)
-
-        try:
-            taxlot_views = paginator.page(page)
-            page = int(page)
-        except PageNotAnInteger:
-            taxlot_views = paginator.page(1)
-            page = 1
-        except EmptyPage:
-            taxlot_views = paginator.page(paginator.num_pages)
-            page = paginator.num_pages
+        taxlot_views, pagination = paginate_views(taxlot_views_list, page, per_page,
+                                                  cursor=cursor, count=count)
 
         response = {
-            'pagination': {
-                'page': page,
-                'start': paginator.page(page).start_index(),
-                'end': paginator.page(page).end_index(),
-                'num_pages': paginator.num_pages,
-                'has_next': paginator.page(page).has_next(),
-                'has_previous': paginator.page(page).has_previous(),
-                'total': paginator.count
-            },
+            'pagination': pagination,
             'results': []
         }
 
         # Ids of taxlotviews to look up in m2m
         lot_ids = [l.pk for l in taxlot_views]
-        joins = TaxLotProperty.objects.filter(taxlot_view_id__in=lot_ids).select_related(
-            'property_view')
+        joins = TaxLotProperty.objects.filter(taxlot_view_id__in=lot_ids)
 
         # Get all ids of properties on these joins
         property_view_ids = [j.property_view_id for j in joins]
 
         # Get all property views that are related
-        property_views = PropertyView.objects.select_related('property', 'state', 'cycle').filter(
+        property_views = PropertyView.objects.select_related('property').filter(
             pk__in=property_view_ids)
 
-        db_columns = Column.retrieve_db_fields()
+        # Only the requested columns of the related properties are loaded, while the tax lots
+        # are projected on the requested columns when there are any.
+        db_columns = set(Column.retrieve_db_fields())
+        property_states = get_state_values(PropertyState, [p.state_id for p in property_views],
+                                           columns=columns, db_columns=db_columns)
+        taxlot_states = get_state_values(TaxLotState, [t.state_id for t in taxlot_views],
+                                         columns=columns or None, db_columns=db_columns)
+
+        serializer = InventoryRowSerializer(db_columns,
+                                            Column.retrieve_extra_data_rename_map(org_id))
+        columns = set(columns)
 
         # Map property view id to property view's state data, so we can reference these easily and
-        # save some queries.
+        # save some queries. Only return the requested rows. speeds up the json string time
         property_map = {}
         for property_view in property_views:
-            p = model_to_dict(property_view.state, exclude=['extra_data'])
-            p['property_state_id'] = property_view.state.id
-            p['campus'] = property_view.property.campus
+            p = serializer.serialize(property_states[property_view.state_id], columns=columns,
+                                     extra_fields={'property_state_id': property_view.state_id,
+                                                   'campus': property_view.property.campus})
 
-            # Add extra data fields right to this object.
-            for extra_data_field, extra_data_value in property_view.state.extra_data.items():
-                if extra_data_field == 'id':
-                    extra_data_field += '_extra'
-
-                while extra_data_field in db_columns:
-                    extra_data_field += '_extra'
-
-                p[extra_data_field] = extra_data_value
-
-            # Only return the requested rows. speeds up the json string time
-            p = {key: value for key, value in p.items() if key in columns}
-
-            property_map[property_view.pk] = p
             # Replace property_view id with property id
-            property_map[property_view.pk]['id'] = property_view.property.id
+            p['id'] = property_view.property_id
+            property_map[property_view.pk] = p
 
         # A mapping of taxlot view pk to a list of property state info for a property view
         join_map = {}
-        # Get whole taxlotstate table:
+        # Get the jurisdiction tax lot ids of all the tax lots of the related properties
         tuplePropToJurisdictionTL = tuple(
-            TaxLotProperty.objects.values_list('property_view_id',
-                                               'taxlot_view__state__jurisdiction_tax_lot_id'))
+            TaxLotProperty.objects.filter(property_view_id__in=property_view_ids).values_list(
+                'property_view_id', 'taxlot_view__state__jurisdiction_tax_lot_id'))
 
         # create a mapping that defaults to an empty list
         propToJurisdictionTL = defaultdict(list)
@@ -842,23 +808,12 @@ class TaxLotViewSet(GenericViewSet):
 
         for lot in taxlot_views:
             # Each object in the response is built from the state data, with related data added on.
-            l = model_to_dict(lot.state, exclude=['extra_data'])
-
-            for extra_data_field, extra_data_value in lot.state.extra_data.items():
-                if extra_data_field == 'id':
-                    extra_data_field += '_extra'
-
-                # Check if the extra data field is already a database field
-                while extra_data_field in db_columns:
-                    extra_data_field += '_extra'
-
-                # save to dictionary
-                l[extra_data_field] = extra_data_value
+            l = serializer.serialize(taxlot_states[lot.state_id])
 
             # Use taxlot_id instead of default (state_id)
             l['id'] = lot.taxlot_id
 
-            l['taxlot_state_id'] = lot.state.id
+            l['taxlot_state_id'] = lot.state_id
             l['taxlot_view_id'] = lot.id
 
             # All the related property states.
@@ -894,6 +849,15 @@ class TaxLotViewSet(GenericViewSet):
               description: The number of items per page to return
               required: false
               paramType: query
+            - name: cursor
+              description: The view id of the last item of the previous page, returned as
+                           next_cursor in the pagination. Used instead of page to go to the next page
+              required: false
+              paramType: query
+            - name: count
+              description: Either exact (default) or approximate to estimate the total number of items
+              required: false
+              paramType: query
         """
         return self._get_filtered_results(request, columns=[])
 
@@ -924,6 +888,15 @@ class TaxLotViewSet(GenericViewSet):
               description: The number of items per page to return
               required: false
               paramType: query
+            - name: cursor
+              description: The view id of the last item of the previous page, returned as
+                           next_cursor in the pagination. Used instead of page to go to the next page
+              required: false
+              paramType: query
+            - name: count
+              description: Either exact (default) or approximate to estimate the total number of items
+              required: false
+              paramType: query
             - name: column filter data
               description: Object containing columns to filter on, should be a JSON object with a single key "columns"
                            whose value is a list of strings, each representing a column name